@@ -0,0 +1,107 @@
+import re
+import time
+
+
+RE_RATE: re.Pattern[str] = re.compile(r'^\s*([0-9]+(?:\.[0-9]*)?)\s*([kKmMgG]?)\s*$')
+RATE_UNITS: {} = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+RE_TIME_OF_DAY: re.Pattern[str] = re.compile(r'^([0-9]{1,2}):([0-9]{2})$')
+MINUTES_PER_DAY: int = 24 * 60
+
+
+def parse_rate(rate: int | float | str | None) -> int | None:
+    """
+    Bytes per second from a number or a string like yt-dlp's --limit-rate, e.g. "500K" or "2.5M".
+    None means unlimited.
+    """
+    if rate is None:
+        return None
+    if isinstance(rate, (int, float)):
+        return int(rate) if rate > 0 else None
+    match: re.Match | None = RE_RATE.match(rate)
+    if match is None:
+        raise ValueError('invalid rate: ' + rate)
+    return int(float(match.group(1)) * RATE_UNITS[match.group(2).lower()]) or None
+
+
+def parse_time_of_day(time_of_day: str) -> int:
+    """
+    Minutes since midnight from "HH:MM".
+    """
+    match: re.Match | None = RE_TIME_OF_DAY.match(time_of_day)
+    if match is None or int(match.group(1)) > 24 or int(match.group(2)) > 59:
+        raise ValueError('invalid time of day: ' + time_of_day)
+    return (int(match.group(1)) * 60 + int(match.group(2))) % MINUTES_PER_DAY
+
+
+class BandwidthWindow:
+    """
+    A time of day with its own limits, "to" can be before "from" for a window over midnight.
+    Parameters:
+    * settings: {"from": "HH:MM", "to": "HH:MM", "rate_limit": ..., "max_concurrent_downloads": ...},
+      missing limits are taken from the scheduler
+    """
+    def __init__(self, settings: dict):
+        self.start: int = parse_time_of_day(settings['from'])
+        self.end: int = parse_time_of_day(settings['to'])
+        self.has_rate_limit: bool = 'rate_limit' in settings
+        self.rate_limit: int | None = parse_rate(settings.get('rate_limit'))
+        self.max_concurrent_downloads: int | None = settings.get('max_concurrent_downloads')
+
+    def contains(self, minute_of_day: int) -> bool:
+        if self.start <= self.end:
+            return self.start <= minute_of_day < self.end
+        return minute_of_day >= self.start or minute_of_day < self.end
+
+
+class BandwidthScheduler:
+    """
+    The total download rate and the number of parallel downloads, depending on the time of day.
+    The first window that contains the current time applies, outside of all windows the defaults do.
+    Parameters:
+    * settings: the "bandwidth" section of the configuration, {"rate_limit": ..., "windows": [...]}
+    * max_concurrent_downloads: the default number of parallel downloads
+    """
+    def __init__(self, settings: dict, max_concurrent_downloads: int):
+        self.default_rate_limit: int | None = parse_rate(settings.get('rate_limit'))
+        self.default_max_concurrent_downloads: int = max_concurrent_downloads
+        self.windows: [BandwidthWindow] = [BandwidthWindow(window) for window in settings.get('windows') or []]
+
+    def current_window(self) -> BandwidthWindow | None:
+        now: time.struct_time = time.localtime()
+        minute_of_day: int = now.tm_hour * 60 + now.tm_min
+        for window in self.windows:
+            if window.contains(minute_of_day):
+                return window
+        return None
+
+    def rate_limit(self) -> int | None:
+        """
+        The current total rate in bytes per second, None if unlimited.
+        """
+        window: BandwidthWindow | None = self.current_window()
+        if window is not None and window.has_rate_limit:
+            return window.rate_limit
+        return self.default_rate_limit
+
+    def max_concurrent_downloads(self) -> int:
+        window: BandwidthWindow | None = self.current_window()
+        if window is not None and window.max_concurrent_downloads is not None:
+            return max(1, window.max_concurrent_downloads)
+        return self.default_max_concurrent_downloads
+
+    def max_workers(self) -> int:
+        """
+        The number of downloader threads needed for the maximal number of parallel downloads in any window.
+        """
+        return max([self.default_max_concurrent_downloads] + [window.max_concurrent_downloads
+                                                               for window in self.windows
+                                                               if window.max_concurrent_downloads is not None])
+
+    @staticmethod
+    def share(rate_limit: int | None, transfers: int) -> int | None:
+        """
+        The rate limit of every single one of transfers.
+        """
+        if rate_limit is None or transfers <= 1:
+            return rate_limit
+        return max(1, rate_limit // transfers)
@@ -0,0 +1,371 @@
+#!/usr/bin/python
+
+"""
+Offline benchmark of the download engine, no network access needed.
+YouTube / yt-dlp are replaced by FakeYoutubeDL, which writes small files and emits progress events like yt-dlp.
+The results are written as JSON, so runs can be compared.
+"""
+
+import json
+import os
+import platform
+import queue
+import random
+import statistics
+import string
+import sys
+import tempfile
+import threading
+import time
+from argparse import ArgumentParser, Namespace
+from typing import Callable
+
+from download_engine import DL_STATUS_DONE, DL_STATUS_ERROR, Download, DownloadEngine, EngineListener, YOUTUBE_PREFIX
+
+
+BENCHMARK_FORMAT: str = 'BENCH'
+BENCHMARK_TARGET_DIR: str = 'bench_target'
+BENCHMARK_TEMP_DIR: str = 'bench_temp'
+BENCHMARK_ARCHIVE: str = 'downloaded.list'
+VIDEO_ID_CHARACTERS: str = string.ascii_letters + string.digits + '-_'
+
+
+def random_video_id(rng: random.Random) -> str:
+    return ''.join(rng.choice(VIDEO_ID_CHARACTERS) for _ in range(11))
+
+
+def percentiles(values: [float]) -> dict:
+    """
+    Summary of durations in seconds, reported in milliseconds.
+    """
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+
+    def at(fraction: float) -> float:
+        return round(values[min(len(values) - 1, int(fraction * len(values)))] * 1000, 4)
+
+    return {'count': len(values), 'mean_ms': round(statistics.fmean(values) * 1000, 4),
+            'p50_ms': at(0.5), 'p90_ms': at(0.9), 'p99_ms': at(0.99), 'max_ms': round(values[-1] * 1000, 4)}
+
+
+class FakeYoutubeDL:
+    """
+    Stand-in for yt_dlp.YoutubeDL with the methods the engine uses.
+    A "download" emits chunk_count progress events chunk_delay seconds apart, then writes the video and its
+    description to the target dir, named like the output template of yt_dl_gui_SAMPLE.json does.
+    Parameters:
+    * params: the yt-dlp parameters built by the engine
+    * file_size: the simulated size of every video in bytes
+    * chunk_count: number of progress events per video
+    * chunk_delay: seconds between two progress events
+    """
+    def __init__(self, params: dict, file_size: int = 10 * 1024 * 1024, chunk_count: int = 10, chunk_delay: float = 0.0):
+        self.params: dict = params
+        self.file_size: int = file_size
+        self.chunk_count: int = max(1, chunk_count)
+        self.chunk_delay: float = chunk_delay
+        self.progress_hooks: [Callable[[dict], None]] = []
+        self.postprocessor_hooks: [Callable[[dict], None]] = []
+        self._download_retcode: int = 0
+
+    def add_progress_hook(self, hook: Callable[[dict], None]):
+        self.progress_hooks.append(hook)
+
+    def add_postprocessor_hook(self, hook: Callable[[dict], None]):
+        self.postprocessor_hooks.append(hook)
+
+    def extract_info(self, url: str, download: bool = True) -> dict:
+        video_id: str = url[-11:]
+        info: dict = {'id': video_id, 'title': 'Benchmark video ' + video_id, 'webpage_url': url,
+                      'upload_date': '20240101', 'uploader_id': '@bench', 'resolution': '1280x720',
+                      'ext': 'mp4', 'format_id': '136+140', 'filesize': self.file_size}
+        if download:
+            self.process_ie_result(info, download=True)
+        return info
+
+    def sanitize_info(self, info: dict, remove_private_keys: bool = False) -> dict:
+        return dict(info)
+
+    def process_ie_result(self, info: dict, download: bool = True) -> dict:
+        if download:
+            self._download(info)
+        return info
+
+    def download(self, url_list) -> int:
+        for url in [url_list] if isinstance(url_list, str) else url_list:
+            self.extract_info(url, download=True)
+        return self._download_retcode
+
+    def close(self):
+        pass
+
+    def _download(self, info: dict):
+        home: str = self.params['paths']['home']
+        file_base: str = home + os.sep + '%s %s - %s  %s %s' % (info['upload_date'], info['uploader_id'],
+                                                                info['title'].replace(' ', '_'), info['resolution'], info['id'])
+        file_name: str = file_base + '.' + info['ext']
+        started: float = time.monotonic()
+        for chunk in range(1, self.chunk_count + 1):
+            if self.chunk_delay > 0:
+                time.sleep(self.chunk_delay)
+            downloaded: int = self.file_size * chunk // self.chunk_count
+            elapsed: float = max(time.monotonic() - started, 1e-6)
+            speed: float = downloaded / elapsed
+            progress: dict = {'status': 'downloading' if chunk < self.chunk_count else 'finished',
+                              'downloaded_bytes': downloaded, 'total_bytes': self.file_size,
+                              'elapsed': elapsed, 'speed': speed,
+                              'eta': int((self.file_size - downloaded) / speed) if speed else None,
+                              'filename': file_name, 'info_dict': info,
+                              '_default_template': '%5.1f%% of %10.2fMiB at %10.2fMiB/s' % (
+                                  100 * downloaded / self.file_size, self.file_size / 1048576, speed / 1048576)}
+            for hook in self.progress_hooks:
+                hook(progress)
+        with open(file_name, 'wb') as out_file:
+            out_file.write(b'\0' * 1024)
+        with open(file_base + '.description', 'w') as out_file:
+            out_file.write('Benchmark')
+        for hook in self.postprocessor_hooks:
+            hook({'status': 'finished', 'postprocessor': 'MoveFiles', 'info_dict': dict(info, filepath=file_name)})
+
+
+class LatencyListener(EngineListener):
+    """
+    Applies the notifications of the engine every interval seconds in its own thread, like the Tk main loop
+    of the GUI does, and records how long every notification waited until it was applied.
+    """
+    def __init__(self, interval: float):
+        self.interval: float = interval
+        self.events: queue.SimpleQueue = queue.SimpleQueue()
+        self.row_latencies: [float] = []
+        self.status_latencies: [float] = []
+        self.status_dirty_since: float | None = None
+        self.finished: set[str] = set()
+        self.finished_event: threading.Event = threading.Event()
+        self.expected: int = 0
+        self.do_stop: bool = False
+        self.thread: threading.Thread = threading.Thread(target=self._apply_loop, name='Bench-UI', daemon=True)
+
+    def download_changed(self, dl: Download, error_msg: str | None = None):
+        self.events.put((time.monotonic(), dl.url, dl.status))
+
+    def status_changed(self):
+        if self.status_dirty_since is None:
+            self.status_dirty_since = time.monotonic()
+
+    def _apply_loop(self):
+        while not self.do_stop:
+            time.sleep(self.interval)
+            now: float = time.monotonic()
+            while True:
+                try:
+                    (posted, url, status) = self.events.get_nowait()
+                except queue.Empty:
+                    break
+                self.row_latencies.append(now - posted)
+                if status in (DL_STATUS_DONE, DL_STATUS_ERROR):
+                    self.finished.add(url)
+            dirty_since: float | None = self.status_dirty_since
+            if dirty_since is not None:
+                self.status_dirty_since = None
+                self.status_latencies.append(now - dirty_since)
+            if len(self.finished) >= self.expected:
+                self.finished_event.set()
+
+
+def create_engine(work_dir: str, args: Namespace, listener: EngineListener, fake_factory: Callable[[dict], FakeYoutubeDL]) -> DownloadEngine:
+    settings: dict = {
+        'download_archive': BENCHMARK_ARCHIVE,
+        'video_formats': [[BENCHMARK_FORMAT, 'bestvideo+bestaudio/best']],
+        'target_dirs': [BENCHMARK_TARGET_DIR],
+        'temp_dir': BENCHMARK_TEMP_DIR,
+        'max_concurrent_downloads': args.workers,
+        'queue_journal': 'bench_queue.jsonl' if args.journal else None,
+        # paced like the GUI, but without the state of its last run
+        'pacing': {'state_file': None} if args.pause else None,
+        'prefetch_count': args.prefetch_count,
+        'prefetch_workers': args.prefetch_workers,
+        'yt_dl_params': {},
+        'postprocessing': {'underscores_to_spaces': True, 'add_newlines_to_description': True}
+    }
+    engine: DownloadEngine = DownloadEngine(settings, work_dir + os.sep + 'bench.json', listener,
+                                            youtube_dl_factory=fake_factory)
+    return engine
+
+
+def bench_queue(work_dir: str, args: Namespace) -> dict:
+    """
+    Processes args.items downloads and measures the throughput, the overhead per download and the UI latency.
+    """
+    rng: random.Random = random.Random(args.seed)
+    listener: LatencyListener = LatencyListener(args.ui_interval_ms / 1000)
+    listener.expected = args.items
+    engine: DownloadEngine = create_engine(
+        work_dir, args, listener,
+        lambda params: FakeYoutubeDL(params, args.file_size, args.chunks, args.chunk_delay_ms / 1000))
+    downloads: [Download] = [Download('watch?v=' + random_video_id(rng), BENCHMARK_TARGET_DIR, BENCHMARK_FORMAT)
+                             for _ in range(args.items)]
+
+    enqueue_started: float = time.monotonic()
+    engine.enqueue(downloads)
+    enqueue_time: float = time.monotonic() - enqueue_started
+
+    listener.thread.start()
+    started: float = time.monotonic()
+    engine.start()
+    finished: bool = listener.finished_event.wait(args.timeout)
+    elapsed: float = time.monotonic() - started
+    listener.do_stop = True
+    engine.stop()
+    if engine.journal is not None:
+        engine.journal.close()
+
+    done: int = len([dl for dl in downloads if dl.status == DL_STATUS_DONE])
+    # the time a download would take on its own, everything above it is overhead of the engine
+    simulated_time: float = args.chunks * args.chunk_delay_ms / 1000
+    return {
+        'items': args.items,
+        'done': done,
+        'finished_in_time': finished,
+        'enqueue_ms': round(enqueue_time * 1000, 3),
+        'elapsed_s': round(elapsed, 4),
+        'throughput_per_s': round(done / elapsed, 3) if elapsed > 0 else None,
+        'overhead_per_item_ms': round((elapsed * args.workers / max(done, 1) - simulated_time) * 1000, 3),
+        'ui_row_update_latency': percentiles(listener.row_latencies),
+        'ui_status_update_latency': percentiles(listener.status_latencies),
+    }
+
+
+def bench_can_download(work_dir: str, args: Namespace) -> dict:
+    """
+    Measures can_download() against an archive with args.archive_entries IDs
+    and a target dir with args.dir_files files.
+    """
+    rng: random.Random = random.Random(args.seed + 1)
+    engine: DownloadEngine = create_engine(work_dir, args, EngineListener(), lambda params: FakeYoutubeDL(params))
+    target_dir: str = BENCHMARK_TARGET_DIR + '_check'
+    engine.target_dirs.append(target_dir)
+    os.makedirs(target_dir, exist_ok=True)
+
+    archived_ids: [str] = [random_video_id(rng) for _ in range(args.archive_entries)]
+    with open(target_dir + os.sep + BENCHMARK_ARCHIVE, 'w') as out_file:
+        out_file.writelines('youtube ' + video_id + '\n' for video_id in archived_ids)
+    file_ids: [str] = [random_video_id(rng) for _ in range(args.dir_files)]
+    for video_id in file_ids:
+        open(target_dir + os.sep + '20240101 @bench - Video  1280x720 ' + video_id + '.mkv', 'w').close()
+
+    def measure(video_ids: [str]) -> [float]:
+        durations: [float] = []
+        for video_id in video_ids:
+            check_started: float = time.perf_counter()
+            engine.can_download(YOUTUBE_PREFIX + 'watch?v=' + video_id, target_dir, BENCHMARK_FORMAT)
+            durations.append(time.perf_counter() - check_started)
+        return durations
+
+    unknown_ids: [str] = [random_video_id(rng) for _ in range(args.checks)]
+    cold: [float] = measure(unknown_ids[:1])
+    return {
+        'archive_entries': args.archive_entries,
+        'dir_files': args.dir_files,
+        'cold_ms': round(cold[0] * 1000, 3),
+        'miss': percentiles(measure(unknown_ids)),
+        'archive_hit': percentiles(measure(rng.sample(archived_ids, min(args.checks, len(archived_ids))))),
+        'file_hit': percentiles(measure(rng.sample(file_ids, min(args.checks, len(file_ids))))),
+    }
+
+
+def bench_table(args: Namespace) -> dict:
+    """
+    Measures the DownloadTable with args.table_rows rows, needs a display.
+    """
+    try:
+        from tkinter import Frame, TclError, Tk
+        from yt_dl_gui import DownloadTable, TABLE_HEADERS
+    except ImportError as e:
+        return {'skipped': repr(e)}
+    try:
+        root = Tk()
+    except TclError as e:
+        return {'skipped': 'no display: ' + str(e)}
+    rng: random.Random = random.Random(args.seed + 2)
+    results: dict = {}
+    try:
+        for row_count in args.table_rows:
+            frame: Frame = Frame(root)
+            frame.pack()
+            table: DownloadTable = DownloadTable(frame, None, TABLE_HEADERS)
+            downloads: [Download] = [Download('watch?v=' + random_video_id(rng), BENCHMARK_TARGET_DIR, BENCHMARK_FORMAT)
+                                     for _ in range(row_count)]
+            timings: dict = {}
+            phase_started: float = time.perf_counter()
+            for dl in downloads:
+                table.add_row(dl)
+            root.update()
+            timings['add_ms'] = time.perf_counter() - phase_started
+            phase_started = time.perf_counter()
+            for dl in downloads:
+                dl.status = DL_STATUS_DONE
+                dl.title = 'Benchmark video'
+                table.update_row(dl)
+            root.update()
+            timings['update_ms'] = time.perf_counter() - phase_started
+            phase_started = time.perf_counter()
+            for dl in downloads:
+                table.remove_row(dl)
+            root.update()
+            timings['remove_ms'] = time.perf_counter() - phase_started
+            results[str(row_count)] = {key: round(value * 1000, 3) for key, value in timings.items()}
+            frame.destroy()
+    finally:
+        root.destroy()
+    return results
+
+
+def main():
+    parser: ArgumentParser = ArgumentParser(description='Offline benchmark of the yt-dl GUI download engine')
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help='JSON file for the results, - for stdout')
+    parser.add_argument('--items', type=int, default=500, help='Number of downloads to process')
+    parser.add_argument('-w', '--workers', type=int, default=2, help='Number of parallel downloads')
+    parser.add_argument('--prefetch-count', type=int, default=5)
+    parser.add_argument('--prefetch-workers', type=int, default=2)
+    parser.add_argument('--journal', action='store_true', help='Journal the queue, like the GUI does by default')
+    parser.add_argument('--pause', action='store_true', help='Pace the start of the downloads, like the GUI does by default')
+    parser.add_argument('--file-size', type=int, default=10 * 1024 * 1024, help='Simulated size of a video in bytes')
+    parser.add_argument('--chunks', type=int, default=20, help='Progress events per video')
+    parser.add_argument('--chunk-delay-ms', type=float, default=1.0, help='Delay between two progress events')
+    parser.add_argument('--ui-interval-ms', type=float, default=100, help='Update interval of the simulated UI')
+    parser.add_argument('--archive-entries', type=int, default=100000)
+    parser.add_argument('--dir-files', type=int, default=10000)
+    parser.add_argument('--checks', type=int, default=1000, help='Number of can_download() calls per case')
+    parser.add_argument('--table-rows', type=int, nargs='*', default=[1000, 10000])
+    parser.add_argument('--timeout', type=float, default=600, help='Seconds to wait for the queue')
+    parser.add_argument('--seed', type=int, default=1)
+    args: Namespace = parser.parse_args()
+
+    results: dict = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'parameters': vars(args),
+    }
+    cwd: str = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='yt_dl_gui_bench_') as work_dir:
+        # the engine works with paths relative to the current directory
+        os.chdir(work_dir)
+        try:
+            results['queue'] = bench_queue(work_dir, args)
+            results['can_download'] = bench_can_download(work_dir, args)
+        finally:
+            os.chdir(cwd)
+    results['download_table'] = bench_table(args)
+
+    json_string: str = json.dumps(obj=results, indent=4, sort_keys=False) + '\n'
+    if args.output != '-':
+        with open(args.output, 'w') as out_file:
+            out_file.write(json_string)
+    else:
+        print(json_string, end='')
+
+
+if __name__ == '__main__':
+    main()
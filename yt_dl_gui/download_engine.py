@@ -0,0 +1,1380 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from threading import Thread
+from typing import Any, Callable
+
+from bandwidth import BandwidthScheduler
+from download_history import DownloadHistory
+from download_index import ArchiveIndex, DirectoryIndex
+from download_process import ERROR_CLASS_CANCELLED, ERROR_CLASS_CRASHED, ERROR_CLASS_TIMEOUT, DownloadProcess, WorkerError
+# the queue and its elements were defined here before, they are still imported from here
+from download_queue import (ALL_DL_STATUS_VALUES, DL_STATUS_DONE, DL_STATUS_ERROR, DL_STATUS_POSTPROCESSING,
+                            DL_STATUS_RUNNING, DL_STATUS_WAITING, Download, DownloadQueue)
+from info_cache import InfoCache, selected_formats
+from log_pipeline import YtDlpLogger
+from metrics import PHASE_PAUSE, PHASE_POSTPROCESSING, ItemMetrics, MetricsRecorder, error_class
+from partial_downloads import check_partial_files, is_partial_file
+from queue_journal import QueueJournal
+from request_pacer import RequestPacer
+from retry_policy import (ERROR_PERMANENT, ERROR_THROTTLED, RE_FORBIDDEN_ERROR, RE_UNAVAILABLE_VIDEO, RetryPolicy,
+                          classify_error)
+from youtube_dl_pool import PooledYoutubeDL, YoutubeDLPool
+
+
+CONFIG_FILE_NAME: str = 'yt_dl_gui.json'
+
+YOUTUBE_PREFIX: str = 'https://www.youtube.com/'
+# URLs of single videos, the group is the part that is queued (relative to YOUTUBE_PREFIX)
+RE_YOUTUBE_VIDEO_URL: re.Pattern[str] = re.compile(r'^https://(?:www\.)?youtube\.com/((?:watch\?v=|shorts/)[A-Za-z0-9_-]{11})')
+# URLs that are expanded into their videos: playlists and channels
+RE_YOUTUBE_COLLECTION_URL: re.Pattern[str] = re.compile(r'^https://(?:www\.)?youtube\.com/(?:playlist\?|@|channel/|c/|user/)')
+
+INGEST_CHUNK_SIZE: int = 100
+INGEST_CHUNK_PAUSE: float = 0.05  # seconds between two chunks, so a UI can keep up
+INGEST_MAX_NESTING: int = 2  # e.g. channel => tab (videos, shorts, ...) => video
+STATUS_SECTION_INGEST: str = 'ingest'
+STATUS_SECTION_BANDWIDTH: str = 'bandwidth'
+STATUS_SECTION_PACING: str = 'pacing'
+# seconds between two checks if another time window of the bandwidth scheduler applies
+BANDWIDTH_CHECK_INTERVAL: float = 30.0
+
+PREFETCH_PENDING: str = 'pending'
+PREFETCH_DONE: str = 'done'
+# where yt-dlp runs: in the downloader threads, or in a child process per downloader thread
+EXECUTION_MODE_THREAD: str = 'thread'
+EXECUTION_MODE_PROCESS: str = 'process'
+ALL_EXECUTION_MODES: [str] = [EXECUTION_MODE_THREAD, EXECUTION_MODE_PROCESS]
+
+# seconds a download has to be slower than the "throttled_speed" of the pacer before it counts as throttled
+THROTTLE_DETECT_SECONDS: float = 30.0
+
+RE_VIDEO_TITLE: re.Pattern[str] = re.compile('[0-9]{8} (.*) {2}[0-9]*x[0-9]* ')
+
+COLOR_FATAL: str = '\033[1;37;41m'
+COLOR_RESET: str = '\033[0m'
+
+log: logging.Logger = logging.getLogger(__name__)
+# the width of the terminal, determined once, see delimiter()
+_terminal_columns: int | None = None
+
+# yt_dlp is imported on first use, see load_yt_dlp()
+_yt_dlp_module = None
+_yt_dlp_lock: threading.Lock = threading.Lock()
+
+
+def delimiter(title: str | None = None):
+    global _terminal_columns
+    if _terminal_columns is None:
+        try:
+            _terminal_columns = os.get_terminal_size(0).columns
+        except Exception as e:
+            _terminal_columns = 80
+    prefix = '─── ' + title + ' ' if title is not None else ''
+    prefix_len: int = len(prefix)
+    log.info(prefix + ((_terminal_columns - 1 - prefix_len) * '─'))
+
+
+def load_yt_dlp():
+    """
+    Returns the yt_dlp module, importing it on the first call.
+    The import loads hundreds of extractor modules, so it is deferred until it is needed (or warmed up, see
+    DownloadEngine.warm_up()), instead of delaying the start of the program.
+    """
+    global _yt_dlp_module
+    with _yt_dlp_lock:
+        if _yt_dlp_module is None:
+            import yt_dlp
+            _yt_dlp_module = yt_dlp
+        return _yt_dlp_module
+
+
+def read_config() -> (str, dict):
+    """
+    Reads the configuration file next to the program, returns its name and the settings.
+    """
+    config_file: str = os.path.dirname(__file__) + os.sep + CONFIG_FILE_NAME
+    with open(config_file, 'r') as in_file:
+        settings = json.load(in_file)
+    return config_file, settings
+
+
+def collect_output_files(info_dict: dict | None, output_files: set[str]):
+    """
+    Collects the names of all files yt-dlp reports in an info_dict of a postprocessor hook.
+    """
+    if not info_dict:
+        return
+    for key in ('filepath', '_filename', '__infojson_filename'):
+        if info_dict.get(key):
+            output_files.add(info_dict[key])
+    # yt-dlp writes the description straight into the target dir and does not report it anywhere,
+    # its name is the one of the video with another extension (names that don't exist are skipped later on)
+    for key in ('filepath', '_filename'):
+        if info_dict.get(key):
+            output_files.add(os.path.splitext(info_dict[key])[0] + '.description')
+    for old_file, new_file in (info_dict.get('__files_to_move') or {}).items():
+        output_files.add(new_file if new_file else old_file)
+    for entry in (info_dict.get('requested_subtitles') or {}).values():
+        if entry.get('filepath'):
+            output_files.add(entry['filepath'])
+    for entry in info_dict.get('thumbnails') or []:
+        if entry.get('filepath'):
+            output_files.add(entry['filepath'])
+    # the downloaded formats have their own files to move, subtitles etc.
+    for entry in info_dict.get('requested_downloads') or []:
+        collect_output_files(entry, output_files)
+
+
+def parse_urls(text: str) -> [str]:
+    """
+    Splits a pasted or dropped text into the YouTube URLs it contains (separated by whitespace).
+    """
+    return [token for token in text.split() if RE_YOUTUBE_VIDEO_URL.match(token) or RE_YOUTUBE_COLLECTION_URL.match(token)]
+
+
+def is_bulk_input(text: str) -> bool:
+    """
+    True if text contains more than one URL or a playlist / channel URL.
+    """
+    urls: [str] = parse_urls(text)
+    return len(urls) > 1 or any(RE_YOUTUBE_VIDEO_URL.match(url) is None for url in urls)
+
+
+def filesystem_device(path: str) -> int | None:
+    """
+    st_dev of path, or of its nearest existing parent if it does not exist (yet).
+    """
+    path = os.path.abspath(path)
+    while True:
+        try:
+            return os.stat(path).st_dev
+        except OSError:
+            parent: str = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+
+
+def format_file_size(size: int) -> str:
+    for unit in ['B', 'KiB', 'MiB']:
+        if size < 1024:
+            return '%.1f %s' % (size, unit)
+        size /= 1024
+    return '%.2f GiB' % size
+
+
+class EngineListener:
+    """
+    Gets notified about the changes of a DownloadEngine, e.g. to show them in a UI.
+    The methods can be called from any thread, the default implementation does nothing.
+    """
+    def downloads_added(self, downloads: [Download]):
+        pass
+
+    def downloads_removed(self, downloads: [Download]):
+        pass
+
+    def download_changed(self, dl: Download, error_msg: str | None = None):
+        pass
+
+    def download_moved(self, dl: Download, to_top: bool):
+        pass
+
+    def status_changed(self):
+        """
+        The progress texts, the status sections or the idle text have changed, see DownloadEngine.status_snapshot().
+        """
+        pass
+
+
+class DownloadEngine:
+    """
+    The download queue and everything that processes it, independent of any UI:
+    the downloader and prefetch threads, the journal, the file and archive indexes and the postprocessing.
+    Parameters:
+    * settings: the content of the configuration file
+    * config_file: the name of the configuration file, other files are placed next to it
+    * listener: gets notified about all changes
+    * max_concurrent_downloads: overrides the value from the settings
+    * use_journal: False disables the queue journal, e.g. for tests
+    * youtube_dl_factory: creates a YoutubeDL for the given parameters, can be replaced by a stand-in,
+      which has to be picklable in the process execution mode
+    * execution_mode: overrides the value from the settings
+    """
+    def __init__(self, settings: dict, config_file: str,
+                 listener: EngineListener | None = None,
+                 max_concurrent_downloads: int | None = None,
+                 use_journal: bool = True,
+                 youtube_dl_factory: Callable[[dict], Any] | None = None,
+                 execution_mode: str | None = None):
+        self.settings: dict = settings
+        self.config_file: str = config_file
+        self.listener: EngineListener = listener if listener is not None else EngineListener()
+        self.youtube_dl_factory: Callable[[dict], Any] = youtube_dl_factory if youtube_dl_factory is not None \
+            else (lambda params: load_yt_dlp().YoutubeDL(params=params, auto_init=True))
+
+        self.download_archive_filename = self.settings['download_archive']
+        # one index per target dir, created on first use
+        self.archive_indexes: dict[str, ArchiveIndex] = {}
+        self.directory_indexes: dict[str, DirectoryIndex] = {}
+        self.archive_indexes_lock: threading.Lock = threading.Lock()
+
+        self.video_formats: [] = self.settings['video_formats']
+        self.target_dirs: [] = self.settings['target_dirs']
+        self.temp_dir = self.settings['temp_dir']
+        # temp dir per target dir, see temp_dir_for()
+        self.temp_dir_overrides: dict[str, str] = self.settings.get('temp_dirs') or {}
+        self.temp_dirs_by_target: dict[str, str] = {}
+        self.temp_dirs_lock: threading.Lock = threading.Lock()
+        self.max_concurrent_downloads: int = self.settings.get('max_concurrent_downloads', 1)
+        if max_concurrent_downloads is not None:
+            self.max_concurrent_downloads = max_concurrent_downloads
+        self.max_concurrent_downloads = max(1, self.max_concurrent_downloads)
+        # total rate limit and parallel downloads by time of day, unless there is no "bandwidth" section
+        self.bandwidth: BandwidthScheduler | None = None
+        if self.settings.get('bandwidth'):
+            self.bandwidth = BandwidthScheduler(self.settings['bandwidth'], self.max_concurrent_downloads)
+        self.bandwidth_next_check: float = 0.0
+        # the yt-dlp instance (or process) of every download that is transferring data, their rate limits are adjusted together
+        self.active_transfers: dict[Download, PooledYoutubeDL | DownloadProcess] = {}
+        # in the process execution mode, yt-dlp runs in a child process per downloader thread that is killed
+        # after "process_timeout" seconds (if set) or when its download is cancelled
+        self.execution_mode: str = execution_mode or self.settings.get('execution_mode', EXECUTION_MODE_THREAD)
+        if self.execution_mode not in ALL_EXECUTION_MODES:
+            raise ValueError('unknown execution_mode: ' + str(self.execution_mode))
+        self.process_timeout: float | None = self.settings.get('process_timeout')
+        self.download_processes: dict[str, DownloadProcess] = {}  # downloader or prefetch thread name => process
+        self.process_factory: Callable[[dict], Any] | None = youtube_dl_factory
+        # all downloads that are currently processed by one of the worker threads
+        self.active_downloads: set[Download] = set()
+        # latest progress text of every active download, keyed by video_id
+        self.progress_texts: dict[str, str] = {}
+        # shown while no download is running
+        self.status_idle_text: str = ''
+        # additional status texts, e.g. of the bulk URL ingestion
+        self.status_sections: dict[str, str] = {}
+
+        if not os.path.exists(self.temp_dir):
+            os.makedirs(self.temp_dir)
+
+        # the start of the downloads is paced, adapting to the site, unless "pacing" is set to null
+        self.pacer: RequestPacer | None = None
+        pacing_settings: dict | None = self.settings.get('pacing', {})
+        if pacing_settings is not None:
+            self.pacer = RequestPacer(pacing_settings,
+                                      self._settings_file(pacing_settings.get('state_file', 'yt_dl_gui_pacing.json')))
+        # since when an active download is slower than the throttled speed, keyed by video_id, None once reported
+        self.slow_since: dict[str, float | None] = {}
+
+        # failed downloads are tried again later, unless "retry" is set to null
+        self.retry_policy: RetryPolicy | None = None
+        retry_settings: dict | None = self.settings.get('retry', {})
+        if retry_settings is not None:
+            self.retry_policy = RetryPolicy(retry_settings)
+
+        self.download_queue: DownloadQueue = DownloadQueue()
+        # guards download_queue, the status of its elements, active_downloads and the status texts
+        self.queue_lock: threading.Lock = threading.Lock()
+        self.queue_condition: threading.Condition = threading.Condition(self.queue_lock)
+
+        # the queue is journaled, so it survives restarts, unless "queue_journal" is set to null
+        self.journal: QueueJournal | None = None
+        journal_filename: str | None = self.settings.get('queue_journal', 'yt_dl_gui_queue.jsonl')
+        if journal_filename and use_journal:
+            self.journal = QueueJournal(self._settings_file(journal_filename))
+
+        # one record per download with the duration of its phases, unless "metrics_file" and "metrics_prometheus_file" are null
+        self.metrics: MetricsRecorder | None = None
+        metrics_filename: str | None = self._settings_file(self.settings.get('metrics_file'))
+        prometheus_filename: str | None = self._settings_file(self.settings.get('metrics_prometheus_file'))
+        if metrics_filename or prometheus_filename:
+            self.metrics = MetricsRecorder(metrics_filename, prometheus_filename)
+
+        # the extracted metadata is kept on disk for retries, resets and restarts, unless "info_cache" is set to null
+        self.info_cache: InfoCache | None = None
+        info_cache_settings: dict | None = self.settings.get('info_cache', {})
+        if info_cache_settings is not None:
+            self.info_cache = InfoCache(self._settings_file(info_cache_settings.get('dir', 'yt_dl_gui_info_cache')),
+                                        info_cache_settings.get('ttl', 7200),
+                                        int(info_cache_settings.get('max_size_mb', 100) * 1024 * 1024))
+
+        # finished downloads are moved from the queue to the history on disk, unless "history" is set to null
+        self.history: DownloadHistory | None = None
+        # more finished downloads than this are moved to the history automatically, None to only do it on cleanup
+        self.history_keep_done: int | None = None
+        history_settings: dict | None = self.settings.get('history', {})
+        if history_settings is not None:
+            self.history = DownloadHistory(self._settings_file(history_settings.get('file', 'yt_dl_gui_history.db')))
+            self.history_keep_done = history_settings.get('keep_done', 500)
+
+        # initialized YoutubeDL instances are reused for downloads with the same format and target dir
+        self.youtube_dl_pool: YoutubeDLPool = YoutubeDLPool(self.youtube_dl_factory,
+                                                            self.settings.get('youtube_dl_cache_size', 4))
+
+        self.do_stop: bool = False
+
+        # the metadata of the next waiting downloads is extracted in advance
+        self.prefetch_count: int = self.settings.get('prefetch_count', 5)
+        self.prefetch_queue: queue.Queue = queue.Queue()
+        self.prefetchers: [Thread] = [Thread(target=self.process_prefetch_queue, name='Prefetch-' + str(i + 1), daemon=True)
+                                      for i in range(self.settings.get('prefetch_workers', 2))]
+        self.processors: [Thread] = [Thread(target=self.process_queue, name='Downloader-' + str(i + 1), daemon=True)
+                                     for i in range(self._worker_count())]
+        # (download, metrics) that yt-dlp has finished, the renaming etc. is done in separate threads
+        self.postprocessing_queue: queue.Queue = queue.Queue()
+        self.postprocessors: [Thread] = [
+            Thread(target=self.process_postprocessing_queue, name='Postprocessor-' + str(i + 1), daemon=True)
+            for i in range(max(1, self.settings.get('postprocessing_workers', 1)))]
+        self.workers_started: bool = False
+
+        # ensure that "postprocessing" is there and has all entries, so we don't need to check during runtime
+        if 'postprocessing' not in self.settings:
+            self.settings['postprocessing'] = {}
+        postprocessing_settings = self.settings['postprocessing']
+        if 'underscores_to_spaces' not in postprocessing_settings:
+            postprocessing_settings['underscores_to_spaces'] = False
+        if 'remove_at_sign' not in postprocessing_settings:
+            postprocessing_settings['remove_at_sign'] = False
+        if 'add_newlines_to_description' not in postprocessing_settings:
+            postprocessing_settings['add_newlines_to_description'] = False
+        if 'delete_empty_description' not in postprocessing_settings:
+            postprocessing_settings['delete_empty_description'] = False
+        if 'rename_description' not in postprocessing_settings:
+            postprocessing_settings['rename_description'] = False
+        if 'rename_description_suffix' not in postprocessing_settings:
+            postprocessing_settings['rename_description_suffix'] = '.txt'
+        if 'add_tumb' not in postprocessing_settings:
+            postprocessing_settings['add_tumb'] = False
+        if 'subtitles_dots_to_underscores' not in postprocessing_settings:
+            postprocessing_settings['subtitles_dots_to_underscores'] = False
+
+    def _worker_count(self) -> int:
+        if self.bandwidth is not None:
+            return self.bandwidth.max_workers()
+        return self.max_concurrent_downloads
+
+    def _max_active_downloads(self) -> int:
+        if self.bandwidth is not None:
+            return self.bandwidth.max_concurrent_downloads()
+        return self.max_concurrent_downloads
+
+    def _settings_file(self, file_name: str | None) -> str | None:
+        """
+        File names in the settings can be absolute, or relative to the location of the configuration file.
+        """
+        if file_name and not file_name.startswith(os.sep):
+            return os.path.dirname(self.config_file) + os.sep + file_name
+        return file_name or None
+
+    def start(self, start_workers: bool = True):
+        """
+        Restores the queue from the journal, then starts the downloader and prefetch threads.
+        """
+        if self.journal is not None:
+            self._restore_queue()
+            self.journal.start()
+            atexit.register(self.journal.close)
+        self._rebalance_bandwidth()
+        self._show_pacing_status()
+        if start_workers:
+            for processor in self.processors + self.postprocessors + self.prefetchers:
+                processor.start()
+            self.workers_started = True
+            self._schedule_prefetch()
+
+    def warm_up(self, done_callback: Callable[[float], None] | None = None):
+        """
+        Imports yt_dlp in a background thread, so the first download or prefetch does not have to wait for it.
+        done_callback gets the duration of the import in seconds and is called from that thread.
+        """
+        def warm_up_yt_dlp():
+            started: float = time.perf_counter()
+            try:
+                load_yt_dlp()
+            except ImportError as e:
+                log.warning('Could not import yt_dlp: ' + repr(e))
+            if done_callback is not None:
+                done_callback(time.perf_counter() - started)
+
+        Thread(target=warm_up_yt_dlp, name='Warm-up', daemon=True).start()
+
+    def stop(self):
+        with self.queue_condition:
+            self.do_stop = True
+            self.queue_condition.notify_all()
+        # the download processes are daemons, they end with the program, so their downloads are restarted next time
+
+    def cancel_download(self, url: str) -> bool:
+        """
+        Thread-safe: cancels a running download by killing its process, it fails with an error.
+        Only possible in the process execution mode.
+        """
+        with self.queue_lock:
+            dl: Download | None = self.download_queue.find(url)
+            transfer: PooledYoutubeDL | DownloadProcess | None = self.active_transfers.get(dl) if dl is not None else None
+        if not isinstance(transfer, DownloadProcess):
+            return False
+        log.info('Cancelling ' + dl.video_id + '.')
+        transfer.kill()
+        return True
+
+    def _restore_queue(self):
+        """
+        Rebuilds the queue from the journal. Downloads that were running when the program ended are waiting again.
+        """
+        downloads: [Download] = []
+        for entry in self.journal.load():
+            if entry['video_format'] not in [video_format[0] for video_format in self.video_formats]:
+                log.warning('Skipping journaled download with unknown video format: %s %s', entry['url'], entry['video_format'])
+                self.journal.record_remove(entry['url'])
+                continue
+            dl: Download = Download(entry['url'], entry['target_dir'], entry['video_format'])
+            dl.title = entry['title']
+            if entry['status'] in ALL_DL_STATUS_VALUES:
+                dl.status = entry['status']
+            if dl.status == DL_STATUS_RUNNING:
+                self._set_status(dl, DL_STATUS_WAITING)
+            elif dl.status == DL_STATUS_POSTPROCESSING:
+                # yt-dlp was done, only the postprocessing is left
+                self.postprocessing_queue.put((dl, ItemMetrics(dl.url, dl.video_id, dl.target_dir, dl.video_format, None)))
+            dl.queued_at = time.monotonic()
+            downloads.append(dl)
+        with self.queue_lock:
+            downloads = [dl for dl in downloads if self.download_queue.add(dl)]
+        self.listener.downloads_added(downloads)
+
+    def _set_status(self, dl: Download, status: str):
+        """
+        Changes the status of a download and journals it. Callers hold queue_lock where needed.
+        """
+        self.download_queue.set_status(dl, status)
+        if self.journal is not None:
+            self.journal.record_status(dl.url, status)
+
+    def set_idle_text(self, idle_text: str):
+        """
+        Thread-safe: sets the status text that is shown while no download is running.
+        """
+        with self.queue_lock:
+            self.status_idle_text = idle_text
+        self.listener.status_changed()
+
+    def set_status_section(self, section: str, text: str):
+        """
+        Thread-safe: shows text in front of the download progress, an empty text removes it.
+        """
+        with self.queue_lock:
+            if text:
+                self.status_sections[section] = text
+            else:
+                self.status_sections.pop(section, None)
+        self.listener.status_changed()
+
+    def clear_status_section(self, section: str, text: str):
+        """
+        Thread-safe: removes the text of section, unless it has been replaced by another one meanwhile.
+        """
+        with self.queue_lock:
+            if self.status_sections.get(section) != text:
+                return
+            del self.status_sections[section]
+        self.listener.status_changed()
+
+    def status_snapshot(self) -> ([str], [(str, str)], str):
+        """
+        Thread-safe: returns the status section texts, the progress text of every active download
+        as (video_id, text), and the idle text.
+        """
+        with self.queue_lock:
+            return list(self.status_sections.values()), list(self.progress_texts.items()), self.status_idle_text
+
+    def find_download(self, url: str) -> Download | None:
+        with self.queue_lock:
+            return self.download_queue.find(url)
+
+    def move_download(self, url: str, to_top: bool) -> bool:
+        """
+        Thread-safe: moves a download to the top or the bottom of the queue, a waiting one is downloaded next or last.
+        """
+        with self.queue_condition:
+            dl: Download | None = self.download_queue.find(url)
+            if dl is None:
+                return False
+            if to_top:
+                self.download_queue.move_to_top(dl)
+            else:
+                self.download_queue.move_to_bottom(dl)
+            if self.journal is not None:
+                self.journal.record_move(url, to_top)
+            self.queue_condition.notify_all()
+        self.listener.download_moved(dl, to_top)
+        self._schedule_prefetch()
+        return True
+
+    def reset_download(self, url: str) -> bool:
+        """
+        Thread-safe: sets a failed download back to waiting and removes the files it has written to the target dir.
+        Partial files are kept in the temp dir (or moved there), so yt-dlp continues from them, see check_partial_files().
+        """
+        queue_element: Download | None = self.find_download(url)
+        if queue_element is None or queue_element.status != DL_STATUS_ERROR:
+            return False
+        directory_index: DirectoryIndex = self.directory_index(queue_element.target_dir)
+        file_names: list = directory_index.files(queue_element.video_id)
+        if len(file_names) > 0:
+            mtime_before: int | None = directory_index.directory_mtime()
+            for file_name in file_names:
+                if is_partial_file(file_name):
+                    try:
+                        # the temp dir can be on another filesystem, see "temp_dirs"
+                        shutil.move(file_name, self.temp_dir_for(queue_element.target_dir) + os.sep + os.path.basename(file_name))
+                        continue
+                    except OSError as e:
+                        log.warning('Could not move ' + file_name + ' to the temp dir, removing it: ' + repr(e))
+                try:
+                    os.remove(file_name)
+                except OSError as e:
+                    log.warning('Could not remove ' + file_name + ': ' + repr(e))
+            directory_index.remove_files(queue_element.video_id, file_names, mtime_before)
+        with self.queue_condition:
+            queue_element.prefetch_state = None
+            queue_element.attempts = 0
+            queue_element.queued_at = time.monotonic()
+            self._set_status(queue_element, DL_STATUS_WAITING)
+            self.queue_condition.notify()
+        self.listener.download_changed(queue_element)
+        self._schedule_prefetch()
+        return True
+
+    def cleanup_queue(self, keep: int = 0):
+        """
+        Thread-safe: removes the finished downloads from the queue, except for the latest keep ones,
+        and adds them to the history.
+        """
+        dl: Download
+        downloads_to_remove: [Download]
+        with self.queue_lock:
+            if keep > 0:
+                # in the order they were finished
+                downloads_to_remove = self.download_queue.with_status(DL_STATUS_DONE)[:-keep]
+                for dl in downloads_to_remove:
+                    self.download_queue.remove(dl)
+            else:
+                downloads_to_remove = self.download_queue.remove_with_status(DL_STATUS_DONE)
+        if not downloads_to_remove:
+            return
+        if self.history is not None:
+            try:
+                self.history.add([dl.to_dict() for dl in downloads_to_remove])
+            except sqlite3.Error as e:
+                log.warning('Could not add %d download(s) to the history: %s' % (len(downloads_to_remove), repr(e)))
+        if self.journal is not None:
+            for dl in downloads_to_remove:
+                self.journal.record_remove(dl.url)
+        self.listener.downloads_removed(downloads_to_remove)
+
+    def can_download(self, url: str, target_dir: str, video_format: str | None = None) -> bool:
+        """
+        Checks if url can be queued: it has to be a YouTube URL, target_dir and video_format have to be configured,
+        and the video must neither be queued nor exist in target_dir or its archive.
+        """
+        if not url:
+            return False
+        if YOUTUBE_PREFIX not in url or url.index(YOUTUBE_PREFIX) != 0:
+            return False
+        if target_dir not in self.target_dirs:
+            return False
+
+        # check if video_format is in catalog
+        if video_format is not None:
+            matching_video_formats: [[str, str]] = [entry for entry in self.video_formats if entry[0] == video_format]
+            if len(matching_video_formats) != 1:
+                return False
+
+        video_id: str = url[-11:]
+
+        # check if video_id is already in queue
+        with self.queue_lock:
+            if self.download_queue.find_video(video_id) is not None:
+                return False
+
+        if os.path.exists(target_dir) and os.path.isdir(target_dir):
+            # check for existing files
+            if self.directory_index(target_dir).files(video_id):
+                return False
+
+            # check for entry in archive file
+            if self.download_archive_filename and self.archive_index(target_dir).contains(video_id):
+                return False
+        return True
+
+    def archive_index(self, target_dir: str) -> ArchiveIndex:
+        with self.archive_indexes_lock:
+            index: ArchiveIndex | None = self.archive_indexes.get(target_dir)
+            if index is None:
+                index = ArchiveIndex(target_dir + os.sep + self.download_archive_filename)
+                self.archive_indexes[target_dir] = index
+            return index
+
+    def directory_index(self, target_dir: str) -> DirectoryIndex:
+        with self.archive_indexes_lock:
+            index: DirectoryIndex | None = self.directory_indexes.get(target_dir)
+            if index is None:
+                index = DirectoryIndex(target_dir)
+                self.directory_indexes[target_dir] = index
+            return index
+
+    def add_download(self, url: str, target_dir: str, video_format: str) -> Download:
+        """
+        Thread-safe: queues the video of url, which has to be checked with can_download() before.
+        """
+        dl: Download = Download(url[len(YOUTUBE_PREFIX):], target_dir, video_format)
+        self.enqueue([dl])
+        return dl
+
+    def enqueue(self, downloads: [Download]):
+        """
+        Thread-safe: appends downloads to the queue, except the ones whose URL is queued already.
+        """
+        dl: Download
+        added: [Download] = []
+        with self.queue_condition:
+            for dl in downloads:
+                dl.queued_at = time.monotonic()
+                if not self.download_queue.add(dl):
+                    continue
+                added.append(dl)
+                if self.journal is not None:
+                    self.journal.record_enqueue(dl.url, dl.target_dir, dl.video_format, dl.status)
+            self.queue_condition.notify_all()
+        if not added:
+            return
+        self.listener.downloads_added(added)
+        self._schedule_prefetch()
+
+    def ingest_urls(self, urls: [str], target_dir: str, video_format: str):
+        """
+        Queues all videos of urls, which can be several ones and / or playlists and channels.
+        Playlists and channels are expanded in a background thread,
+        the resulting downloads are added to the queue in chunks, so a UI stays responsive.
+        """
+        if not urls or target_dir not in self.target_dirs:
+            return
+        self.set_status_section(STATUS_SECTION_INGEST, 'Collecting %d URL(s) ...' % len(urls))
+        Thread(target=self._ingest_urls, args=(urls, target_dir, video_format), name='Ingest', daemon=True).start()
+
+    def _ingest_urls(self, urls: [str], target_dir: str, video_format: str):
+        """
+        Runs in a background thread: resolves all URLs to video URLs, filters out the known ones and queues the rest.
+        """
+        try:
+            self._ingest_video_urls(urls, target_dir, video_format)
+        except Exception as e:
+            log.warning('Ingestion failed: ' + repr(e))
+            self.set_status_section(STATUS_SECTION_INGEST, 'Ingestion failed: ' + str(e))
+
+    def _ingest_video_urls(self, urls: [str], target_dir: str, video_format: str):
+        video_urls: [str] = []
+        failed: int = 0
+        for url in urls:
+            match: re.Match | None = RE_YOUTUBE_VIDEO_URL.match(url)
+            if match:
+                video_urls.append(match.group(1))
+            elif not self._expand_collection(url, video_urls, 0):
+                failed += 1
+        self.set_status_section(STATUS_SECTION_INGEST, 'Checking %d videos ...' % len(video_urls))
+        new_video_urls: [str] = self._filter_new_videos(video_urls, target_dir)
+        skipped: int = len(video_urls) - len(new_video_urls)
+        log.info('Ingesting %d videos, %d skipped as already queued or downloaded.' % (len(new_video_urls), skipped))
+        for start in range(0, len(new_video_urls), INGEST_CHUNK_SIZE):
+            end: int = min(start + INGEST_CHUNK_SIZE, len(new_video_urls))
+            self.enqueue([Download(video_url, target_dir, video_format) for video_url in new_video_urls[start:end]])
+            self.set_status_section(STATUS_SECTION_INGEST, 'Queued %d / %d videos ...' % (end, len(new_video_urls)))
+            time.sleep(INGEST_CHUNK_PAUSE)
+        done_text: str = 'Queued %d videos, %d skipped' % (len(new_video_urls), skipped)
+        if failed:
+            done_text += ', %d URL(s) could not be expanded' % failed
+        self.set_status_section(STATUS_SECTION_INGEST, done_text)
+        time.sleep(5)
+        # unless another ingestion shows its status by now
+        self.clear_status_section(STATUS_SECTION_INGEST, done_text)
+
+    def _expand_collection(self, url: str, video_urls: [str], nesting: int) -> bool:
+        """
+        Adds the videos of a playlist / channel to video_urls, using yt-dlp's flat extraction,
+        i.e. without extracting every single video. Returns False if url could not be expanded.
+        """
+        yt_dl_params: dict = {'extract_flat': 'in_playlist', 'skip_download': True, 'quiet': True}
+        if not self._take_pacer_token():
+            return False
+        try:
+            info: dict | None = self.youtube_dl_factory(yt_dl_params).extract_info(url, download=False)
+        except Exception as e:
+            log.warning('Could not expand ' + url + ': ' + repr(e))
+            self.set_status_section(STATUS_SECTION_INGEST, 'Could not expand ' + url)
+            return False
+        if info is None:
+            # e.g. rejected by the match filter
+            log.warning('Could not expand ' + url + ': no result')
+            self.set_status_section(STATUS_SECTION_INGEST, 'Could not expand ' + url)
+            return False
+        for entry in info.get('entries') or []:
+            if not entry:
+                continue
+            entry_url: str = entry.get('url') or ''
+            match: re.Match | None = RE_YOUTUBE_VIDEO_URL.match(entry_url)
+            if match:
+                video_urls.append(match.group(1))
+            elif entry.get('ie_key') == 'Youtube' and entry.get('id'):
+                video_urls.append('watch?v=' + entry['id'])
+            elif RE_YOUTUBE_COLLECTION_URL.match(entry_url) and nesting < INGEST_MAX_NESTING:
+                # e.g. the tabs of a channel
+                self._expand_collection(entry_url, video_urls, nesting + 1)
+                continue
+            if len(video_urls) % INGEST_CHUNK_SIZE == 0:
+                self.set_status_section(STATUS_SECTION_INGEST, 'Expanding playlists: %d videos found ...' % len(video_urls))
+        return True
+
+    def _filter_new_videos(self, video_urls: [str], target_dir: str) -> [str]:
+        """
+        Removes duplicates and everything that is already queued, downloaded or archived, all in one batch.
+        """
+        known_video_ids: set[str] = set()
+        directory_index: DirectoryIndex = self.directory_index(target_dir)
+        archive_index: ArchiveIndex | None = self.archive_index(target_dir) if self.download_archive_filename else None
+        new_video_urls: [str] = []
+        for video_url in video_urls:
+            video_id: str = video_url[-11:]
+            if video_id in known_video_ids:
+                continue
+            known_video_ids.add(video_id)
+            with self.queue_lock:
+                if self.download_queue.find_video(video_id) is not None:
+                    continue
+            if directory_index.files(video_id) or (archive_index is not None and archive_index.contains(video_id)):
+                continue
+            new_video_urls.append(video_url)
+        return new_video_urls
+
+    def process_queue(self):
+        """
+        Worker loop, runs in each of the downloader threads.
+        Every worker claims the next waiting download, so up to max_concurrent_downloads run in parallel.
+        Successful downloads are handed over to the postprocessing threads, the worker continues with the next one.
+        """
+        worker_name: str = threading.current_thread().name
+        log.debug(worker_name + ' started.')
+        while not self.do_stop:
+            queue_element: Download | None = self._claim_next_download()
+            if queue_element is None:
+                continue
+            self.listener.download_changed(queue_element)
+            self._schedule_prefetch()
+            item_metrics: ItemMetrics = ItemMetrics(queue_element.url, queue_element.video_id, queue_element.target_dir,
+                                                    queue_element.video_format, queue_element.queued_at)
+            if not self._wait_for_pacer(queue_element, item_metrics):
+                break
+            error_msg: str | None = None
+            error: str | None = None
+            # (error kind, message) of a failure, reported to the pacer once queue_lock is released
+            failure: (str, str) | None = None
+            postprocess: bool = False
+            try:
+                rc: int = self.do_download(queue_element, item_metrics)
+                with self.queue_lock:
+                    if rc == 0:
+                        self._set_status(queue_element, DL_STATUS_POSTPROCESSING)
+                        postprocess = True
+                    else:
+                        error = 'rc=' + str(rc)
+                        failure = (classify_error(None, rc), error)
+                        error_msg = self._fail_download(queue_element, *failure)
+            except Exception as e:
+                error = error_class(e)
+                failure = (classify_error(e), repr(e))
+                with self.queue_lock:
+                    error_msg = self._fail_download(queue_element, *failure)
+            finally:
+                with self.queue_condition:
+                    queue_element.info = None  # not needed anymore, and format URLs expire anyway
+                    self.active_downloads.discard(queue_element)
+                    self.progress_texts.pop(queue_element.video_id, None)
+                    self.slow_since.pop(queue_element.video_id, None)
+                    # with time windows, there are more downloaders than downloads allowed: one of them can start now
+                    self.queue_condition.notify_all()
+            # the pacer writes its state file, so not while holding queue_lock
+            if postprocess and self.pacer is not None:
+                self.pacer.succeeded()
+            elif failure is not None:
+                self._check_pushback(*failure)
+            self.listener.download_changed(queue_element, error_msg)
+            if postprocess:
+                self.postprocessing_queue.put((queue_element, item_metrics))
+            else:
+                self._record_metrics(item_metrics, queue_element, error)
+            self._show_pacing_status()
+        log.debug(worker_name + ' ended.')
+
+    def _wait_for_pacer(self, dl: Download, item_metrics: ItemMetrics) -> bool:
+        """
+        Waits until the pacer lets the claimed download start. Returns False if the downloader threads are
+        supposed to stop in the meantime, the download is waiting again then.
+        """
+        pause: float = self.pacer.reserve() if self.pacer is not None else 0.0
+        if pause <= 0:
+            return True
+        with self.queue_condition:
+            self.progress_texts[dl.video_id] = 'starts at ' + time.strftime('%H:%M:%S', time.localtime(time.time() + pause))
+        self.listener.status_changed()
+        with self.queue_condition:
+            stopped: bool = self.queue_condition.wait_for(lambda: self.do_stop, pause)
+            self.progress_texts.pop(dl.video_id, None)
+            if stopped:
+                self.active_downloads.discard(dl)
+                self._set_status(dl, DL_STATUS_WAITING)
+        item_metrics.add_phase(PHASE_PAUSE, pause)
+        return not stopped
+
+    def _take_pacer_token(self) -> bool:
+        """
+        Waits until the pacer lets a metadata request (a prefetch or an expansion) through, see RequestPacer.
+        Returns False if the engine is stopped in the meantime.
+        """
+        pause: float = self.pacer.reserve(metadata=True) if self.pacer is not None else 0.0
+        if pause <= 0:
+            return True
+        with self.queue_condition:
+            return not self.queue_condition.wait_for(lambda: self.do_stop, pause)
+
+    def _show_pacing_status(self):
+        if self.pacer is None:
+            self.listener.status_changed()
+            return
+        self.set_status_section(STATUS_SECTION_PACING, self.pacer.status_text())
+
+    def _fail_download(self, dl: Download, error_kind: str, error_msg: str) -> str:
+        """
+        Marks a failed download as error, or schedules its retry if the retry policy allows it.
+        Returns the error message to show, including the state of the retry. Callers hold queue_lock,
+        and call _check_pushback() after releasing it.
+        """
+        dl.attempts += 1
+        if self.retry_policy is None or not self.retry_policy.should_retry(error_kind, dl.attempts):
+            self._set_status(dl, DL_STATUS_ERROR)
+            if dl.attempts > 1:
+                return 'Failed after %d attempts (%s):\n%s' % (dl.attempts, error_kind, error_msg)
+            return error_msg if error_kind != ERROR_PERMANENT else error_msg + '\n(not retried, ' + error_kind + ')'
+        delay: float = self.retry_policy.delay(error_kind, dl.attempts)
+        self.download_queue.delay(dl, time.monotonic() + delay)
+        dl.queued_at = time.monotonic()
+        # the metadata is extracted again shortly before the retry
+        dl.prefetch_state = None
+        if self.journal is not None:
+            self.journal.record_status(dl.url, DL_STATUS_WAITING)
+        # wake up the downloaders, so they wait for the retry
+        self.queue_condition.notify_all()
+        log.warning('Attempt %d of %s failed (%s), retrying in %d s.' % (dl.attempts, dl.video_id, error_kind, delay))
+        return 'Retry %d of %d at %s (%s):\n%s' % (dl.attempts, self.retry_policy.max_attempts - 1,
+                                                  time.strftime('%H:%M:%S', time.localtime(time.time() + delay)),
+                                                  error_kind, error_msg)
+
+    def _check_pushback(self, error_kind: str, error_msg: str):
+        """
+        Makes the pacer back off if an error shows that the site pushes back.
+        """
+        if self.pacer is None:
+            return
+        if error_kind == ERROR_THROTTLED:
+            self.pacer.throttled('too many requests')
+        elif RE_FORBIDDEN_ERROR.search(error_msg):
+            self.pacer.throttled('HTTP 403')
+
+    def process_postprocessing_queue(self):
+        """
+        Postprocessing loop, runs in each of the postprocessing threads and gets the downloads that yt-dlp has finished.
+        A download is done when its postprocessing is done, files that could not be processed are reported.
+        """
+        while not self.do_stop:
+            (dl, item_metrics) = self.postprocessing_queue.get()
+            video_title: str | None = None
+            error_msg: str | None = None
+            error: str | None = None
+            try:
+                with item_metrics.phase(PHASE_POSTPROCESSING):
+                    (video_title, failures) = self.do_post_processing(dl.video_id, dl.target_dir)
+                if failures:
+                    error_msg = 'Postprocessing failed for:\n' + '\n'.join(failures)
+                    error = 'PostprocessingError'
+            except Exception as e:
+                error_msg = 'Postprocessing failed: ' + repr(e)
+                error = error_class(e)
+            with self.queue_lock:
+                if video_title is not None:
+                    dl.title = video_title
+                    if self.journal is not None:
+                        self.journal.record_title(dl.url, video_title)
+                dl.finished_at = time.time()
+                self._set_status(dl, DL_STATUS_DONE)
+                move_to_history: bool = self.history_keep_done is not None \
+                    and self.download_queue.count(DL_STATUS_DONE) > self.history_keep_done
+            log.info('Postprocessing of ' + dl.video_id + ' done.')
+            self.listener.download_changed(dl, error_msg)
+            self._record_metrics(item_metrics, dl, error)
+            if move_to_history:
+                self.cleanup_queue(self.history_keep_done)
+
+    def _record_metrics(self, item_metrics: ItemMetrics, dl: Download, error: str | None):
+        if self.metrics is None:
+            return
+        try:
+            self.metrics.record(item_metrics.to_record(dl.status, error))
+        except OSError as e:
+            log.warning('Could not write the metrics: ' + repr(e))
+
+    def _schedule_prefetch(self):
+        """
+        Thread-safe: hands the next prefetch_count waiting downloads without metadata to the prefetch threads.
+        The ones that idle downloaders are about to claim are skipped, they would be extracted twice.
+        """
+        if self.prefetch_count <= 0 or not self.prefetchers or not self.workers_started:
+            return
+        with self.queue_lock:
+            free_slots: int = max(0, self._max_active_downloads() - len(self.active_downloads))
+            queue_element: Download
+            for queue_element in self.download_queue.next_waiting_list(free_slots + self.prefetch_count)[free_slots:]:
+                if queue_element.prefetch_state is None:
+                    queue_element.prefetch_state = PREFETCH_PENDING
+                    self.prefetch_queue.put(queue_element)
+
+    def process_prefetch_queue(self):
+        """
+        Prefetch loop, runs in each of the prefetch threads.
+        Extracts the metadata of a waiting download, so the title, size and format are known before it starts
+        and the downloader doesn't need to extract it again. Unavailable videos are marked as errors right away.
+        In the process execution mode, the extraction runs in a child process of the prefetch thread as well.
+        """
+        while not self.do_stop:
+            dl: Download = self.prefetch_queue.get()
+            if dl.status != DL_STATUS_WAITING:
+                dl.prefetch_state = None
+                continue
+            if not self._take_pacer_token():
+                dl.prefetch_state = None
+                break
+            if dl.status != DL_STATUS_WAITING:
+                # claimed by a downloader while waiting for the pacer
+                dl.prefetch_state = None
+                continue
+            video_format: str = [entry for entry in self.video_formats if entry[0] == dl.video_format][0][1]
+            pooled_yt_dl: PooledYoutubeDL | None = None
+            error_msg: str | None = None
+            info: dict | None = None
+            try:
+                if self.execution_mode == EXECUTION_MODE_PROCESS:
+                    info = self._download_process().extract_info(
+                        YOUTUBE_PREFIX + dl.url, self._build_yt_dl_params(dl.target_dir, video_format), self.process_timeout)
+                else:
+                    pooled_yt_dl = self.youtube_dl_pool.acquire(
+                        (video_format, dl.target_dir), lambda: self._build_yt_dl_params(dl.target_dir, video_format))
+                    info = pooled_yt_dl.extract_info(YOUTUBE_PREFIX + dl.url)
+                # None if the video is in the archive or rejected by the match filter
+                if info is not None:
+                    self._cache_info(dl.video_id, video_format, info)
+            except Exception as e:
+                error_msg = str(e)
+                log.warning('Prefetch of ' + dl.video_id + ' failed: ' + repr(e))
+                self._check_pushback(classify_error(e), error_msg)
+            finally:
+                if pooled_yt_dl is not None:
+                    self.youtube_dl_pool.release(pooled_yt_dl)
+
+            with self.queue_lock:
+                dl.prefetch_state = PREFETCH_DONE
+                # a downloader may have claimed, finished or failed it meanwhile, then it reports the status itself
+                still_waiting: bool = dl.status == DL_STATUS_WAITING
+                if info is not None:
+                    dl.title = info.get('title') or dl.title
+                    dl.format_id = info.get('format_id')
+                    dl.filesize = info.get('filesize') or info.get('filesize_approx')
+                    if not dl.filesize:
+                        dl.filesize = sum((requested_format.get('filesize') or requested_format.get('filesize_approx') or 0)
+                                          for requested_format in selected_formats(info)) or None
+                    if dl.status == DL_STATUS_WAITING:
+                        dl.info = info
+                    if self.journal is not None and dl.title:
+                        self.journal.record_title(dl.url, dl.title)
+                elif error_msg is not None and RE_UNAVAILABLE_VIDEO.search(error_msg) and dl.status == DL_STATUS_WAITING:
+                    self._set_status(dl, DL_STATUS_ERROR)
+                else:
+                    # e.g. a network problem: leave it to the downloader
+                    error_msg = None
+            if still_waiting:
+                self.listener.download_changed(dl, error_msg)
+            self._show_pacing_status()
+
+    def _claim_next_download(self) -> Download | None:
+        """
+        Blocks until a waiting download is available, marks it as running and returns it.
+        Returns None if the downloader threads are supposed to stop.
+        """
+        announced: bool = False
+        with self.queue_condition:
+            while not self.do_stop:
+                if len(self.active_downloads) < self._max_active_downloads():
+                    self.download_queue.release_due(time.monotonic())
+                    queue_element: Download | None = self.download_queue.next_waiting()
+                    if queue_element is not None:
+                        self._set_status(queue_element, DL_STATUS_RUNNING)
+                        self.active_downloads.add(queue_element)
+                        log.debug(threading.current_thread().name + ': processing queue.')
+                        return queue_element
+                if not self.active_downloads and not announced:
+                    delimiter('Nothing to download, waiting ...')
+                    announced = True
+                # with time windows, the number of parallel downloads can change while waiting
+                timeout: float | None = BANDWIDTH_CHECK_INTERVAL if self.bandwidth is not None else None
+                retry_at: float | None = self.download_queue.next_retry_at()
+                if retry_at is not None:
+                    timeout = max(0.0, retry_at - time.monotonic()) if timeout is None \
+                        else min(timeout, max(0.0, retry_at - time.monotonic()))
+                self.queue_condition.wait(timeout)
+        return None
+
+    def _rebalance_bandwidth(self):
+        """
+        Thread-safe: divides the current total rate limit among the active transfers.
+        yt-dlp reads the "ratelimit" parameter for every chunk it downloads itself (not with external downloaders),
+        so the new limit also applies to the running downloads.
+        """
+        if self.bandwidth is None:
+            return
+        rate_limit: int | None = self.bandwidth.rate_limit()
+        with self.queue_lock:
+            transfers: [PooledYoutubeDL | DownloadProcess] = list(self.active_transfers.values())
+        share: int | None = BandwidthScheduler.share(rate_limit, len(transfers))
+        for transfer in transfers:
+            transfer.set_rate_limit(share)
+        text: str = 'Bandwidth: ' + ('unlimited' if rate_limit is None else format_file_size(rate_limit) + '/s')
+        if rate_limit is not None and len(transfers) > 1:
+            text += ' (' + format_file_size(share) + '/s each)'
+        text += ', max. %d parallel' % self._max_active_downloads()
+        self.set_status_section(STATUS_SECTION_BANDWIDTH, text)
+
+    def _check_bandwidth_window(self):
+        """
+        Applies the limits of another time window, at most every BANDWIDTH_CHECK_INTERVAL seconds.
+        """
+        now: float = time.monotonic()
+        if self.bandwidth is None or now < self.bandwidth_next_check:
+            return
+        self.bandwidth_next_check = now + BANDWIDTH_CHECK_INTERVAL
+        self._rebalance_bandwidth()
+        with self.queue_condition:
+            self.queue_condition.notify_all()
+
+    def progress_hook(self, dl: Download, response):
+        # print('Progress hook called:', response['_default_template'])
+        # runs in the downloader thread, a UI cleans up the text when it shows it
+        with self.queue_lock:
+            self.progress_texts[dl.video_id] = response['_default_template']
+        self.listener.status_changed()
+        self._check_bandwidth_window()
+        self._check_throttled_speed(dl, response)
+
+    def _check_throttled_speed(self, dl: Download, response: dict):
+        """
+        Makes the pacer back off once per download if it stays slower than the throttled speed for
+        THROTTLE_DETECT_SECONDS, unless it is that slow because of the rate limit of the bandwidth scheduler.
+        """
+        if self.pacer is None or self.pacer.throttled_speed is None or response.get('status') != 'downloading' \
+                or response.get('speed') is None:
+            return
+        now: float = time.monotonic()
+        with self.queue_lock:
+            if response['speed'] >= self.pacer.throttled_speed:
+                if self.slow_since.get(dl.video_id, 0.0) is not None:
+                    self.slow_since.pop(dl.video_id, None)
+                return
+            if self.bandwidth is not None:
+                share: int | None = BandwidthScheduler.share(self.bandwidth.rate_limit(), len(self.active_transfers))
+                if share is not None and share < 2 * self.pacer.throttled_speed:
+                    return
+            slow_since: float | None = self.slow_since.setdefault(dl.video_id, now)
+            if slow_since is None or now - slow_since < THROTTLE_DETECT_SECONDS:
+                return
+            self.slow_since[dl.video_id] = None
+        self.pacer.throttled('throttled to %s/s' % format_file_size(int(response['speed'])))
+        self._show_pacing_status()
+
+    def do_download(self, dl: Download, item_metrics: ItemMetrics) -> int:
+        url: str = YOUTUBE_PREFIX + dl.url
+        target_dir: str = dl.target_dir
+        video_format: str = dl.video_format
+        video_id: str = url.replace('https://www.youtube.com/watch?v=', '')
+        video_id: str = video_id.replace('https://www.youtube.com/shorts/', '')
+        delimiter(video_id)
+
+        log.info('Download ' + url + ' [' + video_format + '] => ' + target_dir + ' ...')
+        # several downloaders can create it at the same time
+        os.makedirs(target_dir, exist_ok=True)
+        # the directory index is only stamped after the download if nothing else has changed the directory meanwhile
+        directory_mtime_before: int | None = self.directory_index(target_dir).directory_mtime()
+
+        selected_video_formats: [[str, str]] = [entry for entry in self.video_formats if entry[0] == video_format]
+        video_format: str = selected_video_formats[0][1]
+
+        # after a retry or a reset, yt-dlp continues from the partial files, unless they are broken
+        (partial_file_names, discard_reason) = check_partial_files(self.temp_dir_for(target_dir), dl.video_id)
+        if discard_reason is not None:
+            log.warning('Partial files deleted, starting from scratch (' + discard_reason + ').')
+        elif partial_file_names:
+            log.info('Resuming from %d partial file(s).' % len(partial_file_names))
+        # print('video_format:', video_format, 'video_format', video_format)
+
+        output_files: set[str] = set()
+        start_time: float = time.monotonic()
+        first_byte_times: [float] = []
+
+        def on_progress(response: dict):
+            if not first_byte_times and response.get('status') == 'downloading':
+                first_byte_times.append(time.monotonic())
+            item_metrics.on_progress(response)
+            self.progress_hook(dl, response)
+
+        def on_postprocessor(response: dict):
+            item_metrics.on_postprocessor(response)
+            collect_output_files(response.get('info_dict'), output_files)
+
+        # metadata extracted before: by the prefetch, or by an earlier attempt, see InfoCache
+        info: dict | None = dl.info
+        info_source: str = 'prefetched'
+        if info is None and self.info_cache is not None:
+            info = self.info_cache.get(dl.video_id, video_format)
+            info_source = 'cached'
+
+        transfer: PooledYoutubeDL | DownloadProcess
+        if self.execution_mode == EXECUTION_MODE_PROCESS:
+            transfer = self._download_process()
+        else:
+            transfer = self.youtube_dl_pool.acquire(
+                (video_format, target_dir), lambda: self._build_yt_dl_params(target_dir, video_format))
+        with self.queue_lock:
+            self.active_transfers[dl] = transfer
+        self._rebalance_bandwidth()
+        try:
+            if info is not None:
+                log.info('Using ' + info_source + ' metadata.')
+                item_metrics.prefetched = True
+            item_metrics.yt_dl_start()
+            dl_rc: int | None
+            try:
+                dl_rc = self._run_yt_dl(transfer, url, target_dir, video_format, info, on_progress, on_postprocessor)
+            except Exception as e:
+                if info is None or (isinstance(e, WorkerError)
+                                    and e.error_classes[0] in (ERROR_CLASS_CANCELLED, ERROR_CLASS_TIMEOUT, ERROR_CLASS_CRASHED)):
+                    raise
+                log.warning('Download with the ' + info_source + ' metadata failed: ' + repr(e))
+                dl_rc = None
+            if info is not None and dl_rc != 0:
+                # e.g. the format URLs have expired: extract everything again
+                if self.info_cache is not None:
+                    self.info_cache.remove(dl.video_id)
+                log.info('Extracting the metadata again.')
+                dl_rc = self._run_yt_dl(transfer, url, target_dir, video_format, None, on_progress, on_postprocessor)
+        finally:
+            item_metrics.yt_dl_end()
+            with self.queue_lock:
+                del self.active_transfers[dl]
+            self._rebalance_bandwidth()
+            if isinstance(transfer, PooledYoutubeDL):
+                self.youtube_dl_pool.release(transfer)
+        if first_byte_times:
+            log.info('Time to first byte: %.2f s' % (first_byte_times[0] - start_time))
+        self._register_output_files(dl.video_id, target_dir, output_files, directory_mtime_before)
+        if dl_rc == 0:
+            log.info('Download done.')
+            if self.download_archive_filename:
+                self.archive_index(target_dir).add(dl.video_id)
+        return dl_rc
+
+    def temp_dir_for(self, target_dir: str) -> str:
+        """
+        Thread-safe: the temp dir for downloads into target_dir. yt-dlp can only move the finished files
+        instead of copying them if it is on the same filesystem. This is the entry of target_dir in "temp_dirs",
+        otherwise "temp_dir" if it is on the same filesystem, otherwise "." + the name of "temp_dir" within target_dir.
+        """
+        with self.temp_dirs_lock:
+            temp_dir: str | None = self.temp_dirs_by_target.get(target_dir)
+            if temp_dir is None:
+                temp_dir = self._place_temp_dir(target_dir)
+                self.temp_dirs_by_target[target_dir] = temp_dir
+            return temp_dir
+
+    def _place_temp_dir(self, target_dir: str) -> str:
+        target_device: int | None = filesystem_device(target_dir)
+        temp_dir: str | None = self.temp_dir_overrides.get(target_dir)
+        if temp_dir is None:
+            temp_dir = self.temp_dir
+            if filesystem_device(temp_dir) != target_device:
+                temp_dir = target_dir + os.sep + '.' + os.path.basename(os.path.normpath(self.temp_dir))
+        try:
+            os.makedirs(temp_dir, exist_ok=True)
+        except OSError as e:
+            log.warning('Cannot create temp dir ' + temp_dir + ': ' + str(e))
+            temp_dir = self.temp_dir
+        if filesystem_device(temp_dir) != target_device:
+            log.warning('Temp dir ' + temp_dir + ' is on another filesystem than ' + target_dir
+                        + ', finished downloads are copied instead of moved.')
+        elif temp_dir != self.temp_dir:
+            log.info('Using temp dir ' + temp_dir + ' for ' + target_dir + '.')
+        return temp_dir
+
+    def _run_yt_dl(self, transfer: PooledYoutubeDL | DownloadProcess, url: str, target_dir: str, video_format: str,
+                   info: dict | None, on_progress: Callable[[dict], None], on_postprocessor: Callable[[dict], None]) -> int:
+        """
+        Downloads url with transfer, with the metadata in info if given, otherwise it is extracted.
+        The info dict is processed like yt-dlp's --load-info-json does. Extracted metadata is put into the info cache.
+        """
+        info_listener: Callable[[dict], None] | None = None
+        if self.info_cache is not None:
+            video_id: str = url[-11:]
+            info_listener = lambda extracted_info: self._cache_info(video_id, video_format, extracted_info)
+        if isinstance(transfer, DownloadProcess):
+            return transfer.download(url, self._build_yt_dl_params(target_dir, video_format), info,
+                                     on_progress, on_postprocessor, self.process_timeout, info_listener)
+        return transfer.download(url, on_progress, on_postprocessor, info, info_listener)
+
+    def _cache_info(self, video_id: str, video_format: str, info: dict):
+        """
+        Puts info into the info cache. A cache that can't be written (e.g. the disk is full) does not fail a download.
+        """
+        if self.info_cache is None:
+            return
+        try:
+            self.info_cache.put(video_id, video_format, info)
+        except (OSError, TypeError, ValueError) as e:
+            log.warning('Could not cache the metadata of ' + video_id + ': ' + repr(e))
+
+    def _download_process(self) -> DownloadProcess:
+        """
+        The child process of the current downloader or prefetch thread, running, so it gets the rate limit before the download.
+        """
+        name: str = threading.current_thread().name
+        with self.queue_lock:
+            download_process: DownloadProcess | None = self.download_processes.get(name)
+            if download_process is None:
+                download_process = DownloadProcess(name + '-Process', self.process_factory)
+                self.download_processes[name] = download_process
+        download_process.start()
+        return download_process
+
+    def _build_yt_dl_params(self, target_dir: str, video_format: str) -> dict:
+        yt_dl_params: {} = self.settings['yt_dl_params'].copy()
+        # keep the yt_dl_params from settings unchanged because they will be reused
+
+        archive_file = target_dir + os.sep + self.download_archive_filename
+        yt_dl_params['download_archive'] = archive_file
+        yt_dl_params['paths'] = {
+            "temp": os.path.abspath(self.temp_dir_for(target_dir)),
+            "home": os.path.abspath(target_dir)
+        }
+        yt_dl_params['format'] = video_format
+        # resume from partial files, see check_partial_files()
+        yt_dl_params.setdefault('continuedl', True)
+        if self.execution_mode == EXECUTION_MODE_THREAD:
+            # its output goes through the log pipeline, a child process keeps writing to its own console
+            yt_dl_params.setdefault('logger', YtDlpLogger())
+
+        # with open('yt_dl_fe_debug_settings.json', 'w') as out_file:
+        #     out_file.write(json.dumps(obj=self.settings, indent=4, sort_keys=False) + '\n')
+        # with open('yt_dl_fe_debug_params.json', 'w') as out_file:
+        #     out_file.write(json.dumps(obj=yt_dl_params, indent=4, sort_keys=False) + '\n')
+        return yt_dl_params
+
+    def _register_output_files(self, video_id: str, target_dir: str, output_files: set[str], mtime_before: int | None):
+        """
+        Adds the files a download has created in target_dir to its directory index,
+        mtime_before is the modification time of target_dir from before the download.
+        The names reported by yt-dlp can point to the temp dir, only their base names are relevant.
+        """
+        directory_index: DirectoryIndex = self.directory_index(target_dir)
+        file_names: [str] = [target_dir + os.sep + os.path.basename(output_file) for output_file in output_files]
+        file_names = [file_name for file_name in file_names if os.path.exists(file_name)]
+        if file_names:
+            directory_index.add_files(video_id, file_names, mtime_before)
+        else:
+            # nothing reported, so the files of this download are unknown
+            directory_index.invalidate()
+
+    def do_post_processing(self, video_id: str, target_dir: str) -> (str | None, [str]):
+        """
+        Fixes the description and renames the files of a download, according to the "postprocessing" settings.
+        The files are taken from the directory index, so the directory is not scanned again.
+        Returns the new title, if it could be determined, and a message for every file that could not be processed.
+        """
+        video_title_old: str | None = None
+        video_title_new: str | None = None
+        failures: [str] = []
+        directory_index: DirectoryIndex = self.directory_index(target_dir)
+        file_names: list = directory_index.files(video_id)
+        postprocessing_settings = self.settings['postprocessing']
+        if len(file_names) > 0:
+            re_list: list[Any] = RE_VIDEO_TITLE.findall(os.path.basename(file_names[0]))
+            if len(re_list) > 0:
+                for re_item in re_list:
+                    video_title_old = re_item
+                    video_title_new = video_title_old
+                    if postprocessing_settings['underscores_to_spaces']:
+                        video_title_new = video_title_new.replace('_', ' ')
+                    if postprocessing_settings['remove_at_sign']:
+                        video_title_new = re.sub(r'^@', '', video_title_new)
+        for file_name in file_names:
+            try:
+                self._post_process_file(video_id, file_name, directory_index, video_title_old, video_title_new)
+            except OSError as e:
+                log.warning('Postprocessing of ' + file_name + ' failed: ' + repr(e))
+                failures.append(os.path.basename(file_name) + ': ' + (e.strerror or repr(e)))
+        return video_title_new, failures
+
+    def _post_process_file(self, video_id: str, file_name: str, directory_index: DirectoryIndex,
+                           video_title_old: str | None, video_title_new: str | None):
+        postprocessing_settings = self.settings['postprocessing']
+        directory: str = os.path.dirname(file_name)
+        name: str = os.path.basename(file_name)
+        if video_id + '.description' in name:
+            size = os.path.getsize(file_name)
+            if size > 0:
+                if postprocessing_settings['add_newlines_to_description']:
+                    # add 2 newlines
+                    with open(file_name, 'a') as description_file:
+                        description_file.write('\n\n')
+            elif postprocessing_settings['delete_empty_description']:
+                log.info('description is empty.')
+                mtime_before: int | None = directory_index.directory_mtime()
+                os.remove(file_name)
+                directory_index.remove_files(video_id, [file_name], mtime_before)
+                return
+        if video_title_old is not None:
+            # only the name changes, never the directory
+            name_new: str = name.replace(video_title_old, video_title_new)
+            if postprocessing_settings['rename_description']:
+                name_new = name_new.replace('.description', postprocessing_settings['rename_description_suffix'])
+            if postprocessing_settings['add_tumb']:
+                name_new = name_new.replace('.jpg', '_thumb.jpg')
+                name_new = name_new.replace('.png', '_thumb.png')
+                name_new = name_new.replace('.webp', '_thumb.webp')
+            if postprocessing_settings['subtitles_dots_to_underscores']:
+                name_new = re.sub(r'\.(..)\.vtt', r'_\1.vtt', name_new)
+            if name_new != name:
+                file_name_new: str = directory + os.sep + name_new
+                mtime_before: int | None = directory_index.directory_mtime()
+                os.rename(file_name, file_name_new)
+                directory_index.rename_file(video_id, file_name, file_name_new, mtime_before)
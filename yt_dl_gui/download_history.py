@@ -0,0 +1,69 @@
+import sqlite3
+import threading
+import time
+
+
+# the columns of a history entry, in the order of the table
+HISTORY_COLUMNS: [str] = ['url', 'video_id', 'title', 'target_dir', 'video_format', 'filesize', 'format_id', 'finished_at']
+
+
+class DownloadHistory:
+    """
+    The finished downloads that were removed from the queue, in an SQLite database,
+    so they do not take any memory, but can still be browsed page by page and searched.
+    Parameters:
+    * file_name: the database file, it is created if necessary
+    """
+    def __init__(self, file_name: str):
+        self.file_name: str = file_name
+        self.lock: threading.Lock = threading.Lock()
+        # used by the engine threads, the UI and the HTTP API, always with lock
+        self.connection: sqlite3.Connection = sqlite3.connect(file_name, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.lock, self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                                    'url TEXT NOT NULL, video_id TEXT NOT NULL, title TEXT, target_dir TEXT, '
+                                    'video_format TEXT, filesize INTEGER, format_id TEXT, finished_at REAL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS history_video_id ON history (video_id)')
+
+    def add(self, downloads: [dict]):
+        """
+        Appends downloads (see Download.to_dict()) in one transaction.
+        Downloads without "finished_at", e.g. the ones done before a restart, get the current time.
+        """
+        if not downloads:
+            return
+        now: float = time.time()
+        rows: [tuple] = [tuple(dl.get(column) for column in HISTORY_COLUMNS[:-1]) + (dl.get('finished_at') or now,)
+                         for dl in downloads]
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT INTO history (' + ', '.join(HISTORY_COLUMNS) + ') VALUES ('
+                                        + ', '.join('?' * len(HISTORY_COLUMNS)) + ')', rows)
+
+    def count(self, search: str | None = None) -> int:
+        (where, parameters) = self._where(search)
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM history' + where, parameters).fetchone()[0]
+
+    def page(self, search: str | None = None, offset: int = 0, limit: int = 100) -> [dict]:
+        """
+        The entries that contain search in their title, URL or target dir (all if it is empty), latest first.
+        """
+        (where, parameters) = self._where(search)
+        with self.lock:
+            rows: [sqlite3.Row] = self.connection.execute(
+                'SELECT ' + ', '.join(HISTORY_COLUMNS) + ' FROM history' + where + ' ORDER BY id DESC LIMIT ? OFFSET ?',
+                parameters + [limit, offset]).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    @staticmethod
+    def _where(search: str | None) -> (str, list):
+        if not search:
+            return '', []
+        pattern: str = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return (" WHERE title LIKE ? ESCAPE '\\' OR url LIKE ? ESCAPE '\\' OR target_dir LIKE ? ESCAPE '\\'",
+                [pattern, pattern, pattern])
@@ -0,0 +1,214 @@
+import os
+import re
+import threading
+
+
+ARCHIVE_EXTRACTOR_PREFIX: str = 'youtube '
+
+# A video ID is recognized in a file name if it is a separate "word", like in yt-dlp's default output templates
+# ("... %(id)s.%(ext)s", "[%(id)s]") and in the names created by the postprocessing ("<id>_thumb.jpg", "<id>_en.vtt").
+# A word followed by a space is not taken, it is rather a word of the title.
+RE_VIDEO_ID_WORD: re.Pattern[str] = re.compile(r'(?<![^ \[(])([A-Za-z0-9_-]{11})(?=[._\])]|$)')
+
+
+def video_ids_in_file_name(file_name: str) -> set[str]:
+    """
+    The video IDs that are separate words in file_name. Empty for the names of other output templates,
+    e.g. "%(id)s-%(title)s.%(ext)s", those can only be matched by substring, see file_name_has_video_id().
+    """
+    return set(RE_VIDEO_ID_WORD.findall(file_name))
+
+
+def file_name_has_video_id(file_name: str, video_id: str) -> bool:
+    video_ids: set[str] = video_ids_in_file_name(file_name)
+    return video_id in video_ids if video_ids else video_id in file_name
+
+
+class ArchiveIndex:
+    """
+    In-memory copy of the video IDs in one download archive file.
+    The file is read lazily on first use. Afterwards, only the lines that were appended since the last read are
+    parsed, so a lookup never needs to read the whole file again. If the file shrinks or gets replaced,
+    it is read completely once more.
+    Parameters:
+    * archive_file: the archive file, does not need to exist (yet)
+    """
+    def __init__(self, archive_file: str):
+        self.archive_file: str = archive_file
+        self.video_ids: set[str] = set()
+        self.lock: threading.Lock = threading.Lock()
+        self.loaded: bool = False
+        self.file_id: tuple[int, int] | None = None  # (st_dev, st_ino) of the file that was read
+        self.mtime_ns: int = 0
+        self.size: int = 0
+        self.offset: int = 0  # position after the last complete line that was read
+
+    def contains(self, video_id: str) -> bool:
+        with self.lock:
+            self._refresh()
+            return video_id in self.video_ids
+
+    def add(self, video_id: str):
+        """
+        Adds a video_id after a download has been recorded by yt-dlp,
+        so it is known even before the file is checked the next time.
+        """
+        with self.lock:
+            self.video_ids.add(video_id)
+
+    def _refresh(self):
+        try:
+            stat_result: os.stat_result = os.stat(self.archive_file)
+        except OSError:
+            # no archive (anymore), only keep what was added in memory
+            self.loaded = True
+            self.file_id = None
+            self.mtime_ns = self.size = self.offset = 0
+            return
+        file_id: tuple[int, int] = (stat_result.st_dev, stat_result.st_ino)
+        if self.loaded and file_id == self.file_id \
+                and stat_result.st_mtime_ns == self.mtime_ns and stat_result.st_size == self.size:
+            return
+        if not self.loaded or file_id != self.file_id or stat_result.st_size < self.offset:
+            # first read, or the file was replaced / truncated: start over
+            self.video_ids.clear()
+            self.offset = 0
+        self._read_tail()
+        self.loaded = True
+        self.file_id = file_id
+        self.mtime_ns = stat_result.st_mtime_ns
+        self.size = stat_result.st_size
+
+    def _read_tail(self):
+        with open(self.archive_file, 'rb') as in_file:
+            in_file.seek(self.offset)
+            data: bytes = in_file.read()
+        # an incomplete last line is read again with the next refresh
+        end: int = data.rfind(b'\n') + 1
+        for line in data[:end].decode(errors='replace').splitlines():
+            if line.startswith(ARCHIVE_EXTRACTOR_PREFIX):
+                self.video_ids.add(line[len(ARCHIVE_EXTRACTOR_PREFIX):].strip())
+        self.offset += end
+
+
+class DirectoryIndex:
+    """
+    Maps video IDs to the names of the files in one directory that contain them,
+    so finding the files of a video does not depend on the number of files in the directory.
+    Names without a recognized video ID (see video_ids_in_file_name()) are kept aside and searched by substring,
+    so other output templates work as well, only slower.
+    The index is built with one os.scandir() pass and rebuilt whenever the modification time of the directory
+    differs from the one it was built for. Changes done by this program are applied incrementally instead,
+    and the index is then stamped with the new modification time, but only if the directory was not changed by
+    anything else since the index was built: the caller passes the modification time from before its change,
+    see directory_mtime(). Otherwise the index is rebuilt on next use, so no file that was not reported is missed.
+    Parameters:
+    * directory: the directory to index, does not need to exist (yet)
+    """
+    def __init__(self, directory: str):
+        self.directory: str = directory
+        self.files_by_id: dict[str, set[str]] = {}
+        # names without a recognized video ID
+        self.other_names: set[str] = set()
+        self.lock: threading.Lock = threading.Lock()
+        self.mtime_ns: int | None = None  # None: the index has to be (re)built
+
+    def files(self, video_id: str) -> list[str]:
+        """
+        Returns the paths of all files in the directory whose name contains video_id.
+        """
+        with self.lock:
+            self._revalidate()
+            names: set[str] = set(self.files_by_id.get(video_id, ()))
+            names.update(name for name in self.other_names if video_id in name)
+            return sorted(self.directory + os.sep + name for name in names)
+
+    def directory_mtime(self) -> int | None:
+        """
+        The current modification time of the directory, to be taken before this program changes it.
+        """
+        try:
+            return os.stat(self.directory).st_mtime_ns
+        except OSError:
+            return None
+
+    def add_files(self, video_id: str, file_names: [str], mtime_before: int | None):
+        """
+        Registers files that were created in the directory, e.g. by a download.
+        file_names can be paths or plain names, mtime_before is directory_mtime() from before they were created.
+        """
+        with self.lock:
+            for file_name in file_names:
+                self._add_name(os.path.basename(file_name), video_id)
+            self._restamp(mtime_before)
+
+    def remove_files(self, video_id: str, file_names: [str], mtime_before: int | None):
+        with self.lock:
+            for file_name in file_names:
+                self._remove_name(os.path.basename(file_name), video_id)
+            self._restamp(mtime_before)
+
+    def rename_file(self, video_id: str, old_file_name: str, new_file_name: str, mtime_before: int | None):
+        with self.lock:
+            self._remove_name(os.path.basename(old_file_name), video_id)
+            self._add_name(os.path.basename(new_file_name), video_id)
+            self._restamp(mtime_before)
+
+    def invalidate(self):
+        with self.lock:
+            self.mtime_ns = None
+
+    def _revalidate(self):
+        try:
+            mtime_ns: int = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            self.files_by_id.clear()
+            self.other_names.clear()
+            self.mtime_ns = None
+            return
+        if mtime_ns != self.mtime_ns:
+            self._scan()
+            self.mtime_ns = mtime_ns
+
+    def _scan(self):
+        self.files_by_id.clear()
+        self.other_names.clear()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                self._add_name(entry.name)
+
+    def _restamp(self, mtime_before: int | None):
+        # only valid if the index was up-to-date before, otherwise it has to be rebuilt anyway
+        if self.mtime_ns is None:
+            return
+        if mtime_before != self.mtime_ns:
+            # something else has changed the directory as well, e.g. yt-dlp wrote a file that was not reported
+            self.mtime_ns = None
+            return
+        try:
+            self.mtime_ns = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            self.mtime_ns = None
+
+    @staticmethod
+    def _keys(name: str, video_id: str | None) -> set[str]:
+        video_ids: set[str] = video_ids_in_file_name(name)
+        if video_id is not None and video_id in name:
+            video_ids.add(video_id)
+        return video_ids
+
+    def _add_name(self, name: str, video_id: str | None = None):
+        keys: set[str] = self._keys(name, video_id)
+        if not keys:
+            self.other_names.add(name)
+        for key in keys:
+            self.files_by_id.setdefault(key, set()).add(name)
+
+    def _remove_name(self, name: str, video_id: str | None = None):
+        self.other_names.discard(name)
+        for key in self._keys(name, video_id):
+            names: set[str] | None = self.files_by_id.get(key)
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del self.files_by_id[key]
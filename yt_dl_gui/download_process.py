@@ -0,0 +1,294 @@
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing.connection import Connection
+from typing import Any, Callable
+
+from youtube_dl_pool import PooledYoutubeDL, YoutubeDLPool
+
+
+# seconds between two checks of the timeout, a cancellation and the state of the child process
+POLL_INTERVAL: float = 0.5
+# seconds a child process gets to exit on its own before it is killed
+CLOSE_TIMEOUT: float = 5.0
+
+ERROR_CLASS_CANCELLED: str = 'Cancelled'
+ERROR_CLASS_TIMEOUT: str = 'TimeoutError'
+ERROR_CLASS_CRASHED: str = 'ChildProcessError'
+
+
+class WorkerError(Exception):
+    """
+    A download in a DownloadProcess failed. The exception itself stays in the child process,
+    error_classes are the class names of it and of the errors it wraps, the message contains their texts.
+    """
+    def __init__(self, error_classes: [str], message: str):
+        super().__init__(message)
+        self.error_classes: [str] = error_classes
+
+
+def _primitive_values(response: dict) -> dict:
+    """
+    The part of a hook response that can be sent to the parent process, without the info_dict.
+    """
+    return {key: value for key, value in response.items() if isinstance(value, (str, int, float, bool, type(None)))}
+
+
+def _output_files_info(info_dict: dict | None) -> dict | None:
+    """
+    The part of an info_dict that collect_output_files() reads.
+    """
+    if not info_dict:
+        return None
+    reduced: dict = {key: info_dict.get(key) for key in ('filepath', '_filename', '__files_to_move', '__infojson_filename')}
+    reduced['requested_subtitles'] = {language: {'filepath': entry.get('filepath')}
+                                      for language, entry in (info_dict.get('requested_subtitles') or {}).items()}
+    reduced['thumbnails'] = [{'filepath': entry.get('filepath')} for entry in info_dict.get('thumbnails') or []]
+    reduced['requested_downloads'] = [_output_files_info(entry) for entry in info_dict.get('requested_downloads') or []]
+    return reduced
+
+
+def _exception_chain(exception: BaseException) -> [BaseException]:
+    exceptions: [BaseException] = [exception]
+    exc_info = getattr(exception, 'exc_info', None)
+    if exc_info and exc_info[1] is not None:
+        exceptions.append(exc_info[1])
+    if exception.__cause__ is not None:
+        exceptions.append(exception.__cause__)
+    return exceptions
+
+
+def _default_factory(params: dict) -> Any:
+    import yt_dlp
+    return yt_dlp.YoutubeDL(params=params, auto_init=True)
+
+
+def _child_main(connection: Connection, factory: Callable[[dict], Any] | None):
+    """
+    Runs in the child process: downloads or extracts what the parent sends, one after the other,
+    and sends back the hook events and the result.
+    Messages to the child: ('download', job id, url, params, info, send info), ('extract', job id, url, params),
+    ('ratelimit', bytes per second), None to exit.
+    Messages to the parent, all with the id of their job: ('info', job id, extracted info) if requested or extracting,
+    ('progress', job id, response), ('postprocessor', job id, response), ('result', job id, rc),
+    ('error', job id, error classes, message).
+    """
+    youtube_dl_pool: YoutubeDLPool = YoutubeDLPool(factory if factory is not None else _default_factory)
+    jobs: queue.SimpleQueue = queue.SimpleQueue()
+    # the latest rate limit from the parent, and the instance it applies to
+    rate_limit: dict = {}
+    current: [PooledYoutubeDL] = []
+    lock: threading.Lock = threading.Lock()
+
+    def receive():
+        # the main thread is busy with the download, so the rate limit can change while it runs
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                message = None
+            if message is not None and message[0] == 'ratelimit':
+                with lock:
+                    rate_limit['value'] = message[1]
+                    for pooled_yt_dl in current:
+                        pooled_yt_dl.yt_dl.params['ratelimit'] = message[1]
+                continue
+            jobs.put(message)
+            if message is None:
+                return
+
+    threading.Thread(target=receive, name='Receiver', daemon=True).start()
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        (kind, job_id, url, params) = job[:4]
+        pooled_yt_dl: PooledYoutubeDL = youtube_dl_pool.acquire(repr(sorted(params.items())), lambda: params)
+        with lock:
+            if 'value' in rate_limit:
+                pooled_yt_dl.yt_dl.params['ratelimit'] = rate_limit['value']
+            current.append(pooled_yt_dl)
+        result: tuple
+        try:
+            if kind == 'extract':
+                connection.send(('info', job_id, pooled_yt_dl.extract_info(url)))
+                result = ('result', job_id, 0)
+            else:
+                (info, send_info) = job[4:]
+                rc: int = pooled_yt_dl.download(
+                    url,
+                    lambda response: connection.send(('progress', job_id, _primitive_values(response))),
+                    lambda response: connection.send(('postprocessor', job_id, {
+                        **_primitive_values(response), 'info_dict': _output_files_info(response.get('info_dict'))})),
+                    info,
+                    (lambda extracted_info: connection.send(('info', job_id, extracted_info))) if send_info else None)
+                result = ('result', job_id, rc)
+        except Exception as e:
+            exceptions: [BaseException] = _exception_chain(e)
+            result = ('error', job_id, [type(exception).__name__ for exception in exceptions],
+                      '\n'.join(type(exception).__name__ + ': ' + str(exception) for exception in exceptions))
+        # reset before the result is sent, the rate limit for the next download can arrive right after it
+        with lock:
+            current.clear()
+            rate_limit.clear()
+        youtube_dl_pool.release(pooled_yt_dl)
+        connection.send(result)
+    youtube_dl_pool.close()
+
+
+class DownloadProcess:
+    """
+    A child process that runs yt-dlp for one downloader or prefetch thread, so extraction and merging do not compete with the UI
+    for the GIL, and a crashing or hanging download only takes this process with it.
+    The process is started on first use and again after it was killed or has crashed.
+    Every job has an id that the child sends back with each message, so messages of an abandoned job are dropped.
+    Parameters:
+    * name: the name of the process
+    * factory: creates a YoutubeDL in the child process, None for yt_dlp.YoutubeDL; it has to be picklable
+    """
+    def __init__(self, name: str, factory: Callable[[dict], Any] | None = None):
+        self.name: str = name
+        self.factory: Callable[[dict], Any] | None = factory
+        self.context = multiprocessing.get_context('spawn')
+        self.process: multiprocessing.Process | None = None
+        self.connection: Connection | None = None
+        # the pipe is used by the downloader thread and by the bandwidth rebalancing
+        self.send_lock: threading.Lock = threading.Lock()
+        # why the process was killed, set by kill()
+        self.kill_reason: (str, str) | None = None
+        # the id of the last job sent to the child
+        self.job_id: int = 0
+
+    def download(self, url: str, params: dict, info: dict | None,
+                 progress_listener: Callable[[dict], None],
+                 postprocessor_listener: Callable[[dict], None],
+                 timeout: float | None = None,
+                 info_listener: Callable[[dict], None] | None = None) -> int:
+        """
+        Downloads url in the child process and returns the return code of yt-dlp.
+        The listeners are called in the calling thread, info_listener gets the extracted info if info is None.
+        Raises WorkerError if the download fails, times out, is cancelled or the process crashes.
+        """
+        return self._run_job(('download', url, params, info, info_listener is not None), timeout,
+                             info_listener, progress_listener, postprocessor_listener)
+
+    def extract_info(self, url: str, params: dict, timeout: float | None = None) -> dict | None:
+        """
+        Extracts the metadata of url in the child process, like PooledYoutubeDL.extract_info().
+        Raises WorkerError like download().
+        """
+        extracted: [dict | None] = []
+        self._run_job(('extract', url, params), timeout, extracted.append)
+        return extracted[0] if extracted else None
+
+    def _run_job(self, job: tuple, timeout: float | None,
+                 info_listener: Callable[[dict], None] | None = None,
+                 progress_listener: Callable[[dict], None] | None = None,
+                 postprocessor_listener: Callable[[dict], None] | None = None) -> int:
+        """
+        Sends job to the child and handles its messages up to the result.
+        An error of a listener is raised after the result, so the messages of this job never reach the next one.
+        """
+        self.start()
+        self.kill_reason = None
+        self.job_id += 1
+        job_id: int = self.job_id
+        self._send((job[0], job_id) + job[1:])
+        listeners: dict[str, Callable[[dict], None] | None] = {
+            'info': info_listener, 'progress': progress_listener, 'postprocessor': postprocessor_listener}
+        listener_error: Exception | None = None
+        deadline: float | None = time.monotonic() + timeout if timeout else None
+        while True:
+            if deadline is not None and time.monotonic() > deadline and self.kill_reason is None:
+                self.kill(ERROR_CLASS_TIMEOUT, 'Killed after %d s' % timeout)
+            try:
+                if not self.connection.poll(POLL_INTERVAL):
+                    if self.process.is_alive():
+                        continue
+                    if not self.connection.poll():
+                        raise EOFError()
+                message = self.connection.recv()
+            except (EOFError, OSError):
+                self._raise_ended()
+            if message[1] != job_id:
+                # left over from an earlier job
+                continue
+            if message[0] == 'result':
+                if listener_error is not None:
+                    raise listener_error
+                return message[2]
+            elif message[0] == 'error':
+                raise WorkerError(message[2], message[3])
+            listener: Callable[[dict], None] | None = listeners.get(message[0])
+            if listener is not None and listener_error is None:
+                try:
+                    listener(message[2])
+                except Exception as e:
+                    listener_error = e
+
+    def set_rate_limit(self, rate_limit: int | None):
+        try:
+            self._send(('ratelimit', rate_limit))
+        except (OSError, ValueError):
+            # the process is gone, the next one gets the limit with its next download
+            pass
+
+    def kill(self, error_class: str = ERROR_CLASS_CANCELLED, message: str = 'Cancelled'):
+        """
+        Thread-safe: kills the process, a running download raises a WorkerError with error_class and message.
+        """
+        self.kill_reason = (error_class, message)
+        process: multiprocessing.Process | None = self.process
+        if process is not None and process.is_alive():
+            process.kill()
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self._send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(CLOSE_TIMEOUT)
+        if self.process.is_alive():
+            self.process.kill()
+        self._discard()
+
+    def start(self):
+        """
+        Starts the process if it is not running, e.g. so it gets the rate limit before the download.
+        """
+        if self.process is not None and self.process.is_alive():
+            return
+        self._discard()
+        (parent_connection, child_connection) = self.context.Pipe()
+        self.process = self.context.Process(target=_child_main, args=(child_connection, self.factory),
+                                            name=self.name, daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.connection = parent_connection
+
+    def _send(self, message):
+        with self.send_lock:
+            if self.connection is None:
+                raise OSError('no process')
+            self.connection.send(message)
+
+    def _raise_ended(self):
+        """
+        The process ended during a download: it was killed or has crashed.
+        """
+        self.process.join(CLOSE_TIMEOUT)
+        exit_code: int | None = self.process.exitcode
+        self._discard()
+        if self.kill_reason is not None:
+            raise WorkerError([self.kill_reason[0]], self.kill_reason[1])
+        raise WorkerError([ERROR_CLASS_CRASHED], 'The download process ended unexpectedly, exit code ' + str(exit_code))
+
+    def _discard(self):
+        with self.send_lock:
+            if self.connection is not None:
+                self.connection.close()
+            self.connection = None
+        self.process = None
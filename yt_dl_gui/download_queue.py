@@ -0,0 +1,230 @@
+import heapq
+import re
+import sys
+from collections import OrderedDict
+
+
+DL_STATUS_WAITING: str = 'Waiting'
+DL_STATUS_RUNNING: str = 'Running'
+DL_STATUS_POSTPROCESSING: str = 'Postprocessing'
+DL_STATUS_DONE: str = 'Done'
+DL_STATUS_ERROR: str = 'Error'
+
+ALL_DL_STATUS_VALUES: [str] = [DL_STATUS_WAITING, DL_STATUS_RUNNING, DL_STATUS_POSTPROCESSING, DL_STATUS_DONE, DL_STATUS_ERROR]
+
+# the heap is rebuilt when it has this many more (outdated) entries than waiting downloads
+HEAP_SLACK: int = 64
+
+
+class Download:
+    # without a __dict__ per instance, a long queue takes much less memory
+    __slots__ = ('url', 'video_id', 'title', 'target_dir', 'video_format', 'status', 'priority', 'sequence', 'attempts',
+                 'retry_at', 'prefetch_state', 'info', 'filesize', 'format_id', 'queued_at', 'finished_at')
+
+    def __init__(self, url: str, target_dir: str, video_format: str):
+        self.url: str = url
+        self.video_id: str = re.sub(r'.*[/=]', '', url)
+        self.title: str | None = None
+        # shared by all downloads with the same values, there are only a few of them
+        self.target_dir: str = sys.intern(target_dir)
+        self.video_format: str = sys.intern(video_format)
+        self.status: str = DL_STATUS_WAITING
+        # position in the queue, set by DownloadQueue: lower priority first, then lower sequence
+        self.priority: int = 0
+        self.sequence: int = 0
+        # failed attempts, and time.monotonic() of the next one while a retry is pending
+        self.attempts: int = 0
+        self.retry_at: float | None = None
+        # filled by the metadata prefetch
+        self.prefetch_state: str | None = None
+        self.info: dict | None = None
+        self.filesize: int | None = None
+        self.format_id: str | None = None
+        # time.monotonic() when it was queued (again), for the metrics
+        self.queued_at: float | None = None
+        # time.time() when it was done, for the history
+        self.finished_at: float | None = None
+
+    def to_dict(self) -> dict:
+        return {'url': self.url, 'video_id': self.video_id, 'title': self.title, 'target_dir': self.target_dir,
+                'video_format': self.video_format, 'status': self.status, 'filesize': self.filesize,
+                'format_id': self.format_id, 'finished_at': self.finished_at}
+
+
+class DownloadQueue:
+    """
+    The queued downloads, indexed by URL, video ID and status.
+    The waiting downloads are kept in a heap ordered by (priority, sequence). Entries are not removed when a
+    download changes its status or position, they are skipped when they reach the top of the heap instead.
+    Downloads that wait for a retry are waiting, but they are kept in a second heap ordered by the time of the retry
+    until it is due, see delay().
+    So finding the next download, checking for duplicates, counting and cleaning up do not depend on the length
+    of the queue. It is not thread-safe, DownloadEngine guards it with its queue_lock.
+    """
+    def __init__(self):
+        # url => download, in queue order
+        self.downloads: OrderedDict[str, Download] = OrderedDict()
+        self.by_video_id: dict[str, Download] = {}
+        self.by_status: dict[str, dict[str, Download]] = {status: {} for status in ALL_DL_STATUS_VALUES}
+        self.waiting_heap: [(int, int, str)] = []  # (priority, sequence, url)
+        self.delayed_heap: [(float, str)] = []  # (retry_at, url)
+        self.next_sequence: int = 0
+        self.top_priority: int = 0
+
+    def __len__(self) -> int:
+        return len(self.downloads)
+
+    def __iter__(self):
+        return iter(list(self.downloads.values()))
+
+    def find(self, url: str) -> Download | None:
+        return self.downloads.get(url)
+
+    def find_video(self, video_id: str) -> Download | None:
+        return self.by_video_id.get(video_id)
+
+    def count(self, status: str) -> int:
+        return len(self.by_status[status])
+
+    def with_status(self, status: str) -> [Download]:
+        return list(self.by_status[status].values())
+
+    def add(self, dl: Download) -> bool:
+        """
+        Appends dl with its current status, returns False if its URL is queued already.
+        """
+        if dl.url in self.downloads:
+            return False
+        dl.priority = 0
+        dl.sequence = self._new_sequence()
+        self.downloads[dl.url] = dl
+        self.by_video_id[dl.video_id] = dl
+        self.by_status.setdefault(dl.status, {})[dl.url] = dl
+        if dl.status == DL_STATUS_WAITING:
+            self._push(dl)
+        return True
+
+    def remove(self, dl: Download):
+        if self.downloads.pop(dl.url, None) is None:
+            return
+        if self.by_video_id.get(dl.video_id) is dl:
+            del self.by_video_id[dl.video_id]
+        self.by_status[dl.status].pop(dl.url, None)
+
+    def remove_with_status(self, status: str) -> [Download]:
+        downloads: [Download] = self.with_status(status)
+        for dl in downloads:
+            self.remove(dl)
+        return downloads
+
+    def set_status(self, dl: Download, status: str):
+        if dl.url not in self.downloads:
+            dl.status = status
+            return
+        self.by_status[dl.status].pop(dl.url, None)
+        dl.status = status
+        dl.retry_at = None
+        self.by_status.setdefault(status, {})[dl.url] = dl
+        if status == DL_STATUS_WAITING:
+            self._push(dl)
+
+    def delay(self, dl: Download, retry_at: float):
+        """
+        Sets dl back to waiting, but it is not the next download before time.monotonic() reaches retry_at.
+        """
+        self.set_status(dl, DL_STATUS_WAITING)
+        dl.retry_at = retry_at
+        heapq.heappush(self.delayed_heap, (retry_at, dl.url))
+
+    def release_due(self, now: float):
+        """
+        Makes the delayed downloads whose retry is due available for next_waiting().
+        """
+        while self.delayed_heap and self.delayed_heap[0][0] <= now:
+            (retry_at, url) = heapq.heappop(self.delayed_heap)
+            dl: Download | None = self.downloads.get(url)
+            if dl is not None and dl.retry_at == retry_at and dl.status == DL_STATUS_WAITING:
+                dl.retry_at = None
+                self._push(dl)
+
+    def next_retry_at(self) -> float | None:
+        """
+        time.monotonic() of the next pending retry, None if there is none.
+        """
+        while self.delayed_heap:
+            (retry_at, url) = self.delayed_heap[0]
+            dl: Download | None = self.downloads.get(url)
+            if dl is not None and dl.retry_at == retry_at and dl.status == DL_STATUS_WAITING:
+                return retry_at
+            heapq.heappop(self.delayed_heap)
+        return None
+
+    def move_to_top(self, dl: Download):
+        """
+        dl becomes the next download, ahead of everything that was moved to the top before.
+        """
+        self.top_priority -= 1
+        dl.priority = self.top_priority
+        self.downloads.move_to_end(dl.url, last=False)
+        if dl.status == DL_STATUS_WAITING:
+            self._push(dl)
+
+    def move_to_bottom(self, dl: Download):
+        """
+        dl becomes the last download, as if it was just added.
+        """
+        dl.priority = 0
+        dl.sequence = self._new_sequence()
+        self.downloads.move_to_end(dl.url)
+        if dl.status == DL_STATUS_WAITING:
+            self._push(dl)
+
+    def next_waiting(self) -> Download | None:
+        """
+        The waiting download with the highest priority, it stays in the queue.
+        """
+        while self.waiting_heap:
+            dl: Download | None = self._valid_download(self.waiting_heap[0])
+            if dl is not None:
+                return dl
+            heapq.heappop(self.waiting_heap)
+        return None
+
+    def next_waiting_list(self, count: int) -> [Download]:
+        """
+        Up to count waiting downloads, in the order they will be processed.
+        """
+        downloads: [Download] = []
+        popped: [(int, int, str)] = []
+        urls: set[str] = set()
+        while self.waiting_heap and len(downloads) < count:
+            entry: (int, int, str) = heapq.heappop(self.waiting_heap)
+            dl: Download | None = self._valid_download(entry)
+            if dl is not None and dl.url not in urls:
+                urls.add(dl.url)
+                downloads.append(dl)
+                popped.append(entry)
+        for entry in popped:
+            heapq.heappush(self.waiting_heap, entry)
+        return downloads
+
+    def _new_sequence(self) -> int:
+        self.next_sequence += 1
+        return self.next_sequence
+
+    def _push(self, dl: Download):
+        heapq.heappush(self.waiting_heap, (dl.priority, dl.sequence, dl.url))
+        if len(self.waiting_heap) > 2 * self.count(DL_STATUS_WAITING) + HEAP_SLACK:
+            self.waiting_heap = [(waiting.priority, waiting.sequence, waiting.url)
+                                 for waiting in self.by_status[DL_STATUS_WAITING].values() if waiting.retry_at is None]
+            heapq.heapify(self.waiting_heap)
+
+    def _valid_download(self, entry: (int, int, str)) -> Download | None:
+        """
+        The download of a heap entry, None if the entry is outdated.
+        """
+        dl: Download | None = self.downloads.get(entry[2])
+        if dl is None or dl.status != DL_STATUS_WAITING or dl.retry_at is not None \
+                or (dl.priority, dl.sequence) != entry[:2]:
+            return None
+        return dl
@@ -0,0 +1,241 @@
+import json
+import logging
+import re
+import threading
+from argparse import Namespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from download_engine import (ALL_DL_STATUS_VALUES, DL_STATUS_ERROR, RE_YOUTUBE_VIDEO_URL, YOUTUBE_PREFIX,
+                             Download, DownloadEngine, EngineListener, delimiter, parse_urls, read_config)
+from log_pipeline import start_logging
+
+
+HEADLESS_DEFAULT_HOST: str = '127.0.0.1'
+HEADLESS_DEFAULT_PORT: int = 8765
+MAX_REQUEST_SIZE: int = 1024 * 1024
+MAX_HISTORY_PAGE_SIZE: int = 1000
+
+log: logging.Logger = logging.getLogger(__name__)
+
+
+class HeadlessListener(EngineListener):
+    """
+    Logs the status changes of the downloads, as there is no window to show them.
+    """
+    def download_changed(self, dl: Download, error_msg: str | None = None):
+        log.info('[' + dl.video_id + '] ' + dl.status + ('' if error_msg is None else ': ' + error_msg))
+
+
+class HeadlessApiServer(ThreadingHTTPServer):
+    """
+    Local HTTP API to feed a DownloadEngine, every request is handled in its own thread.
+    Endpoints (all bodies and responses are JSON):
+    * GET /queue[?status=<status>]: the queued downloads, optionally only the ones with the given status
+    * GET /history[?search=<text>&offset=<n>&limit=<n>]: a page of the history of finished downloads, latest first
+    * POST /queue {"url" or "urls", "video_format", "target_dir"}: queues the URLs, with the same checks as the GUI,
+      playlists and channels are expanded in the background. target_dir defaults to the first configured one.
+    * POST /reset {"url"} or {"status": "Error"}: sets failed downloads back to waiting
+    * POST /move {"url", "position": "top" or "bottom"}: moves a download to the top or the bottom of the queue
+    * POST /cancel {"url"}: cancels a running download, only in the process execution mode
+    Parameters:
+    * server_address: (host, port)
+    * engine: the engine to feed, with its workers started or not
+    """
+    daemon_threads = True
+
+    def __init__(self, server_address: (str, int), engine: DownloadEngine):
+        super().__init__(server_address, ApiRequestHandler)
+        self.engine: DownloadEngine = engine
+        # checking and queueing must not interleave, otherwise concurrent requests could queue the same video twice
+        self.enqueue_lock: threading.Lock = threading.Lock()
+
+    def enqueue(self, request: dict) -> (int, dict):
+        urls: [str] = request.get('urls') or ([request['url']] if request.get('url') else [])
+        video_format: str | None = request.get('video_format')
+        target_dir: str = request.get('target_dir') or self.engine.target_dirs[0]
+        if not urls or not isinstance(urls, list):
+            return 400, {'error': 'missing "url" or "urls"'}
+        if video_format not in [entry[0] for entry in self.engine.video_formats]:
+            return 400, {'error': 'unknown video_format: ' + str(video_format)}
+        if target_dir not in self.engine.target_dirs:
+            return 400, {'error': 'unknown target_dir: ' + str(target_dir)}
+
+        queued: [str] = []
+        rejected: [str] = []
+        collections: [str] = []
+        downloads: [Download] = []
+        with self.enqueue_lock:
+            video_ids: set[str] = set()
+            for url in urls:
+                if not isinstance(url, str) or not parse_urls(url):
+                    rejected.append(url)
+                    continue
+                match: re.Match | None = RE_YOUTUBE_VIDEO_URL.match(url)
+                if match is None:
+                    # playlist or channel
+                    collections.append(url)
+                    continue
+                # same cleanup as in the URL entry of the GUI
+                video_url: str = YOUTUBE_PREFIX + match.group(1)
+                if video_url[-11:] in video_ids or not self.engine.can_download(video_url, target_dir, video_format):
+                    rejected.append(url)
+                    continue
+                video_ids.add(video_url[-11:])
+                downloads.append(Download(match.group(1), target_dir, video_format))
+                queued.append(url)
+            if downloads:
+                self.engine.enqueue(downloads)
+        if collections:
+            self.engine.ingest_urls(collections, target_dir, video_format)
+        return 200, {'queued': queued, 'rejected': rejected, 'ingesting': collections}
+
+    def list_queue(self, status: str | None) -> (int, dict):
+        if status is not None and status not in ALL_DL_STATUS_VALUES:
+            return 400, {'error': 'unknown status: ' + status}
+        with self.engine.queue_lock:
+            downloads: [dict] = [dl.to_dict() for dl in (self.engine.download_queue if status is None
+                                                          else self.engine.download_queue.with_status(status))]
+        return 200, {'downloads': downloads}
+
+    def list_history(self, search: str | None, offset: str | None, limit: str | None) -> (int, dict):
+        if self.engine.history is None:
+            return 404, {'error': 'the history is disabled'}
+        try:
+            offset_value: int = max(0, int(offset or 0))
+            limit_value: int = min(MAX_HISTORY_PAGE_SIZE, max(1, int(limit or MAX_HISTORY_PAGE_SIZE)))
+        except ValueError:
+            return 400, {'error': '"offset" and "limit" have to be numbers'}
+        return 200, {'total': self.engine.history.count(search),
+                     'downloads': self.engine.history.page(search, offset_value, limit_value)}
+
+    def reset(self, request: dict) -> (int, dict):
+        urls: [str]
+        if request.get('url'):
+            if not isinstance(request['url'], str):
+                return 400, {'error': '"url" has to be a string'}
+            urls = [request['url']]
+        elif request.get('status') == DL_STATUS_ERROR:
+            with self.engine.queue_lock:
+                urls = [dl.url for dl in self.engine.download_queue.with_status(DL_STATUS_ERROR)]
+        else:
+            return 400, {'error': 'missing "url" or "status": "' + DL_STATUS_ERROR + '"'}
+        # the queue holds URLs relative to YOUTUBE_PREFIX
+        urls = [url[len(YOUTUBE_PREFIX):] if url.startswith(YOUTUBE_PREFIX) else url for url in urls]
+        return 200, {'reset': [url for url in urls if self.engine.reset_download(url)]}
+
+    def move(self, request: dict) -> (int, dict):
+        url: str | None = request.get('url')
+        position: str | None = request.get('position')
+        if not isinstance(url, str) or position not in ('top', 'bottom'):
+            return 400, {'error': 'missing "url" or "position": "top" or "bottom"'}
+        if url.startswith(YOUTUBE_PREFIX):
+            url = url[len(YOUTUBE_PREFIX):]
+        if not self.engine.move_download(url, position == 'top'):
+            return 404, {'error': 'not queued: ' + url}
+        return 200, {'moved': url, 'position': position}
+
+    def cancel(self, request: dict) -> (int, dict):
+        url: str | None = request.get('url')
+        if not isinstance(url, str):
+            return 400, {'error': 'missing "url"'}
+        if url.startswith(YOUTUBE_PREFIX):
+            url = url[len(YOUTUBE_PREFIX):]
+        if not self.engine.cancel_download(url):
+            return 404, {'error': 'not running in a download process: ' + url}
+        return 200, {'cancelled': url}
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    # keep-alive, so scripts can send many requests over one connection
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, with Nagle's algorithm every response would wait for a delayed ACK
+    disable_nagle_algorithm = True
+    server: HeadlessApiServer
+
+    def do_GET(self):
+        split_url = urlsplit(self.path)
+        query: dict[str, [str]] = parse_qs(split_url.query)
+        if split_url.path == '/queue':
+            status: [str] | None = query.get('status')
+            self._send_json(*self.server.list_queue(status[0] if status else None))
+        elif split_url.path == '/history':
+            self._send_json(*self.server.list_history(*(query.get(key, [None])[0] for key in ('search', 'offset', 'limit'))))
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        path: str = urlsplit(self.path).path
+        request: dict | None = self._read_json()
+        if request is None:
+            return
+        try:
+            if path == '/queue':
+                self._send_json(*self.server.enqueue(request))
+            elif path == '/reset':
+                self._send_json(*self.server.reset(request))
+            elif path == '/move':
+                self._send_json(*self.server.move(request))
+            elif path == '/cancel':
+                self._send_json(*self.server.cancel(request))
+            else:
+                self._send_json(404, {'error': 'not found'})
+        except (TypeError, ValueError, AttributeError) as e:
+            # a request with unexpected types, answered instead of dropping the connection
+            log.warning('Invalid request to ' + path + ': ' + repr(e))
+            self._send_json(400, {'error': 'invalid request: ' + str(e)})
+
+    def log_message(self, format, *args):
+        # one line per request would flood the output of the downloads
+        pass
+
+    def _read_json(self) -> dict | None:
+        try:
+            length: int = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_REQUEST_SIZE:
+            self._send_json(400, {'error': 'invalid Content-Length'})
+            return None
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as e:
+            self._send_json(400, {'error': 'invalid JSON: ' + str(e)})
+            return None
+        if not isinstance(request, dict):
+            self._send_json(400, {'error': 'expected a JSON object'})
+            return None
+        return request
+
+    def _send_json(self, status: int, response: dict):
+        body: bytes = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def run_headless(commandline_args: Namespace):
+    """
+    Runs the download engine without a window until the program is interrupted.
+    """
+    (config_file, settings) = read_config()
+    start_logging(settings, config_file)
+    host: str = commandline_args.host or HEADLESS_DEFAULT_HOST
+    port: int = commandline_args.port or settings.get('headless_api_port', HEADLESS_DEFAULT_PORT)
+    engine: DownloadEngine = DownloadEngine(settings, config_file, HeadlessListener(),
+                                            max_concurrent_downloads=commandline_args.workers,
+                                            use_journal=not commandline_args.ui_test,
+                                            execution_mode=commandline_args.execution_mode)
+    engine.start(start_workers=not commandline_args.no_download and not commandline_args.ui_test)
+    engine.warm_up()
+    server: HeadlessApiServer = HeadlessApiServer((host, port), engine)
+    delimiter('Headless mode, API on http://' + host + ':' + str(server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log.info('Interrupted.')
+    finally:
+        server.server_close()
+        engine.stop()
@@ -0,0 +1,130 @@
+import json
+import os
+import re
+import threading
+import time
+
+
+# format URLs of YouTube contain their expiry time, e.g. "...&expire=1700000000&..."
+RE_URL_EXPIRE: re.Pattern[str] = re.compile(r'[?&/]expire[=/]([0-9]{9,11})')
+# an entry is not used anymore when one of its format URLs expires within this many seconds
+EXPIRE_MARGIN: float = 600.0
+
+
+def selected_formats(info: dict) -> [dict]:
+    """
+    The entries of "formats" that yt-dlp selected for info, e.g. the video and the audio format, or [info] if there are none.
+    "requested_formats" can't be used, sanitize_info() removes it.
+    """
+    format_ids: [str] = (info.get('format_id') or '').split('+')
+    return [entry for entry in info.get('formats') or [] if entry.get('format_id') in format_ids] or [info]
+
+
+def url_expiry(info: dict) -> float | None:
+    """
+    The earliest expiry time of the selected format URLs in info, None if they don't contain one.
+    """
+    expiry: float | None = None
+    for requested_format in selected_formats(info):
+        match: re.Match | None = RE_URL_EXPIRE.search(requested_format.get('url') or '')
+        if match is not None:
+            expiry = min(expiry, float(match.group(1))) if expiry is not None else float(match.group(1))
+    return expiry
+
+
+class InfoCache:
+    """
+    The results of yt-dlp's extraction on disk, one file "<video ID>.json" per video, so a retry, a reset or
+    a restart does not need to download the webpage, the player and the manifests again.
+    An entry is used until ttl seconds after it was written or until its format URLs expire, whatever comes first,
+    and only for the format it was extracted with. When the files take more than max_size bytes,
+    the least recently used ones are deleted.
+    Parameters:
+    * cache_dir: the directory of the files, it is created if necessary
+    * ttl: seconds an entry is valid
+    * max_size: the maximal total size of the files in bytes
+    """
+    def __init__(self, cache_dir: str, ttl: float = 7200, max_size: int = 100 * 1024 * 1024):
+        self.cache_dir: str = cache_dir
+        self.ttl: float = ttl
+        self.max_size: int = max_size
+        self.lock: threading.Lock = threading.Lock()
+        # video ID => (last use, file size), in LRU order once loaded
+        self.entries: dict[str, (float, int)] | None = None
+        self.total_size: int = 0
+
+    def get(self, video_id: str, format_key: str) -> dict | None:
+        """
+        The cached info of video_id for format_key, None if there is no valid one.
+        """
+        with self.lock:
+            self._load()
+            if video_id not in self.entries:
+                return None
+            try:
+                with open(self._file_name(video_id), 'r') as in_file:
+                    entry: dict = json.load(in_file)
+            except (OSError, ValueError):
+                self._remove(video_id)
+                return None
+            now: float = time.time()
+            expiry: float | None = entry.get('expiry')
+            if entry.get('format') != format_key or now - entry.get('cached_at', 0) > self.ttl \
+                    or (expiry is not None and now > expiry - EXPIRE_MARGIN):
+                self._remove(video_id)
+                return None
+            self.entries[video_id] = (now, self.entries.pop(video_id)[1])
+            # keeps the order after a restart
+            os.utime(self._file_name(video_id))
+            return entry['info']
+
+    def put(self, video_id: str, format_key: str, info: dict):
+        entry: dict = {'cached_at': time.time(), 'expiry': url_expiry(info), 'format': format_key, 'info': info}
+        data: str = json.dumps(entry)
+        with self.lock:
+            self._load()
+            file_name: str = self._file_name(video_id)
+            # replaced at once, so a crash never leaves a partial entry
+            with open(file_name + '.tmp', 'w') as out_file:
+                out_file.write(data)
+            os.replace(file_name + '.tmp', file_name)
+            if video_id in self.entries:
+                self.total_size -= self.entries.pop(video_id)[1]
+            self.entries[video_id] = (time.time(), len(data))
+            self.total_size += len(data)
+            while self.total_size > self.max_size and len(self.entries) > 1:
+                self._remove(next(iter(self.entries)))
+
+    def remove(self, video_id: str):
+        """
+        Forgets the info of video_id, e.g. because yt-dlp could not download with it.
+        """
+        with self.lock:
+            self._load()
+            self._remove(video_id)
+
+    def _file_name(self, video_id: str) -> str:
+        return self.cache_dir + os.sep + video_id + '.json'
+
+    def _load(self):
+        if self.entries is not None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        files: [(float, str, int)] = []
+        with os.scandir(self.cache_dir) as dir_entries:
+            for dir_entry in dir_entries:
+                if dir_entry.is_file() and dir_entry.name.endswith('.json'):
+                    stat_result: os.stat_result = dir_entry.stat()
+                    files.append((stat_result.st_mtime, dir_entry.name[:-len('.json')], stat_result.st_size))
+        # the modification time is the best guess for the last use after a restart
+        self.entries = {video_id: (mtime, size) for (mtime, video_id, size) in sorted(files)}
+        self.total_size = sum(size for (_, size) in self.entries.values())
+
+    def _remove(self, video_id: str):
+        entry: (float, int) | None = self.entries.pop(video_id, None)
+        if entry is not None:
+            self.total_size -= entry[1]
+        try:
+            os.remove(self._file_name(video_id))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,129 @@
+import atexit
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from collections import deque
+
+
+LOG_FILE_FORMAT: str = '%(asctime)s %(levelname)-7s [%(threadName)s] %(message)s'
+# the console output looks like before
+LOG_CONSOLE_FORMAT: str = '%(message)s'
+DEFAULT_LOG_FILE: str = 'yt_dl_gui.log'
+
+# the output of yt-dlp that is not logged, its progress lines are shown in the status bar instead
+YT_DLP_PROGRESS_PREFIX: str = '\r'
+YT_DLP_DEBUG_PREFIX: str = '[debug] '
+
+
+class RingBufferHandler(logging.Handler):
+    """
+    Keeps the latest formatted records in memory, for the log panel of the window.
+    Parameters:
+    * capacity: the number of records that are kept
+    """
+    def __init__(self, capacity: int):
+        super().__init__()
+        self.records: deque[(str, str)] = deque(maxlen=capacity)  # (level name, text)
+        # the number of records ever added, so a reader can ask for the ones it has not seen yet
+        self.sequence: int = 0
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            text: str = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        # handle() holds the lock of the handler
+        self.records.append((record.levelname, text))
+        self.sequence += 1
+
+    def records_since(self, sequence: int) -> (int, [(str, str)]):
+        """
+        The records added after the reader has seen sequence records, at most the kept ones,
+        and the sequence number to ask with next time.
+        """
+        with self.lock:
+            new_records: int = min(self.sequence - sequence, len(self.records))
+            return self.sequence, list(itertools.islice(self.records, len(self.records) - new_records, None))
+
+
+class YtDlpLogger:
+    """
+    The "logger" of yt-dlp, so its messages go through the log pipeline instead of being written to the console
+    by the downloader threads. yt-dlp reports its regular output with debug().
+    """
+    def __init__(self, name: str = 'yt_dlp'):
+        self.log: logging.Logger = logging.getLogger(name)
+
+    def debug(self, message: str):
+        if message.startswith(YT_DLP_PROGRESS_PREFIX):
+            return
+        if message.startswith(YT_DLP_DEBUG_PREFIX):
+            self.log.debug(message[len(YT_DLP_DEBUG_PREFIX):])
+        else:
+            self.log.info(message)
+
+    def info(self, message: str):
+        self.log.info(message)
+
+    def warning(self, message: str):
+        self.log.warning(message)
+
+    def error(self, message: str):
+        self.log.error(message)
+
+
+class LogPipeline:
+    """
+    Logging in the background: the loggers only put their records into a queue, a QueueListener thread writes them
+    to the console, to a rotating log file and to a ring buffer. So a slow terminal or pipe never blocks
+    the downloader threads.
+    Parameters:
+    * settings: the "logging" section of the configuration, {"level", "file", "max_size_mb", "backup_count",
+      "buffer_size", "console"}
+    * log_file: the resolved "file", None for no log file
+    """
+    def __init__(self, settings: dict, log_file: str | None):
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        handlers: [logging.Handler] = []
+        if settings.get('console', True):
+            console_handler: logging.StreamHandler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(logging.Formatter(LOG_CONSOLE_FORMAT))
+            handlers.append(console_handler)
+        if log_file:
+            file_handler: logging.Handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=int(settings.get('max_size_mb', 5) * 1024 * 1024),
+                backupCount=settings.get('backup_count', 3), encoding='utf-8')
+            file_handler.setFormatter(logging.Formatter(LOG_FILE_FORMAT))
+            handlers.append(file_handler)
+        self.buffer: RingBufferHandler = RingBufferHandler(settings.get('buffer_size', 1000))
+        self.buffer.setFormatter(logging.Formatter(LOG_FILE_FORMAT, '%H:%M:%S'))
+        handlers.append(self.buffer)
+        self.listener: logging.handlers.QueueListener = logging.handlers.QueueListener(self.queue, *handlers)
+        self.level: str = settings.get('level', 'INFO')
+
+    def start(self):
+        root_logger: logging.Logger = logging.getLogger()
+        for handler in list(root_logger.handlers):
+            root_logger.removeHandler(handler)
+        root_logger.addHandler(logging.handlers.QueueHandler(self.queue))
+        root_logger.setLevel(self.level)
+        self.listener.start()
+        # writes what is still queued
+        atexit.register(self.listener.stop)
+
+
+def start_logging(settings: dict, config_file: str) -> LogPipeline:
+    """
+    Starts the log pipeline with the "logging" section of settings, the log file is relative to config_file.
+    """
+    logging_settings: dict = settings.get('logging') or {}
+    log_file: str | None = logging_settings.get('file', DEFAULT_LOG_FILE)
+    if log_file and not log_file.startswith(os.sep):
+        log_file = os.path.dirname(config_file) + os.sep + log_file
+    log_pipeline: LogPipeline = LogPipeline(logging_settings, log_file)
+    log_pipeline.start()
+    return log_pipeline
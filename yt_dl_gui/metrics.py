@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+PHASE_QUEUE_WAIT: str = 'queue_wait'
+PHASE_EXTRACTION: str = 'extraction'
+PHASE_DOWNLOAD: str = 'download'
+PHASE_MERGE: str = 'merge'
+PHASE_POSTPROCESSING: str = 'postprocessing'
+PHASE_PAUSE: str = 'pause'
+
+ALL_PHASES: [str] = [PHASE_QUEUE_WAIT, PHASE_EXTRACTION, PHASE_DOWNLOAD, PHASE_MERGE, PHASE_POSTPROCESSING, PHASE_PAUSE]
+
+PROMETHEUS_PREFIX: str = 'yt_dl_gui_'
+
+
+def error_class(exception: BaseException) -> str:
+    """
+    The class name of the error behind exception. yt-dlp wraps the original error in a DownloadError.
+    """
+    exc_info = getattr(exception, 'exc_info', None)
+    if exc_info and exc_info[1] is not None:
+        return type(exc_info[1]).__name__
+    # the errors of a download process, see WorkerError
+    error_classes: [str] = getattr(exception, 'error_classes', None)
+    if error_classes:
+        return error_classes[-1]
+    return type(exception).__name__
+
+
+class ItemMetrics:
+    """
+    The timing of the phases of one download, plus the bytes and speeds reported by yt-dlp.
+    The extraction is the time from the start of yt-dlp until its first progress event, the download lasts until
+    the last progress event. The merge is the time spent in yt-dlp's postprocessors (merger, metadata, thumbnails, ...),
+    the postprocessing is the one of this program, done after the download in a separate thread.
+    The pause is the one of the downloader thread before the download.
+    Parameters:
+    * url, video_id, target_dir, video_format: of the download
+    * queued_at: time.monotonic() when the download was queued, None if unknown
+    """
+    def __init__(self, url: str, video_id: str, target_dir: str, video_format: str, queued_at: float | None):
+        self.url: str = url
+        self.video_id: str = video_id
+        self.target_dir: str = target_dir
+        self.video_format: str = video_format
+        self.started_at: float = time.time()
+        self.phases: dict[str, float] = {}
+        self.prefetched: bool = False
+        self.yt_dl_started: float | None = None
+        self.first_progress: float | None = None
+        self.last_progress: float | None = None
+        # downloaded bytes per file, e.g. video and audio of a merged format
+        self.bytes_by_file: dict[str, int] = {}
+        self.peak_speed: float = 0.0
+        self.postprocessor_started: dict[str, float] = {}
+        self.postprocessors: dict[str, float] = {}
+        if queued_at is not None:
+            self.add_phase(PHASE_QUEUE_WAIT, time.monotonic() - queued_at)
+
+    def add_phase(self, phase: str, seconds: float):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, phase: str):
+        started: float = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_phase(phase, time.monotonic() - started)
+
+    def yt_dl_start(self):
+        self.yt_dl_started = time.monotonic()
+
+    def yt_dl_end(self):
+        """
+        Splits the time yt-dlp was running into extraction, download and merge.
+        """
+        if self.yt_dl_started is None:
+            return
+        ended: float = time.monotonic()
+        merge: float = sum(self.postprocessors.values())
+        if self.first_progress is None:
+            # nothing downloaded, e.g. an error or the file already existed
+            self.add_phase(PHASE_EXTRACTION, ended - self.yt_dl_started - merge)
+        else:
+            self.add_phase(PHASE_EXTRACTION, self.first_progress - self.yt_dl_started)
+            self.add_phase(PHASE_DOWNLOAD, self.last_progress - self.first_progress)
+        self.add_phase(PHASE_MERGE, merge)
+        self.yt_dl_started = None
+
+    def on_progress(self, response: dict):
+        now: float = time.monotonic()
+        if self.first_progress is None:
+            self.first_progress = now
+        self.last_progress = now
+        file_name: str = response.get('filename') or ''
+        downloaded: int | None = response.get('downloaded_bytes')
+        if response.get('status') == 'finished':
+            downloaded = response.get('total_bytes') or downloaded
+        if downloaded:
+            self.bytes_by_file[file_name] = max(downloaded, self.bytes_by_file.get(file_name, 0))
+        speed: float | None = response.get('speed')
+        if speed and speed > self.peak_speed:
+            self.peak_speed = speed
+
+    def on_postprocessor(self, response: dict):
+        name: str = response.get('postprocessor') or '?'
+        if response.get('status') == 'started':
+            self.postprocessor_started[name] = time.monotonic()
+        elif response.get('status') == 'finished' and name in self.postprocessor_started:
+            self.postprocessors[name] = self.postprocessors.get(name, 0.0) \
+                + time.monotonic() - self.postprocessor_started.pop(name)
+
+    def to_record(self, status: str, error: str | None) -> dict:
+        total_bytes: int = sum(self.bytes_by_file.values())
+        download_time: float = self.phases.get(PHASE_DOWNLOAD, 0.0)
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(self.started_at)),
+            'url': self.url,
+            'video_id': self.video_id,
+            'target_dir': self.target_dir,
+            'video_format': self.video_format,
+            'status': status,
+            'error_class': error,
+            'prefetched': self.prefetched,
+            'phases': {phase: round(self.phases[phase], 4) for phase in ALL_PHASES if phase in self.phases},
+            'postprocessors': {name: round(seconds, 4) for name, seconds in self.postprocessors.items()},
+            'bytes': total_bytes,
+            'avg_speed': round(total_bytes / download_time) if download_time > 0 else None,
+            'peak_speed': round(self.peak_speed) if self.peak_speed else None,
+        }
+
+
+class MetricsRecorder:
+    """
+    Appends one JSON object per download to metrics_file and, if given,
+    rewrites prometheus_file with the totals in the Prometheus text format after every download,
+    e.g. for the textfile collector of the node exporter.
+    Parameters:
+    * metrics_file: the JSON lines file, None to only write the Prometheus file
+    * prometheus_file: the Prometheus file, None to not write one
+    """
+    def __init__(self, metrics_file: str | None, prometheus_file: str | None = None):
+        self.metrics_file: str | None = metrics_file
+        self.prometheus_file: str | None = prometheus_file
+        self.lock: threading.Lock = threading.Lock()
+        self.downloads_total: dict[str, int] = {}  # status => count
+        self.errors_total: dict[str, int] = {}  # error class => count
+        self.phase_seconds_total: dict[str, float] = {phase: 0.0 for phase in ALL_PHASES}
+        self.bytes_total: int = 0
+        self.peak_speed: float = 0.0
+
+    def record(self, record: dict):
+        with self.lock:
+            if self.metrics_file is not None:
+                with open(self.metrics_file, 'a') as out_file:
+                    out_file.write(json.dumps(record) + '\n')
+            self.downloads_total[record['status']] = self.downloads_total.get(record['status'], 0) + 1
+            if record['error_class']:
+                self.errors_total[record['error_class']] = self.errors_total.get(record['error_class'], 0) + 1
+            for phase, seconds in record['phases'].items():
+                self.phase_seconds_total[phase] += seconds
+            self.bytes_total += record['bytes']
+            self.peak_speed = max(self.peak_speed, record['peak_speed'] or 0)
+            if self.prometheus_file is not None:
+                self._write_prometheus()
+
+    def _write_prometheus(self):
+        lines: [str] = [
+            '# HELP ' + PROMETHEUS_PREFIX + 'downloads_total Finished downloads by status.',
+            '# TYPE ' + PROMETHEUS_PREFIX + 'downloads_total counter']
+        lines += [PROMETHEUS_PREFIX + 'downloads_total{status="%s"} %d' % (status, count)
+                  for status, count in self.downloads_total.items()]
+        lines += [
+            '# HELP ' + PROMETHEUS_PREFIX + 'errors_total Failed downloads by error class.',
+            '# TYPE ' + PROMETHEUS_PREFIX + 'errors_total counter']
+        lines += [PROMETHEUS_PREFIX + 'errors_total{class="%s"} %d' % (name, count)
+                  for name, count in self.errors_total.items()]
+        lines += [
+            '# HELP ' + PROMETHEUS_PREFIX + 'phase_seconds_total Time spent per phase of the downloads.',
+            '# TYPE ' + PROMETHEUS_PREFIX + 'phase_seconds_total counter']
+        lines += [PROMETHEUS_PREFIX + 'phase_seconds_total{phase="%s"} %.4f' % (phase, seconds)
+                  for phase, seconds in self.phase_seconds_total.items()]
+        lines += [
+            '# HELP ' + PROMETHEUS_PREFIX + 'bytes_total Downloaded bytes.',
+            '# TYPE ' + PROMETHEUS_PREFIX + 'bytes_total counter',
+            PROMETHEUS_PREFIX + 'bytes_total %d' % self.bytes_total,
+            '# HELP ' + PROMETHEUS_PREFIX + 'peak_speed_bytes Highest download speed seen, in bytes per second.',
+            '# TYPE ' + PROMETHEUS_PREFIX + 'peak_speed_bytes gauge',
+            PROMETHEUS_PREFIX + 'peak_speed_bytes %d' % self.peak_speed]
+        # replaced at once, so a collector never reads a partial file
+        temp_file: str = self.prometheus_file + '.tmp'
+        with open(temp_file, 'w') as out_file:
+            out_file.write('\n'.join(lines) + '\n')
+        os.replace(temp_file, self.prometheus_file)
@@ -0,0 +1,80 @@
+import json
+import os
+import re
+
+from download_index import file_name_has_video_id
+
+
+# files yt-dlp continues from: "<name>.part", the fragments of DASH/HLS downloads "<name>.part-Frag<n>",
+# their state "<name>.ytdl", and complete streams of a merged format "<name>.f<format id>.<ext>"
+RE_PARTIAL_FILE: re.Pattern[str] = re.compile(r'\.(?:part(?:-Frag[0-9]+)?|ytdl)$|\.f[0-9]+(?:-[0-9]+)?\.[A-Za-z0-9]+$')
+RE_CONTAINER_EXT: re.Pattern[str] = re.compile(r'\.([A-Za-z0-9]+)(?:\.part)?$')
+# the first box of an ISO media file (mp4, m4a, ...) is at offset 4
+MP4_BOX_TYPES: set[bytes] = {b'ftyp', b'styp', b'moov', b'mdat', b'free', b'skip', b'wide', b'sidx'}
+MP4_EXTENSIONS: set[str] = {'mp4', 'm4a', 'm4v', 'mov', '3gp'}
+MATROSKA_MAGIC: bytes = b'\x1a\x45\xdf\xa3'
+MATROSKA_EXTENSIONS: set[str] = {'webm', 'mkv', 'mka'}
+
+
+def is_partial_file(file_name: str) -> bool:
+    return RE_PARTIAL_FILE.search(file_name) is not None
+
+
+def partial_files(temp_dir: str, video_id: str) -> [str]:
+    """
+    The resumable files of video_id in temp_dir.
+    """
+    try:
+        with os.scandir(temp_dir) as entries:
+            return sorted(entry.path for entry in entries
+                          if entry.is_file() and is_partial_file(entry.name) and file_name_has_video_id(entry.name, video_id))
+    except OSError:
+        return []
+
+
+def verify_partial_file(file_name: str) -> str | None:
+    """
+    Checks if yt-dlp can continue from file_name. Returns why not, None if it can.
+    Only the beginning of a media file is checked, yt-dlp appends to it anyway.
+    """
+    try:
+        if os.path.getsize(file_name) == 0:
+            return 'empty'
+        if file_name.endswith('.ytdl'):
+            with open(file_name, 'r') as in_file:
+                state = json.load(in_file)
+            if not isinstance(state, dict) or 'downloader' not in state:
+                return 'invalid download state'
+            return None
+        if '.part-Frag' in file_name:
+            return None
+        match: re.Match | None = RE_CONTAINER_EXT.search(file_name)
+        extension: str = match.group(1).lower() if match else ''
+        with open(file_name, 'rb') as in_file:
+            header: bytes = in_file.read(8)
+    except (OSError, ValueError) as e:
+        return 'unreadable: ' + str(e)
+    if extension in MP4_EXTENSIONS and len(header) == 8 and header[4:8] not in MP4_BOX_TYPES:
+        return 'no MP4 header'
+    if extension in MATROSKA_EXTENSIONS and len(header) >= 4 and header[:4] != MATROSKA_MAGIC:
+        return 'no Matroska header'
+    return None
+
+
+def check_partial_files(temp_dir: str, video_id: str) -> ([str], str | None):
+    """
+    Verifies the resumable files of video_id. If one of them is corrupt, all of them are deleted,
+    so the download starts from scratch instead of building on broken data.
+    Returns the files that are kept and the reason for deleting them, if they were.
+    """
+    file_names: [str] = partial_files(temp_dir, video_id)
+    for file_name in file_names:
+        reason: str | None = verify_partial_file(file_name)
+        if reason is not None:
+            for file_to_remove in file_names:
+                try:
+                    os.remove(file_to_remove)
+                except FileNotFoundError:
+                    pass
+            return [], os.path.basename(file_name) + ': ' + reason
+    return file_names, None
@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+
+
+JOURNAL_EVENT_ENQUEUE: str = 'enqueue'
+JOURNAL_EVENT_STATUS: str = 'status'
+JOURNAL_EVENT_TITLE: str = 'title'
+JOURNAL_EVENT_REMOVE: str = 'remove'
+JOURNAL_EVENT_MOVE: str = 'move'
+
+
+class QueueJournal:
+    """
+    Crash-safe record of the download queue, kept as an append-only file with one JSON object per line.
+    Events are collected in memory and written by a background thread at most every flush_interval seconds,
+    followed by one fsync, so a crash loses at most the events of that interval. The lock is only held to take
+    the pending events, the file is written without it, so a slow disk never blocks the threads that record events.
+    The journal also keeps the resulting queue state in memory. When the file contains a lot more events than
+    queued downloads, it is compacted, i.e. replaced by one "enqueue" event per download.
+    Parameters:
+    * journal_file: the file to write, does not need to exist (yet)
+    * flush_interval: seconds between two writes
+    * compact_min_events: the minimal number of events in the file before it gets compacted
+    """
+    def __init__(self, journal_file: str, flush_interval: float = 1.0, compact_min_events: int = 1000):
+        self.journal_file: str = journal_file
+        self.flush_interval: float = flush_interval
+        self.compact_min_events: int = compact_min_events
+        # queue state: url => {'url', 'target_dir', 'video_format', 'status', 'title'}, in queue order
+        self.entries: dict[str, dict] = {}
+        self.pending_events: [dict] = []
+        self.events_in_file: int = 0
+        self.lock: threading.Lock = threading.Lock()
+        self.condition: threading.Condition = threading.Condition(self.lock)
+        # keeps the writes of the file in the order their events were taken
+        self.write_lock: threading.Lock = threading.Lock()
+        self.do_stop: bool = False
+        self.writer: threading.Thread | None = None
+
+    def load(self) -> [dict]:
+        """
+        Replays the journal file and returns the queued downloads in queue order.
+        Afterwards, the file is compacted, so it only contains the current state.
+        """
+        with self.lock:
+            self.entries.clear()
+            if os.path.exists(self.journal_file):
+                with open(self.journal_file, 'r') as in_file:
+                    for line in in_file:
+                        try:
+                            event: dict = json.loads(line)
+                        except ValueError:
+                            # incomplete last line after a crash
+                            continue
+                        self._apply(event)
+            snapshot: [dict] = self._take_snapshot()
+        with self.write_lock:
+            self._write_snapshot(snapshot)
+        return [entry.copy() for entry in snapshot]
+
+    def start(self):
+        self.writer = threading.Thread(target=self._write_loop, name='QueueJournal', daemon=True)
+        self.writer.start()
+
+    def close(self):
+        """
+        Stops the background thread and writes everything that is still pending.
+        """
+        with self.condition:
+            self.do_stop = True
+            self.condition.notify()
+        if self.writer is not None and self.writer is not threading.current_thread():
+            self.writer.join()
+        self._write_pending()
+
+    def record_enqueue(self, url: str, target_dir: str, video_format: str, status: str, title: str | None = None):
+        self._record({'event': JOURNAL_EVENT_ENQUEUE, 'url': url, 'target_dir': target_dir,
+                      'video_format': video_format, 'status': status, 'title': title})
+
+    def record_status(self, url: str, status: str):
+        self._record({'event': JOURNAL_EVENT_STATUS, 'url': url, 'status': status})
+
+    def record_title(self, url: str, title: str):
+        self._record({'event': JOURNAL_EVENT_TITLE, 'url': url, 'title': title})
+
+    def record_remove(self, url: str):
+        self._record({'event': JOURNAL_EVENT_REMOVE, 'url': url})
+
+    def record_move(self, url: str, to_top: bool):
+        self._record({'event': JOURNAL_EVENT_MOVE, 'url': url, 'position': 'top' if to_top else 'bottom'})
+
+    def _record(self, event: dict):
+        with self.condition:
+            self._apply(event)
+            self.pending_events.append(event)
+            self.condition.notify()
+
+    def _apply(self, event: dict):
+        url: str | None = event.get('url')
+        event_type: str | None = event.get('event')
+        if event_type == JOURNAL_EVENT_ENQUEUE:
+            self.entries[url] = {key: event.get(key) for key in ('url', 'target_dir', 'video_format', 'status', 'title')}
+        elif url in self.entries:
+            if event_type == JOURNAL_EVENT_STATUS:
+                self.entries[url]['status'] = event['status']
+            elif event_type == JOURNAL_EVENT_TITLE:
+                self.entries[url]['title'] = event['title']
+            elif event_type == JOURNAL_EVENT_REMOVE:
+                del self.entries[url]
+            elif event_type == JOURNAL_EVENT_MOVE:
+                entry: dict = self.entries.pop(url)
+                if event.get('position') == 'top':
+                    self.entries = {url: entry, **self.entries}
+                else:
+                    self.entries[url] = entry
+        self.events_in_file += 1
+
+    def _write_loop(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending_events or self.do_stop)
+                if self.do_stop:
+                    break
+                # collect what arrives within the flush interval, then write all of it at once
+                self.condition.wait(self.flush_interval)
+            self._write_pending()
+
+    def _write_pending(self):
+        """
+        Appends the pending events to the file, or replaces it with the compacted state if it has grown too much.
+        """
+        with self.write_lock:
+            snapshot: [dict] | None = None
+            with self.lock:
+                if self.events_in_file >= self.compact_min_events and self.events_in_file > 4 * len(self.entries):
+                    snapshot = self._take_snapshot()
+                events: [dict] = self.pending_events
+                self.pending_events = []
+            if snapshot is not None:
+                self._write_snapshot(snapshot)
+            elif events:
+                self._append(events)
+
+    def _take_snapshot(self) -> [dict]:
+        """
+        The current queue state for a compaction, callers hold the lock. It contains the pending events.
+        """
+        self.pending_events = []
+        self.events_in_file = len(self.entries)
+        return [entry.copy() for entry in self.entries.values()]
+
+    def _append(self, events: [dict]):
+        lines: str = ''.join(json.dumps(event) + '\n' for event in events)
+        with open(self.journal_file, 'a') as out_file:
+            out_file.write(lines)
+            out_file.flush()
+            os.fsync(out_file.fileno())
+
+    def _write_snapshot(self, snapshot: [dict]):
+        temp_file: str = self.journal_file + '.tmp'
+        with open(temp_file, 'w') as out_file:
+            for entry in snapshot:
+                out_file.write(json.dumps({'event': JOURNAL_EVENT_ENQUEUE, **entry}) + '\n')
+            out_file.flush()
+            os.fsync(out_file.fileno())
+        os.replace(temp_file, self.journal_file)
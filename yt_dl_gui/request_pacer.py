@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from bandwidth import parse_rate
+
+
+log: logging.Logger = logging.getLogger(__name__)
+
+# the interval shrinks by this factor with every successful download
+SUCCESS_FACTOR: float = 0.85
+# and grows by this factor, but at least to BACKOFF_MIN_INTERVAL, when the site pushes back
+BACKOFF_FACTOR: float = 4.0
+BACKOFF_MIN_INTERVAL: float = 30.0
+
+
+class RequestPacer:
+    """
+    Token bucket for the start of downloads, with an interval that adapts to the site:
+    it shrinks while downloads succeed and grows sharply on "Too Many Requests", 403 or throttled download speeds.
+    Up to "burst" downloads can start at once, afterwards one per interval.
+    Metadata requests (prefetches and playlist expansions) have a bucket of their own with "metadata_burst" tokens
+    and the same interval, so they don't delay the downloads, but still slow down when the site pushes back.
+    The state is saved to state_file after every change and restored from it, so a restart does not forget a backoff.
+    Parameters:
+    * settings: the "pacing" section of the configuration, {"initial_interval", "min_interval", "max_interval",
+      "burst", "metadata_burst", "throttled_speed"}, intervals in seconds, the speed like the rates of "bandwidth"
+    * state_file: where the state is kept, None to not keep it
+    """
+    def __init__(self, settings: dict, state_file: str | None):
+        self.min_interval: float = settings.get('min_interval', 0.5)
+        self.max_interval: float = settings.get('max_interval', 900)
+        self.burst: float = max(1, settings.get('burst', 3))
+        self.metadata_burst: float = max(1, settings.get('metadata_burst', 5))
+        # a download that is slower than this for a while is considered throttled, None to not check the speed
+        self.throttled_speed: int | None = parse_rate(settings.get('throttled_speed', '64K'))
+        self.state_file: str | None = state_file
+        self.lock: threading.Lock = threading.Lock()
+        self.interval: float = min(self.max_interval, max(self.min_interval, settings.get('initial_interval', 3)))
+        self.tokens: float = self.burst
+        self.metadata_tokens: float = self.metadata_burst
+        self.updated: float = time.monotonic()
+        # the reason of the last backoff, None after a successful download
+        self.backoff_reason: str | None = None
+        self._load()
+
+    def reserve(self, metadata: bool = False) -> float:
+        """
+        Takes a token for the start of a download, or for a metadata request if metadata is set.
+        Returns the seconds to wait before it can start.
+        """
+        with self.lock:
+            self._refill()
+            if metadata:
+                self.metadata_tokens -= 1
+                return -self.metadata_tokens * self.interval if self.metadata_tokens < 0 else 0.0
+            self.tokens -= 1
+            return -self.tokens * self.interval if self.tokens < 0 else 0.0
+
+    def succeeded(self):
+        with self.lock:
+            self.interval = max(self.min_interval, self.interval * SUCCESS_FACTOR)
+            self.backoff_reason = None
+            self._save()
+
+    def throttled(self, reason: str):
+        """
+        The site pushes back: waits longer between the downloads, starting with the next one.
+        """
+        with self.lock:
+            self._refill()
+            self.interval = min(self.max_interval, max(BACKOFF_MIN_INTERVAL, self.interval * BACKOFF_FACTOR))
+            self.tokens = min(self.tokens, 0.0)
+            self.metadata_tokens = min(self.metadata_tokens, 0.0)
+            self.backoff_reason = reason
+            self._save()
+        log.warning('Pacing: ' + reason + ', one download per %d s from now on.' % self.interval)
+
+    def status_text(self) -> str:
+        with self.lock:
+            text: str = 'Pacing: one download per %.1f s' % self.interval
+            if self.backoff_reason is not None:
+                text += ' (' + self.backoff_reason + ')'
+            return text
+
+    def _refill(self):
+        now: float = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) / self.interval)
+        self.metadata_tokens = min(self.metadata_burst, self.metadata_tokens + (now - self.updated) / self.interval)
+        self.updated = now
+
+    def _load(self):
+        if self.state_file is None or not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'r') as in_file:
+                state: dict = json.load(in_file)
+            self.interval = min(self.max_interval, max(self.min_interval, float(state['interval'])))
+            self.backoff_reason = state.get('backoff_reason')
+            # refilled for the time the program was not running
+            self.tokens = float(state['tokens'])
+            self.updated = time.monotonic() - max(0.0, time.time() - float(state['saved_at']))
+            self._refill()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.warning('Ignoring the pacing state in ' + self.state_file + ': ' + repr(e))
+
+    def _save(self):
+        if self.state_file is None:
+            return
+        state: dict = {'interval': round(self.interval, 3), 'tokens': round(self.tokens, 3),
+                       'backoff_reason': self.backoff_reason, 'saved_at': time.time()}
+        try:
+            with open(self.state_file + '.tmp', 'w') as out_file:
+                json.dump(state, out_file)
+            os.replace(self.state_file + '.tmp', self.state_file)
+        except OSError as e:
+            log.warning('Cannot save the pacing state: ' + repr(e))
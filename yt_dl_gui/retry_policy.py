@@ -0,0 +1,82 @@
+import random
+import re
+
+
+ERROR_TRANSIENT: str = 'transient'
+ERROR_THROTTLED: str = 'throttled'
+ERROR_PERMANENT: str = 'permanent'
+
+# extraction errors that will not go away by trying again
+RE_UNAVAILABLE_VIDEO: re.Pattern[str] = re.compile(
+    r'Private video|Video unavailable|has been removed|is not available|account .* terminated|members-only', re.IGNORECASE)
+RE_PERMANENT_ERROR: re.Pattern[str] = re.compile(
+    r'Unsupported URL|Requested format is not available|Sign in to confirm your age|copyright|No space left on device',
+    re.IGNORECASE)
+RE_THROTTLED_ERROR: re.Pattern[str] = re.compile(
+    r'HTTP Error 429|Too Many Requests|rate.?limit|Sign in to confirm you.re not a bot', re.IGNORECASE)
+# not retried differently, expired format URLs cause it as well, but the pacer backs off on it
+RE_FORBIDDEN_ERROR: re.Pattern[str] = re.compile(r'HTTP Error 403|403: Forbidden', re.IGNORECASE)
+# errors of the network or of expired format URLs (403)
+TRANSIENT_ERROR_CLASSES: set[str] = {'HTTPError', 'URLError', 'TransportError', 'IncompleteRead', 'ContentTooShortError',
+                                     'ConnectionError', 'ConnectionResetError', 'ConnectionAbortedError',
+                                     'RemoteDisconnected', 'TimeoutError', 'timeout', 'SSLError'}
+# the wrappers of yt-dlp, the original error (if any) is in exc_info
+YT_DLP_ERROR_CLASSES: set[str] = {'DownloadError', 'ExtractorError', 'PostProcessingError'}
+
+
+def classify_error(exception: BaseException | None, rc: int | None = None) -> str:
+    """
+    ERROR_TRANSIENT, ERROR_THROTTLED or ERROR_PERMANENT for a failed download,
+    from the exception raised by yt-dlp, or from its return code if there was none.
+    """
+    if exception is None:
+        # yt-dlp only returns an error code if it ignores errors, it has reported the details already
+        return ERROR_PERMANENT if rc is None or rc == 0 else ERROR_TRANSIENT
+    exceptions: [BaseException] = [exception]
+    exc_info = getattr(exception, 'exc_info', None)
+    if exc_info and exc_info[1] is not None:
+        exceptions.append(exc_info[1])
+    if exception.__cause__ is not None:
+        exceptions.append(exception.__cause__)
+    message: str = '\n'.join(str(e) for e in exceptions)
+    if RE_UNAVAILABLE_VIDEO.search(message) or RE_PERMANENT_ERROR.search(message):
+        return ERROR_PERMANENT
+    if RE_THROTTLED_ERROR.search(message):
+        return ERROR_THROTTLED
+    class_names: set[str] = {type(e).__name__ for e in exceptions}
+    # a WorkerError of a download process names the errors of the child process
+    class_names.update(getattr(exception, 'error_classes', []))
+    if class_names & TRANSIENT_ERROR_CLASSES or class_names & YT_DLP_ERROR_CLASSES:
+        return ERROR_TRANSIENT
+    # e.g. a bug or a full disk, trying again would fail the same way
+    return ERROR_PERMANENT
+
+
+class RetryPolicy:
+    """
+    How often and when failed downloads are tried again: jittered exponential backoff,
+    throttled downloads (429, "not a bot") start with a longer delay.
+    Parameters:
+    * settings: the "retry" section of the configuration, {"max_attempts", "base_delay", "throttled_base_delay",
+      "max_delay"}, delays in seconds
+    """
+    def __init__(self, settings: dict):
+        self.max_attempts: int = settings.get('max_attempts', 5)
+        self.base_delay: float = settings.get('base_delay', 30)
+        self.throttled_base_delay: float = settings.get('throttled_base_delay', 300)
+        self.max_delay: float = settings.get('max_delay', 3600)
+
+    def should_retry(self, error_kind: str, attempts: int) -> bool:
+        """
+        Whether a download that failed with error_kind after attempts attempts is tried again.
+        """
+        return error_kind != ERROR_PERMANENT and attempts < self.max_attempts
+
+    def delay(self, error_kind: str, attempts: int) -> float:
+        """
+        Seconds until the next attempt, after attempts failed ones.
+        The jitter keeps downloads that failed together from being retried together.
+        """
+        base_delay: float = self.throttled_base_delay if error_kind == ERROR_THROTTLED else self.base_delay
+        delay: float = min(self.max_delay, base_delay * 2 ** max(0, attempts - 1))
+        return random.uniform(delay / 2, delay)
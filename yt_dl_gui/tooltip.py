@@ -1,9 +1,106 @@
 from tkinter import *
+from typing import Callable
+
+
+TOOLTIP_WAIT_TIME: int = 500  # miliseconds
+TOOLTIP_WRAP_LENGTH: int = 180  # pixels
+TOOLTIP_DEFAULT_OFFSET: tuple[int, int] = (5, -15)
+
+
+class TooltipManager:
+    """
+    Shows the tooltips of all widgets of an application in one Toplevel, which is created on first use
+    and only hidden and shown again afterwards. There is at most one pending timer.
+    The text is resolved when the tooltip is shown, it can be a callback, so e.g. a table does not need
+    a text per row, but looks it up in its model.
+    Use TooltipManager.of() to get the one of a widget's application.
+    Parameters:
+    * root: the root window of the application
+    """
+    def __init__(self, root: Misc):
+        self.root: Misc = root
+        self.window: Toplevel | None = None
+        self.label: Label | None = None
+        self.visible: bool = False
+        self.after_id: str | None = None
+        # the widget the scheduled or shown tooltip belongs to, its text source and offset
+        self.owner: Widget | None = None
+        self.text_source: str | Callable[[], str | None] | None = None
+        self.offset: tuple[int, int] = TOOLTIP_DEFAULT_OFFSET
+
+    @staticmethod
+    def of(widget: Misc) -> 'TooltipManager':
+        root: Misc = widget._root()
+        manager: TooltipManager | None = getattr(root, '_tooltip_manager', None)
+        if manager is None:
+            manager = TooltipManager(root)
+            root._tooltip_manager = manager
+        return manager
+
+    def schedule(self, widget: Widget, text_source: str | Callable[[], str | None] | None,
+                 offset: tuple[int, int] | None = None):
+        """
+        Shows the tooltip of widget after TOOLTIP_WAIT_TIME, hiding the current one.
+        """
+        self.hide()
+        if text_source is None:
+            return
+        self.owner = widget
+        self.text_source = text_source
+        self.offset = TOOLTIP_DEFAULT_OFFSET if offset is None else offset
+        self.after_id = self.root.after(TOOLTIP_WAIT_TIME, self._show)
+
+    def hide(self, widget: Widget | None = None):
+        """
+        Hides the tooltip, or cancels showing it. If widget is given, only if it belongs to widget.
+        """
+        if widget is not None and widget is not self.owner:
+            return
+        self.owner = None
+        self.text_source = None
+        after_id: str | None = self.after_id
+        self.after_id = None
+        if after_id:
+            self.root.after_cancel(after_id)
+        if self.visible:
+            self.visible = False
+            self.window.withdraw()
+
+    def _show(self):
+        self.after_id = None
+        widget: Widget | None = self.owner
+        text: str | None = self.text_source() if callable(self.text_source) else self.text_source
+        if widget is None or not text or not widget.winfo_exists():
+            return
+        x = y = 0
+        try:
+            x, y, cx, cy = widget.bbox("insert")
+        except (TclError, TypeError, ValueError):
+            # widgets without an insert cursor (e.g. a Treeview): show it next to the mouse pointer
+            x = widget.winfo_pointerx() - widget.winfo_rootx()
+            y = widget.winfo_pointery() - widget.winfo_rooty()
+        x += widget.winfo_rootx() + self.offset[0]
+        y += widget.winfo_rooty() + self.offset[1]
+        if self.window is None:
+            self.window = Toplevel(self.root)
+            self.window.withdraw()
+            # Leaves only the label and removes the app window
+            self.window.wm_overrideredirect(True)
+            self.label = Label(self.window, justify='left',
+                               font='Arial 11 bold',
+                               background="#ffffff", relief='solid', borderwidth=1,
+                               wraplength=TOOLTIP_WRAP_LENGTH)
+            self.label.pack(ipadx=1)
+        self.label.configure(text=text)
+        self.window.wm_geometry("+%d+%d" % (x, y))
+        self.window.deiconify()
+        self.window.lift()
+        self.visible = True
 
 
 class Tooltip:
     """
-    Create a tooltip for a given widget.
+    Create a tooltip for a given widget, shown by the TooltipManager of its application.
     Inpired by: https://stackoverflow.com/questions/3221956/how-do-i-display-tooltips-in-tkinter
     with some slight additions.
     Parameters:
@@ -14,12 +111,8 @@ class Tooltip:
     def __init__(self, widget: Widget, text=None, offset: tuple[int, int] | None = None):
         self.widget: Widget = widget
         self.text: str | None = text
-        self.wait_time: int = 500  # miliseconds
-        self.wrap_length: int = 180  # pixels
-        self.sustain_time: int = 1500  # miliseconds
-        self.id = None
-        self.tw = None
-        self.offset: tuple = (5, -15) if offset is None else offset
+        self.offset: tuple = TOOLTIP_DEFAULT_OFFSET if offset is None else offset
+        self.manager: TooltipManager = TooltipManager.of(widget)
 
         self.widget.bind("<Enter>", self.enter)
         self.widget.bind("<Leave>", self.leave)
@@ -27,8 +120,7 @@ class Tooltip:
 
     def set_text(self, text: str = None):
         if text is None:
-            self.unschedule()
-            self.hide_tooltip()
+            self.leave()
         self.text = text
 
     def set_offset(self, offset: tuple):
@@ -37,42 +129,7 @@ class Tooltip:
 
     def enter(self, event = None):
         if self.text is not None:
-            self.schedule()
+            self.manager.schedule(self.widget, self.text, self.offset)
 
     def leave(self, event = None):
-        self.unschedule()
-        self.hide_tooltip()
-        # print('leave()')
-
-    def schedule(self):
-        self.unschedule()
-        self.id = self.widget.after(self.wait_time, self.show_toolip)
-
-    def unschedule(self):
-        id = self.id
-        self.id = None
-        if id:
-            self.widget.after_cancel(id)
-
-    def show_toolip(self, event = None):
-        x = y = 0
-        x, y, cx, cy = self.widget.bbox("insert")
-        x += self.widget.winfo_rootx() + self.offset[0]
-        y += self.widget.winfo_rooty() + self.offset[1]
-        # creates a toplevel window
-        self.tw = Toplevel(self.widget)
-        # Leaves only the label and removes the app window
-        self.tw.wm_overrideredirect(True)
-        self.tw.wm_geometry("+%d+%d" % (x, y))
-        label = Label(self.tw, text=self.text, justify='left',
-                      font='Arial 11 bold',
-                      background="#ffffff", relief='solid', borderwidth=1,
-                      wraplength=self.wrap_length)
-        label.pack(ipadx=1)
-
-    def hide_tooltip(self):
-        tw = self.tw
-        self.tw = None
-        if tw:
-            tw.destroy()
-
+        self.manager.hide(self.widget)
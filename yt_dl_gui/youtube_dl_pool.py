@@ -0,0 +1,120 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class PooledYoutubeDL:
+    """
+    A YoutubeDL instance of a YoutubeDLPool.
+    Its hooks are registered once, they forward to the listeners of the download that currently uses the instance.
+    """
+    def __init__(self, key: Hashable, yt_dl: Any):
+        self.key: Hashable = key
+        self.yt_dl: Any = yt_dl
+        self.progress_listener: Callable[[dict], None] | None = None
+        self.postprocessor_listener: Callable[[dict], None] | None = None
+        self.yt_dl.add_progress_hook(self._on_progress)
+        self.yt_dl.add_postprocessor_hook(self._on_postprocessor)
+
+    def download(self, url: str,
+                 progress_listener: Callable[[dict], None],
+                 postprocessor_listener: Callable[[dict], None],
+                 info: dict | None = None,
+                 info_listener: Callable[[dict], None] | None = None) -> int:
+        """
+        Downloads url. If info is given (the result of extract_info()), the extraction is skipped.
+        Otherwise, if there is an info_listener, the extraction is done separately and its result passed to it.
+        If the extraction returns nothing (e.g. the video is in the archive), there is nothing to download and 0 is returned.
+        """
+        self.progress_listener = progress_listener
+        self.postprocessor_listener = postprocessor_listener
+        # yt-dlp never resets its return code, so an error of a previous download would stick
+        self.yt_dl._download_retcode = 0
+        try:
+            if info is None and info_listener is not None:
+                info = self.extract_info(url)
+                if info is None:
+                    return 0
+                info_listener(info)
+            if info is None:
+                return self.yt_dl.download(url)
+            self.yt_dl.process_ie_result(info, download=True)
+            return self.yt_dl._download_retcode
+        finally:
+            self.progress_listener = None
+            self.postprocessor_listener = None
+
+    def set_rate_limit(self, rate_limit: int | None):
+        # yt-dlp reads it for every chunk, so it also applies to a running download
+        self.yt_dl.params['ratelimit'] = rate_limit
+
+    def extract_info(self, url: str) -> dict | None:
+        """
+        Extracts the metadata of url and selects the format(s), without downloading.
+        The result is sanitized, so it can be passed to download() later on.
+        None if yt-dlp skips the video, e.g. because it is in the download archive or rejected by the match filter.
+        """
+        info: dict | None = self.yt_dl.extract_info(url, download=False)
+        if info is None:
+            return None
+        return self.yt_dl.sanitize_info(info, True)
+
+    def close(self):
+        close = getattr(self.yt_dl, 'close', None)
+        if close is not None:
+            close()
+
+    def _on_progress(self, response: dict):
+        listener = self.progress_listener
+        if listener is not None:
+            listener(response)
+
+    def _on_postprocessor(self, response: dict):
+        listener = self.postprocessor_listener
+        if listener is not None:
+            listener(response)
+
+
+class YoutubeDLPool:
+    """
+    Reuses initialized YoutubeDL instances, so extractor, cookie, HTTP session and postprocessor setup
+    is not repeated for every download.
+    Instances are keyed by the parameters that differ between downloads (e.g. format and paths).
+    An instance is used by one download at a time, the idle ones are kept in LRU order
+    and the least recently used one is closed when there are more than max_idle.
+    Parameters:
+    * factory: creates a new YoutubeDL instance for the given parameters
+    * max_idle: the maximal number of idle instances to keep, 0 disables the reuse
+    """
+    def __init__(self, factory: Callable[[dict], Any], max_idle: int = 4):
+        self.factory: Callable[[dict], Any] = factory
+        self.max_idle: int = max_idle
+        self.idle: OrderedDict[int, PooledYoutubeDL] = OrderedDict()  # id(instance) => instance, LRU first
+        self.lock: threading.Lock = threading.Lock()
+
+    def acquire(self, key: Hashable, params_factory: Callable[[], dict]) -> PooledYoutubeDL:
+        """
+        Returns an idle instance for key, or creates a new one with the parameters of params_factory.
+        """
+        with self.lock:
+            for instance_id, pooled in reversed(self.idle.items()):
+                if pooled.key == key:
+                    del self.idle[instance_id]
+                    return pooled
+        return PooledYoutubeDL(key, self.factory(params_factory()))
+
+    def release(self, pooled: PooledYoutubeDL):
+        evicted: [PooledYoutubeDL] = []
+        with self.lock:
+            self.idle[id(pooled)] = pooled
+            while len(self.idle) > self.max_idle:
+                evicted.append(self.idle.popitem(last=False)[1])
+        for pooled_to_close in evicted:
+            pooled_to_close.close()
+
+    def close(self):
+        with self.lock:
+            evicted: [PooledYoutubeDL] = list(self.idle.values())
+            self.idle.clear()
+        for pooled in evicted:
+            pooled.close()
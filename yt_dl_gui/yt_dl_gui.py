@@ -1,36 +1,41 @@
 #!/usr/bin/python
 
-import glob
+import time
+# taken before the other imports, so --profile-startup includes them
+STARTUP_TIME: float = time.perf_counter()
+
 import json
+import logging
 import os
-import random
+import queue
 import re
-import sys
 import threading
-import time
 from argparse import ArgumentParser, Namespace
-from threading import Thread
-from tkinter import (Frame, Toplevel, Label, Button, Entry, Text, ttk, StringVar, Widget, PhotoImage, filedialog, END)
-from typing import Any
+from tkinter import (Frame, Toplevel, Label, Button, Entry, Menu, Text, ttk, StringVar, PhotoImage, filedialog, END)
 
-import yt_dlp as yt
 from tkinterdnd2 import TkinterDnD, DND_TEXT
 
-from tooltip import Tooltip
+from download_engine import (DL_STATUS_WAITING, DL_STATUS_RUNNING, DL_STATUS_POSTPROCESSING, DL_STATUS_DONE, DL_STATUS_ERROR,
+                             ALL_DL_STATUS_VALUES, ALL_EXECUTION_MODES, EXECUTION_MODE_PROCESS, YOUTUBE_PREFIX, Download, DownloadEngine, EngineListener,
+                             format_file_size, is_bulk_input, parse_urls, read_config)
+from download_history import DownloadHistory
+from log_pipeline import LogPipeline, RingBufferHandler, start_logging
+from tooltip import Tooltip, TooltipManager
 
 
 MAIN_WINDOW_TITLE = 'yt-dl GUI'
 SORT_DIALOG_TITLE = 'Sort Download directories'
 SORT_HELP_TEXT = 'Use this like a text editor, but don\'t break lines.'
+HISTORY_DIALOG_TITLE = 'Download history'
+HISTORY_HEADERS: [str] = ['Finished', 'Title', 'Video Format', 'Target Dir']
+HISTORY_PAGE_SIZE: int = 100
 TABLE_HEADERS: [str] = ['St.', 'URL / Title', 'Video Format', 'Target Dir']
+TABLE_COLUMNS: [str] = ['status', 'url', 'video_format', 'target_dir']
+TABLE_VISIBLE_ROWS: int = 15
 DOWNLOAD_STATUS_PREFIX: str = 'Download-Status: '
 
-DL_STATUS_WAITING: str = 'Waiting'
-DL_STATUS_RUNNING: str = 'Running'
-DL_STATUS_DONE: str = 'Done'
-DL_STATUS_ERROR: str = 'Error'
-
-ALL_DL_STATUS_VALUES: [str] = [DL_STATUS_WAITING, DL_STATUS_RUNNING, DL_STATUS_DONE, DL_STATUS_ERROR]
+STARTUP_STEP_QUEUE: str = 'queue'
+STARTUP_STEP_YT_DLP: str = 'yt-dlp'
 
 SYMBOL_HOURGLASS_NOT_DONE: str = '\u23f3'
 SYMBOL_PLAY: str = '\u25b6'
@@ -51,10 +56,15 @@ SYMBOL_GEAR: str = '\u2699'
 SYMBOL_FLOPPY: str = '\U0001f4Be'
 SYMBOL_OK: str = '\u2714'
 SYMBOL_CANCEL: str = '\U0001f5d9'
+SYMBOL_SCROLL: str = '\U0001f4dc'
+SYMBOL_PAGE: str = '\U0001f4c4'
+SYMBOL_LEFT_ARROW: str = '\u25c0'
+SYMBOL_RIGHT_ARROW: str = '\u25b6'
 
 STATUS_ICON_MAP: {} = {
     DL_STATUS_WAITING: SYMBOL_HOURGLASS_NOT_DONE,
     DL_STATUS_RUNNING: SYMBOL_PLAY,
+    DL_STATUS_POSTPROCESSING: SYMBOL_GEAR,
     DL_STATUS_DONE: SYMBOL_RACING_FINISH_FLAG,
     DL_STATUS_ERROR: SYMBOL_COLLISION
 }
@@ -62,30 +72,20 @@ STATUS_ICON_MAP: {} = {
 STATUS_TOOLTIP_MAP: {} = {
     DL_STATUS_WAITING: 'Waiting',
     DL_STATUS_RUNNING: 'Running',
+    DL_STATUS_POSTPROCESSING: 'Postprocessing',
     DL_STATUS_DONE: 'Done',
     DL_STATUS_ERROR: 'Error'
 }
 
-YOUTUBE_PREFIX: str = 'https://www.youtube.com/'
-
-RE_VIDEO_TITLE: re.Pattern[str] = re.compile('[0-9]{8} (.*) {2}[0-9]*x[0-9]* ')
-
-COLOR_FATAL: str = '\033[1;37;41m'
-COLOR_RESET: str = '\033[0m'
-
-STDOUT = sys.stdout
-
+UI_UPDATE_INTERVAL_MS: int = 100
+LOG_PANEL_HEIGHT: int = 10  # lines
+LOG_LEVEL_COLORS: {} = {
+    'WARNING': '#b35900',
+    'ERROR': 'red',
+    'CRITICAL': 'red'
+}
 
-def delimiter(title: str | None = None):
-    columns: int
-    try:
-        terminal_size = os.get_terminal_size(0)
-        columns = terminal_size.columns
-    except Exception as e:
-        columns = 80
-    prefix = '─── ' + title + ' ' if title is not None else ''
-    prefix_len: int = len(prefix)
-    print(prefix + ((columns - 1 - prefix_len) * '─'), file=STDOUT, flush=True)
+log: logging.Logger = logging.getLogger('yt_dl_gui')
 
 
 def select_all(widget):
@@ -93,119 +93,343 @@ def select_all(widget):
     return 'break'
 
 
-class Download:
-    def __init__(self, url: str, target_dir: str, video_format: str):
-        self.url: str = url
-        self.video_id: str = re.sub(r'.*[/=]', '', url)
-        self.title: str | None = None
-        self.target_dir: str = target_dir
-        self.video_format: str = video_format
-        self.status: str = DL_STATUS_WAITING
-
-
 class DownloadTable:
-    def __init__(self, parent, reset_handler, headers: [str]):
+    """
+    The queue of downloads, shown in a ttk.Treeview.
+    The Treeview only renders the visible rows, and each row is addressed by the URL of its download,
+    so adding, updating and removing rows does not depend on the number of queued downloads.
+    """
+    def __init__(self, parent, reset_handler, headers: [str], can_cancel: bool = False):
         self.reset_handler = reset_handler
         self.parent = parent
         self.total_columns = len(headers)
-        self.rows: [[Widget]] = []
         self.col_num_status: int = 0
         self.col_num_url: int = 1
-        col_num: int = 0
-        header_entries: [Widget] = []
-        for header in headers:
-            header_label: Label = Label(self.parent, text=header)
-            header_label.grid(row=0, column=col_num, sticky='w', padx=(0, 0), pady=(0, 0))
-            header_entries.append(header_label)
-            col_num += 1
-        self.rows.append(header_entries)
+        self.tree: ttk.Treeview = ttk.Treeview(self.parent,
+                                               columns=TABLE_COLUMNS,
+                                               show='headings',
+                                               height=TABLE_VISIBLE_ROWS,
+                                               selectmode='none')
+        for column_id, header in zip(TABLE_COLUMNS, headers):
+            self.tree.heading(column_id, text=header, anchor='w')
+        self.tree.column(TABLE_COLUMNS[0], width=40, minwidth=40, stretch=False, anchor='center')
+        self.tree.column(TABLE_COLUMNS[1], width=220, minwidth=80, stretch=False)
+        self.tree.column(TABLE_COLUMNS[2], width=100, minwidth=60, stretch=False)
+        self.tree.column(TABLE_COLUMNS[3], width=200, minwidth=80, stretch=True)
+        scrollbar: ttk.Scrollbar = ttk.Scrollbar(self.parent, orient='vertical', command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.grid(row=0, column=0, sticky='nsew')
+        scrollbar.grid(row=0, column=1, sticky='ns')
+        self.parent.columnconfigure(0, weight=1)
+        self.parent.rowconfigure(0, weight=1)
+
+        # the download of every row, the tooltip texts are taken from it when they are shown
+        self.downloads: dict[str, Download] = {}
+        # the last error message of a row, shown instead of its status
+        self.error_messages: dict[str, str] = {}
+        # one tooltip for the whole table, its text depends on the cell under the mouse pointer
+        self.tooltip_manager: TooltipManager = TooltipManager.of(self.tree)
+        self.hovered_cell: tuple[str, str] | None = None
+        self.tree.bind('<Motion>', self.on_motion, add='+')
+        self.tree.bind('<Leave>', self.on_leave, add='+')
+        self.tree.bind('<ButtonPress>', self.on_leave, add='+')
+        self.tree.bind('<Double-Button-1>', self.on_double_click)
+        # right click on a row to change its position in the queue
+        self.context_row: str | None = None
+        self.context_menu: Menu = Menu(self.tree, tearoff=0)
+        self.context_menu.add_command(label='Move to top', command=lambda: self.move_row(self.context_row, True))
+        self.context_menu.add_command(label='Move to bottom', command=lambda: self.move_row(self.context_row, False))
+        if can_cancel:
+            self.context_menu.add_separator()
+            self.context_menu.add_command(label='Cancel download', command=lambda: self.cancel_row(self.context_row))
+        self.tree.bind('<Button-3>', self.on_right_click)
 
     def add_row(self, dl: Download):
-        row_num: int = len(self.rows)
-        # print('add_row("' + dl.url + '") => row ', row_num)
-
-        column_0: Entry = Entry(self.parent, width=2, disabledbackground="white", disabledforeground="black")
-        column_0.grid(row=row_num, column=0, sticky='w', padx=(0, 0), pady=(0, 0))
-        column_0.insert(END, STATUS_ICON_MAP[dl.status])
-        column_0.configure(state='disabled')
-        column_0.tooltip = Tooltip(column_0, STATUS_TOOLTIP_MAP[dl.status], (5, 15))
-        column_0.bind('<Double-Button-1>', lambda v: self.reset_row(dl.url))
-
-        column_1: Entry = Entry(self.parent, width=20, disabledbackground="white", disabledforeground="black")
-        column_1.grid(row=row_num, column=1, sticky='w', padx=(0, 0), pady=(0, 0))
-        column_1.insert(END, dl.url)
-        column_1.configure(state='disabled')
-        tooltip_text: str = dl.video_id if dl.title is None or dl.title == '' else dl.title
-        column_1.tooltip = Tooltip(column_1, tooltip_text, (5, 15))
-
-        column_2: Entry = Entry(self.parent, width=8, disabledbackground="white", disabledforeground="black")
-        column_2.grid(row=row_num, column=2, sticky='w', padx=(0, 0), pady=(0, 0))
-        column_2.insert(END, dl.video_format)
-        column_2.configure(state='disabled')
-
-        column_3: Entry = Entry(self.parent, disabledbackground="white", disabledforeground="black")
-        column_3.grid(row=row_num, column=3, sticky='ew', padx=(0, 0), pady=(0, 0))
-        column_3.insert(END, dl.target_dir)
-        column_3.configure(state='disabled')
-
-        self.parent.columnconfigure(3, weight=1)
-        row_items: [Widget] = [column_0, column_1, column_2, column_3]
-        self.rows.append(row_items)
+        # print('add_row("' + dl.url + '")')
+        self.tree.insert('', END, iid=dl.url, values=(STATUS_ICON_MAP[dl.status], dl.url, dl.video_format, dl.target_dir))
+        self.downloads[dl.url] = dl
 
     def update_row(self, dl: Download, error_msg: str = None):
-        row_num: int = self.find_row(download=dl)
-        if row_num is not None:
-            # update status tooltip
-            status_entry: Entry = self.parent.grid_slaves(row=row_num, column=0)[0]
-            status_entry.configure(state='normal')
-            status_entry.delete(0, END)
-            status_entry.insert(END, STATUS_ICON_MAP[dl.status])
-            status_entry.configure(state='disabled')
-            status_tooltip_text = STATUS_TOOLTIP_MAP[dl.status] if error_msg is None else error_msg
-            status_entry.tooltip.text = status_tooltip_text
-            # update title tooltip
-            title_tooltip_text: str = dl.video_id if (dl.title is None or dl.title == '') else dl.title
-            url_entry: Entry = self.parent.grid_slaves(row=row_num, column=1)[0]
-            url_entry.tooltip.text = title_tooltip_text
+        row_id: str | None = self.find_row(download=dl)
+        if row_id is not None:
+            self.tree.set(row_id, TABLE_COLUMNS[self.col_num_status], STATUS_ICON_MAP[dl.status])
+            if error_msg is None:
+                # an update without a message (e.g. a new title) keeps the reason of an error
+                if dl.status != DL_STATUS_ERROR:
+                    self.error_messages.pop(row_id, None)
+            else:
+                self.error_messages[row_id] = error_msg
+
+    @staticmethod
+    def title_tooltip_text(dl: Download) -> str:
+        tooltip_text: str = dl.video_id if (dl.title is None or dl.title == '') else dl.title
+        details: [str] = []
+        if dl.filesize:
+            details.append(format_file_size(dl.filesize))
+        if dl.format_id:
+            details.append('format ' + dl.format_id)
+        if details:
+            tooltip_text += '\n' + ', '.join(details)
+        return tooltip_text
 
     def remove_row(self, dl: Download):
-        row_num: int = self.find_row(download=dl)
-        if row_num is not None:
-            widgets_to_delete = self.rows[row_num]
-            widgets_to_delete.reverse()
-            for widget in widgets_to_delete:
-                widget.grid_forget()
-                widget.destroy()
-            self.rows.pop(row_num)
-            while row_num < len(self.rows):
-                widgets_to_move_up = self.rows[row_num]
-                for widget_to_move_up in widgets_to_move_up:
-                    widget_to_move_up.grid(row=row_num)
-                row_num += 1
+        row_id: str | None = self.find_row(download=dl)
+        if row_id is not None:
+            self.tree.delete(row_id)
+            del self.downloads[row_id]
+            self.error_messages.pop(row_id, None)
 
     def reset_row(self, url: str):
         self.reset_handler.reset_download(url)
 
-    def find_row(self, download: Download) -> int | None:
-        row_num: int = 0
-        while row_num < len(self.rows):
-            row_num += 1
-            grid_slaves = self.parent.grid_slaves(row=row_num, column=1)
-            if grid_slaves:
-                url_entry: Entry = grid_slaves[0]
-                url: str = url_entry.get()
-                if url == download.url:
-                    return row_num
+    def move_row(self, url: str | None, to_top: bool):
+        if url is not None:
+            self.reset_handler.move_download(url, to_top)
+
+    def cancel_row(self, url: str | None):
+        if url is not None:
+            self.reset_handler.cancel_download(url)
+
+    def show_moved_row(self, dl: Download, to_top: bool):
+        row_id: str | None = self.find_row(download=dl)
+        if row_id is not None:
+            self.tree.move(row_id, '', 0 if to_top else END)
+
+    def find_row(self, download: Download) -> str | None:
+        return download.url if download.url in self.downloads else None
+
+    def hovered_cell_tooltip_text(self) -> str | None:
+        if self.hovered_cell is None:
+            return None
+        (row_id, column_id) = self.hovered_cell
+        dl: Download | None = self.downloads.get(row_id)
+        if dl is None:
+            return None
+        if column_id == '#' + str(self.col_num_status + 1):
+            return self.error_messages.get(row_id) or STATUS_TOOLTIP_MAP[dl.status]
+        if column_id == '#' + str(self.col_num_url + 1):
+            return self.title_tooltip_text(dl)
         return None
 
-
-class YtDlGUI:
-    def __init__(self, parent):
+    def on_motion(self, event):
+        row_id: str = self.tree.identify_row(event.y)
+        column_id: str = self.tree.identify_column(event.x)
+        cell: tuple[str, str] | None = (row_id, column_id) if row_id else None
+        if cell == self.hovered_cell:
+            return
+        self.hovered_cell = cell
+        if cell is None:
+            self.tooltip_manager.hide(self.tree)
+        else:
+            # the text is looked up when the tooltip is shown, so it is always the current one
+            self.tooltip_manager.schedule(self.tree, self.hovered_cell_tooltip_text, (5, 15))
+
+    def on_leave(self, event):
+        self.hovered_cell = None
+        self.tooltip_manager.hide(self.tree)
+
+    def on_double_click(self, event):
+        row_id: str = self.tree.identify_row(event.y)
+        column_id: str = self.tree.identify_column(event.x)
+        if row_id and column_id == '#' + str(self.col_num_status + 1):
+            self.reset_row(row_id)
+
+    def on_right_click(self, event):
+        row_id: str = self.tree.identify_row(event.y)
+        if not row_id:
+            return
+        self.context_row = row_id
+        self.tooltip_manager.hide(self.tree)
+        self.context_menu.tk_popup(event.x_root, event.y_root)
+
+
+class HistoryDialog:
+    """
+    Shows the download history one page at a time, so only HISTORY_PAGE_SIZE entries are loaded at once,
+    no matter how long it is. The search looks for the text in the titles, URLs and target dirs.
+    Parameters:
+    * parent: the main window
+    * history: the history of the engine
+    * icon: the window icon, if any
+    """
+    def __init__(self, parent, history: DownloadHistory, icon: PhotoImage | None):
+        self.history: DownloadHistory = history
+        self.offset: int = 0
+        self.total: int = 0
+        self.window: Toplevel = Toplevel(parent)
+        if icon is not None:
+            self.window.iconphoto(False, icon)
+        self.window.title(HISTORY_DIALOG_TITLE)
+
+        search_frame: Frame = Frame(self.window)
+        Label(search_frame, text='Search').pack(side='left', padx=(6, 6))
+        self.search_var: StringVar = StringVar()
+        search_entry: Entry = Entry(search_frame, textvariable=self.search_var, width=40)
+        search_entry.bind('<Return>', lambda e: self.show_page(0))
+        search_entry.bind("<Control-a>", lambda e: select_all(e.widget))
+        search_entry.pack(side='left', fill='x', expand=True)
+        search_frame.pack(fill='x', pady=(6, 6))
+
+        table_frame: Frame = Frame(self.window)
+        self.tree: ttk.Treeview = ttk.Treeview(table_frame, columns=HISTORY_HEADERS, show='headings',
+                                               height=TABLE_VISIBLE_ROWS, selectmode='browse')
+        for header in HISTORY_HEADERS:
+            self.tree.heading(header, text=header, anchor='w')
+        self.tree.column(HISTORY_HEADERS[0], width=130, minwidth=80, stretch=False)
+        self.tree.column(HISTORY_HEADERS[1], width=300, minwidth=80, stretch=True)
+        self.tree.column(HISTORY_HEADERS[2], width=100, minwidth=60, stretch=False)
+        self.tree.column(HISTORY_HEADERS[3], width=200, minwidth=80, stretch=True)
+        scrollbar: ttk.Scrollbar = ttk.Scrollbar(table_frame, orient='vertical', command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.grid(row=0, column=0, sticky='nsew')
+        scrollbar.grid(row=0, column=1, sticky='ns')
+        table_frame.columnconfigure(0, weight=1)
+        table_frame.rowconfigure(0, weight=1)
+        table_frame.pack(fill='both', expand=True, padx=(6, 6))
+
+        buttons_frame: Frame = Frame(self.window)
+        self.previous_button: Button = Button(master=buttons_frame, text=SYMBOL_LEFT_ARROW, padx=3, pady=1,
+                                              command=lambda: self.show_page(self.offset - HISTORY_PAGE_SIZE))
+        self.previous_button.pack(side='left')
+        self.page_label: Label = Label(master=buttons_frame)
+        self.page_label.pack(side='left', padx=(6, 6))
+        self.next_button: Button = Button(master=buttons_frame, text=SYMBOL_RIGHT_ARROW, padx=3, pady=1,
+                                          command=lambda: self.show_page(self.offset + HISTORY_PAGE_SIZE))
+        self.next_button.pack(side='left')
+        buttons_frame.pack(pady=(6, 6))
+
+        search_entry.focus_set()
+        self.show_page(0)
+
+    def show_page(self, offset: int):
+        search: str = self.search_var.get().strip()
+        self.total = self.history.count(search)
+        self.offset = max(0, min(offset, (self.total - 1) // HISTORY_PAGE_SIZE * HISTORY_PAGE_SIZE))
+        self.tree.delete(*self.tree.get_children())
+        for entry in self.history.page(search, self.offset, HISTORY_PAGE_SIZE):
+            finished: str = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['finished_at'] or 0))
+            self.tree.insert('', END, values=(finished, entry['title'] or entry['url'], entry['video_format'],
+                                              entry['target_dir']))
+        if self.total == 0:
+            self.page_label.configure(text='No downloads')
+        else:
+            self.page_label.configure(text='%d - %d of %d' % (self.offset + 1, min(self.offset + HISTORY_PAGE_SIZE, self.total),
+                                                             self.total))
+        self.previous_button.configure(state='normal' if self.offset > 0 else 'disabled')
+        self.next_button.configure(state='normal' if self.offset + HISTORY_PAGE_SIZE < self.total else 'disabled')
+
+
+class LogPanel:
+    """
+    Shows the latest log records from the ring buffer of the log pipeline, below the status bar.
+    It only reads the buffer while it is shown, and keeps as many lines as the buffer.
+    Parameters:
+    * parent: the frame to show it in
+    * buffer: the ring buffer of the log pipeline
+    """
+    def __init__(self, parent, buffer: RingBufferHandler):
         self.parent = parent
-        self.settings = self._read_config()
-        self.download_archive_filename = self.settings['download_archive']
+        self.buffer: RingBufferHandler = buffer
+        self.sequence: int = 0
+        self.lines: int = 0
+        self.text: Text = Text(parent, height=LOG_PANEL_HEIGHT, wrap='none', state='disabled')
+        for level, color in LOG_LEVEL_COLORS.items():
+            self.text.tag_configure(level, foreground=color)
+        scrollbar: ttk.Scrollbar = ttk.Scrollbar(parent, orient='vertical', command=self.text.yview)
+        self.text.configure(yscrollcommand=scrollbar.set)
+        self.text.grid(row=0, column=0, sticky='nsew')
+        scrollbar.grid(row=0, column=1, sticky='ns')
+        parent.columnconfigure(0, weight=1)
+
+    def update(self):
+        """
+        Appends the records that were added since the last call. Must only be called from the Tk main loop.
+        """
+        (self.sequence, records) = self.buffer.records_since(self.sequence)
+        if not records:
+            return
+        # only follow the end if it is shown
+        follow: bool = self.text.yview()[1] >= 1.0
+        self.text.configure(state='normal')
+        for level, text in records:
+            self.text.insert(END, text + '\n', level)
+        self.lines += len(records)
+        excess: int = self.lines - self.buffer.records.maxlen
+        if excess > 0:
+            self.text.delete('1.0', '%d.0' % (excess + 1))
+            self.lines -= excess
+        self.text.configure(state='disabled')
+        if follow:
+            self.text.see(END)
+
+
+class YtDlGUI(EngineListener):
+    """
+    The Tk window on top of a DownloadEngine.
+    Parameters:
+    * parent: the Tk root window
+    * commandline_args: the parsed command line
+    """
+    def __init__(self, parent, commandline_args: Namespace):
+        self.parent = parent
+        self.commandline_args: Namespace = commandline_args
+        (self.config_file, self.settings) = read_config()
+        # the output goes to the console, the log file and the log panel, without blocking the engine threads
+        self.log_pipeline: LogPipeline = start_logging(self.settings, self.config_file)
         self.window_icon: PhotoImage | None = None
+        # everything that is done after the window is shown, the program is ready when all of it is done
+        self.startup_steps_pending: set[str] = {STARTUP_STEP_QUEUE, STARTUP_STEP_YT_DLP}
+
+        self.engine: DownloadEngine = DownloadEngine(self.settings, self.config_file, self,
+                                                     max_concurrent_downloads=commandline_args.workers,
+                                                     use_journal=not commandline_args.ui_test,
+                                                     execution_mode=commandline_args.execution_mode)
+        self.video_formats: [] = self.engine.video_formats
+        # The engine threads never call Tk themselves. They post row updates into ui_events,
+        # respectively other calls into ui_calls, and set status_dirty.
+        # The Tk main loop applies all of it every UI_UPDATE_INTERVAL_MS, see process_ui_events().
+        self.ui_events: queue.SimpleQueue = queue.SimpleQueue()
+        # other functions to be called in the Tk main loop
+        self.ui_calls: queue.SimpleQueue = queue.SimpleQueue()
+        self.status_dirty: bool = False
+
+        self.preselected_format: str | None = None
+        self.buttons = []
+        self._init_ui()
+        self.parent.bind('<Map>', self._on_first_map)
+
+    def _on_first_map(self, event):
+        """
+        The window is shown: everything that is not needed for that is done from now on.
+        """
+        if event.widget is not self.parent:
+            return
+        self.parent.unbind('<Map>')
+        if self.commandline_args.profile_startup:
+            print('Startup: window shown after %.3f s' % (time.perf_counter() - STARTUP_TIME))
+        self.parent.after(1, self._deferred_init)
+
+    def _deferred_init(self):
+        self._load_icon()
+        # restoring a long queue takes a moment, and the downloads need yt_dlp anyway
+        self.engine.start(start_workers=not self.commandline_args.no_download and not self.commandline_args.ui_test)
+        self._startup_step_done(STARTUP_STEP_QUEUE)
+        if self.commandline_args.ui_test:
+            self._startup_step_done(STARTUP_STEP_YT_DLP)
+        else:
+            self.engine.warm_up(
+                lambda duration: self.ui_calls.put(lambda: self._startup_step_done(STARTUP_STEP_YT_DLP, duration)))
+
+    def _startup_step_done(self, step: str, duration: float | None = None):
+        self.startup_steps_pending.discard(step)
+        if not self.commandline_args.profile_startup:
+            return
+        if duration is not None:
+            print('Startup: %s loaded in %.3f s' % (step, duration))
+        if not self.startup_steps_pending:
+            print('Startup: ready after %.3f s' % (time.perf_counter() - STARTUP_TIME))
 
+    def _load_icon(self):
         icon_filename: str = self.settings['icon']
         if icon_filename is not None:
             # icon filename can be absolute (i.e. start with e.g. a '/',
@@ -213,49 +437,7 @@ class YtDlGUI:
             if not icon_filename.startswith(os.sep):
                 icon_filename = str(os.path.dirname(__file__)) + os.sep + icon_filename
             self.window_icon = PhotoImage(file=icon_filename)
-            root.iconphoto(False, self.window_icon)
-
-        self.video_formats: [] = self.settings['video_formats']
-        self.target_dirs: [] = self.settings['target_dirs']
-        self.temp_dir = self.settings['temp_dir']
-        self.active_download: Download | None = None
-
-        if not os.path.exists(self.temp_dir):
-            os.makedirs(self.temp_dir)
-
-        self.download_queue: [Download] = []
-
-        self.do_stop: bool = False
-        self.preselected_format: str | None = None
-        self.buttons = []
-        self._init_ui()
-
-        # ensure that "postprocessing" is there and has all entries, so we don't need to check during runtime
-        if 'postprocessing' not in self.settings:
-            self.settings['postprocessing'] = {}
-        postprocessing_settings = self.settings['postprocessing']
-        if 'underscores_to_spaces' not in postprocessing_settings:
-            postprocessing_settings['underscores_to_spaces'] = False
-        if 'remove_at_sign' not in postprocessing_settings:
-            postprocessing_settings['remove_at_sign'] = False
-        if 'add_newlines_to_description' not in postprocessing_settings:
-            postprocessing_settings['add_newlines_to_description'] = False
-        if 'delete_empty_description' not in postprocessing_settings:
-            postprocessing_settings['delete_empty_description'] = False
-        if 'rename_description' not in postprocessing_settings:
-            postprocessing_settings['rename_description'] = False
-        if 'rename_description_suffix' not in postprocessing_settings:
-            postprocessing_settings['rename_description_suffix'] = '.txt'
-        if 'add_tumb' not in postprocessing_settings:
-            postprocessing_settings['add_tumb'] = False
-        if 'subtitles_dots_to_underscores' not in postprocessing_settings:
-            postprocessing_settings['subtitles_dots_to_underscores'] = False
-
-    def _read_config(self):
-        self.config_file = os.path.dirname(__file__) + os.sep + 'yt_dl_gui.json'
-        with open(self.config_file, 'r') as in_file:
-            settings = json.load(in_file)
-        return settings
+            self.parent.iconphoto(False, self.window_icon)
 
     def _init_ui(self):
         self.parent.title(MAIN_WINDOW_TITLE)
@@ -285,7 +467,7 @@ class YtDlGUI:
         self.label_target_dir.grid(row=row_num, column=0, sticky='w', padx=(6, 6))
         self.entry_target_dir = ttk.Combobox(master=self.parent,
                                              state='readonly',
-                                             values=self.target_dirs)
+                                             values=self.engine.target_dirs)
         self.entry_target_dir.grid(row=row_num, column=1, sticky='nsew', padx=(6, 6))
         self.entry_target_dir.bind("<<ComboboxSelected>>", self.dir_selection_changed)
         self.entry_target_dir.current(0)
@@ -336,8 +518,19 @@ class YtDlGUI:
         cleanup_button = Button(master=dl_buttons_frame,
                                 text=SYMBOL_WASTEBASKET,
                                 command=self.cleanup_queue)
-        cleanup_button.tooltip = Tooltip(cleanup_button, 'Remove finished downloads from table', (15, 15))
+        cleanup_button.tooltip = Tooltip(cleanup_button, 'Move finished downloads from table to history', (15, 15))
         cleanup_button.pack(side='left')
+        if self.engine.history is not None:
+            history_button = Button(master=dl_buttons_frame,
+                                    text=SYMBOL_SCROLL,
+                                    command=self.show_history)
+            history_button.tooltip = Tooltip(history_button, 'Show history of finished downloads', (15, 15))
+            history_button.pack(side='left')
+        log_button = Button(master=dl_buttons_frame,
+                            text=SYMBOL_PAGE,
+                            command=self.toggle_log_panel)
+        log_button.tooltip = Tooltip(log_button, 'Show / hide log', (15, 15))
+        log_button.pack(side='left')
 
         add_icon_label = Label(master=dl_buttons_frame,
                                text=SYMBOL_DOWN_ARROW,
@@ -359,19 +552,19 @@ class YtDlGUI:
         row_num += 1
 
         self.table_frame: Frame = Frame(master=self.parent)
-        self.table_frame.grid(row=row_num, column=0, columnspan=3, sticky='ew', padx=(6, 6))
-        self.download_table: DownloadTable = DownloadTable(self.table_frame, self, TABLE_HEADERS)
+        self.table_frame.grid(row=row_num, column=0, columnspan=3, sticky='nsew', padx=(6, 6))
+        self.parent.rowconfigure(row_num, weight=1)
+        self.download_table: DownloadTable = DownloadTable(
+            self.table_frame, self, TABLE_HEADERS, can_cancel=self.engine.execution_mode == EXECUTION_MODE_PROCESS)
 
-        self.downloader_event: threading.Event = threading.Event()
-        self.downloader_event.clear()
-        self.processor = Thread(target=self.process_queue, daemon=True)
-        if commandline_args.ui_test:
+        if self.commandline_args.ui_test:
             i: int = 0
             while i < 9:
                 i += 1
-                dl: Download = Download('watch?v=' + 11 * str(i), 'Title ' + str(i), self.target_dirs[0], 'NO LIMIT')
+                dl: Download = Download('watch?v=' + 11 * str(i), self.engine.target_dirs[0], 'NO LIMIT')
+                dl.title = 'Title ' + str(i)
                 dl.status = ALL_DL_STATUS_VALUES[i % len(ALL_DL_STATUS_VALUES)]
-                self.download_queue.append(dl)
+                self.engine.download_queue.add(dl)
                 self.download_table.add_row(dl)
 
         row_num += 1
@@ -381,99 +574,128 @@ class YtDlGUI:
         self.status_label = Label(master=self.status_frame, anchor='w', relief='sunken', text=DOWNLOAD_STATUS_PREFIX)
         self.status_label.pack(fill='x', padx=(0, 0), pady=(0, 0))
 
-        if not commandline_args.no_download and not commandline_args.ui_test:
-            self.processor.start()
+        row_num += 1
+
+        # hidden until the log button is used
+        self.log_frame: Frame = Frame(master=self.parent)
+        self.log_frame_row: int = row_num
+        self.log_panel: LogPanel = LogPanel(self.log_frame, self.log_pipeline.buffer)
 
         self.entry_url.focus()
+        self.parent.after(UI_UPDATE_INTERVAL_MS, self.process_ui_events)
+
+    def downloads_added(self, downloads: [Download]):
+        if threading.current_thread() is threading.main_thread():
+            for dl in downloads:
+                self.download_table.add_row(dl)
+        else:
+            self.ui_calls.put(lambda: self.downloads_added(downloads))
+
+    def downloads_removed(self, downloads: [Download]):
+        if threading.current_thread() is threading.main_thread():
+            for dl in downloads:
+                self.download_table.remove_row(dl)
+        else:
+            self.ui_calls.put(lambda: self.downloads_removed(downloads))
+
+    def download_changed(self, dl: Download, error_msg: str | None = None):
+        self.ui_events.put((dl, error_msg))
+
+    def download_moved(self, dl: Download, to_top: bool):
+        if threading.current_thread() is threading.main_thread():
+            self.download_table.show_moved_row(dl, to_top)
+        else:
+            self.ui_calls.put(lambda: self.download_moved(dl, to_top))
+
+    def status_changed(self):
+        self.status_dirty = True
+
+    def process_ui_events(self):
+        """
+        Runs in the Tk main loop. Applies everything the engine threads requested since the last call,
+        only the latest update of every row and of the status bar is applied.
+        """
+        try:
+            row_updates: dict[str, tuple[Download, str | None]] = {}
+            while True:
+                try:
+                    (dl, error_msg) = self.ui_events.get_nowait()
+                except queue.Empty:
+                    break
+                row_updates[dl.url] = (dl, error_msg)
+            while True:
+                try:
+                    ui_call = self.ui_calls.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    ui_call()
+                except Exception:
+                    log.exception('UI update failed')
+            for (dl, error_msg) in row_updates.values():
+                try:
+                    self.download_table.update_row(dl, error_msg)
+                except Exception:
+                    log.exception('Updating the row of %s failed' % dl.url)
+            if self.status_dirty:
+                self._update_status_label()
+            if self.log_frame.winfo_ismapped():
+                self.log_panel.update()
+        finally:
+            # an error must not stop the updates for good
+            self.parent.after(UI_UPDATE_INTERVAL_MS, self.process_ui_events)
 
     def drop_url(self, data):
         self.entry_url.delete(0, END)
         return self.entry_url.insert(END, data)
 
     def reset_download(self, url: str):
-        queue_element: Download
-        for queue_element in self.download_queue:
-            if queue_element.url == url:
-                if queue_element.status == DL_STATUS_ERROR:
-                    queue_element.status = DL_STATUS_WAITING
-                    self.download_table.update_row(queue_element)
-                    file_names: list = glob.glob(queue_element.target_dir + os.sep + '*' + queue_element.video_id + '*')
-                    if len(file_names) > 0:
-                        for file_name in file_names:
-                            os.remove(file_name)
-                self.downloader_event.set()
-                break
+        self.engine.reset_download(url)
+
+    def move_download(self, url: str, to_top: bool):
+        self.engine.move_download(url, to_top)
+
+    def cancel_download(self, url: str):
+        self.engine.cancel_download(url)
 
     def cleanup_queue(self):
-        dl: Download
-        download_queue_remaining: [Download] = []
-        self.download_queue.reverse()
-        for dl in self.download_queue:
-            if dl.status == DL_STATUS_DONE:
-                self.download_table.remove_row(dl)
-            else:
-                download_queue_remaining.append(dl)
-        download_queue_remaining.reverse()
-        self.download_queue.clear()
-        self.download_queue.extend(download_queue_remaining)
+        self.engine.cleanup_queue()
+
+    def show_history(self):
+        self.history_dialog: HistoryDialog = HistoryDialog(self.parent, self.engine.history, self.window_icon)
+
+    def toggle_log_panel(self):
+        if self.log_frame.winfo_manager():
+            self.log_frame.grid_forget()
+        else:
+            self.log_frame.grid(row=self.log_frame_row, column=0, columnspan=4, sticky='ew', padx=(0, 0), pady=(6, 0))
+            self.log_panel.update()
 
     def on_closing(self):
-        print('Main window closed.')
-        self.do_stop = True
+        log.info('Main window closed.')
+        self.engine.stop()
 
     def cleanup_url(self):
         url: str = self.entry_url.get()
         if not url:
             return
+        if is_bulk_input(url):
+            # several URLs or a playlist, they are cleaned up when they are ingested
+            return
         # remove additional parameters from URL
         url = re.sub(r'&.*', '', url)
         # also clear from entry
         self.entry_url.delete(len(url), END)
 
     def can_download(self, video_format: str = None) -> bool:
-        url: str = self.entry_url.get()
-        if not url:
-            return False
-        if YOUTUBE_PREFIX not in url or url.index(YOUTUBE_PREFIX) != 0:
-            return False
-        dir_selection: str = self.entry_target_dir.get()
-        if dir_selection not in self.target_dirs:
-            return False
-
-        # check if video_format is in catalog
-        if video_format is not None:
-            matching_video_formats: [[str, str]] = [entry for entry in self.video_formats if entry[0] == video_format]
-            if len(matching_video_formats) != 1:
-                return False
-
-        video_id: str = url[-11:]
-
-        # check if video_id is already in queue
-        queue_element: Download
-        for queue_element in self.download_queue:
-            if video_id in queue_element.url:
-                return False
-
-        if os.path.exists(dir_selection) and os.path.isdir(dir_selection):
-            # check for existing files
-            files: list = glob.glob(dir_selection + os.sep + '*' + video_id + '*')
-            if len(files) > 0:
-                return False
-
-            # check for entry in archive file
-            archive_file = dir_selection + os.sep + self.download_archive_filename
-            if os.path.exists(archive_file):
-                with open(archive_file) as in_file:
-                    lines = in_file.read().splitlines()
-                    in_file.close()
-                if 'youtube ' + video_id in lines:
-                    return False
-        return True
+        return self.engine.can_download(self.entry_url.get(), self.entry_target_dir.get(), video_format)
 
     def url_changed(self, *args):
         self.cleanup_url()
         if self.preselected_format:
-            if self.can_download(self.preselected_format):
+            if is_bulk_input(self.entry_url.get()):
+                self.ingest_urls(self.preselected_format)
+            elif self.can_download(self.preselected_format):
                 self.add_download_to_queue(self.preselected_format)
             else:
                 self.entry_url.delete(0, END)
@@ -488,7 +710,10 @@ class YtDlGUI:
             for button in self.buttons:
                 if button['text'] == video_format:
                     button.configure(relief='sunken')
-            self.add_download_to_queue(video_format)
+            if is_bulk_input(url):
+                self.ingest_urls(video_format)
+            else:
+                self.add_download_to_queue(video_format)
             for button in self.buttons:
                 button.configure(relief='raised')
         else:
@@ -505,14 +730,20 @@ class YtDlGUI:
     def add_download_to_queue(self, video_format: str):
         url = self.entry_url.get()
         if url is not None and url.index(YOUTUBE_PREFIX) == 0:
-            url = url[len(YOUTUBE_PREFIX):]
             target_dir = self.entry_target_dir.get()
-            dl: Download = Download(url, target_dir, video_format)
             self.entry_url.delete(0, END)
             self.entry_url.focus()
-            self.download_queue.append(dl)
-            self.download_table.add_row(dl)
-            self.downloader_event.set()
+            self.engine.add_download(url, target_dir, video_format)
+
+    def ingest_urls(self, video_format: str):
+        """
+        Queues all videos of the URLs in the URL entry, which can be several ones and / or playlists and channels.
+        """
+        urls: [str] = parse_urls(self.entry_url.get())
+        target_dir: str = self.entry_target_dir.get()
+        self.entry_url.delete(0, END)
+        self.entry_url.focus()
+        self.engine.ingest_urls(urls, target_dir, video_format)
 
     def add_download_dir(self):
         target_dir: str = self.entry_target_dir.get()
@@ -520,23 +751,23 @@ class YtDlGUI:
         cwd: str = os.getcwd()
         if directory.startswith(cwd):
             directory = directory[len(cwd) + 1:]
-        if directory in self.target_dirs:
+        if directory in self.engine.target_dirs:
             return
-        self.target_dirs.append(directory)
-        self.entry_target_dir['values'] = self.target_dirs
-        self.entry_target_dir.current(self.target_dirs.index(directory))
+        self.engine.target_dirs.append(directory)
+        self.entry_target_dir['values'] = self.engine.target_dirs
+        self.entry_target_dir.current(self.engine.target_dirs.index(directory))
 
     def remove_download_dir(self):
-        if len(self.target_dirs) < 2:
+        if len(self.engine.target_dirs) < 2:
             # do not remove the last remaining dir
             return
         target_dir: str = self.entry_target_dir.get()
-        self.target_dirs.remove(target_dir)
-        self.entry_target_dir['values'] = self.target_dirs
+        self.engine.target_dirs.remove(target_dir)
+        self.entry_target_dir['values'] = self.engine.target_dirs
         self.entry_target_dir.current(0)
 
     def sort_download_dirs(self):
-        self.dialog_window: Toplevel = Toplevel(root)
+        self.dialog_window: Toplevel = Toplevel(self.parent)
         if self.window_icon is not None:
             self.dialog_window.iconphoto(False, self.window_icon)
         self.dialog_window.title(SORT_DIALOG_TITLE)
@@ -546,7 +777,7 @@ class YtDlGUI:
         label.pack(side='left')
         label_frame.pack(fill='x', expand=True)
         self.edit_dirs_text: Text = Text(self.dialog_window, width=40, height=15)
-        self.edit_dirs_text.insert(END, '\n'.join(self.target_dirs))
+        self.edit_dirs_text.insert(END, '\n'.join(self.engine.target_dirs))
         self.edit_dirs_text.pack(fill='both', expand=True)
         self.edit_dirs_text.focus_set()
         buttons_frame: Frame = Frame(self.dialog_window)
@@ -571,8 +802,8 @@ class YtDlGUI:
     def sort_download_dirs_ok(self):
         edit_text: str = self.edit_dirs_text.get('1.0',END)
         target_dirs: [str] = edit_text.split('\n')
-        self.target_dirs = [ target_dir for target_dir in target_dirs if target_dir != '' ]
-        self.entry_target_dir['values'] = self.target_dirs
+        self.engine.target_dirs = [ target_dir for target_dir in target_dirs if target_dir != '' ]
+        self.entry_target_dir['values'] = self.engine.target_dirs
         self.entry_target_dir.current(0)
         self.dialog_window.destroy()
 
@@ -580,163 +811,61 @@ class YtDlGUI:
         self.dialog_window.destroy()
 
     def save_config(self):
-        self.settings['target_dirs'] = self.target_dirs
+        self.settings['target_dirs'] = self.engine.target_dirs
         json_string = json.dumps(obj=self.settings, indent=4, sort_keys=False) + '\n'
         # we want to have a newline at the end of the file.
         with open(self.config_file, 'w') as out_file:
             out_file.write(json_string)
 
-    def process_queue(self):
-        print('Downloader thread started.')
-        while not self.do_stop:
-            # print('Waiting for processing queue to be released ...')
-            self.downloader_event.wait()
-            print('Processing queue.')
-            count_waiting: int = 0
-            queue_element: Download
-            for queue_element in self.download_queue:
-                if queue_element.status == DL_STATUS_WAITING:
-                    queue_element.status = DL_STATUS_RUNNING
-                    self.download_table.update_row(queue_element)
-                    try:
-                        self.active_download = queue_element
-                        (rc, video_title) = self.do_download(YOUTUBE_PREFIX + queue_element.url,
-                                                             queue_element.target_dir,
-                                                             queue_element.video_format)
-                        if rc == 0:
-                            queue_element.status = DL_STATUS_DONE
-                            if video_title is not None:
-                                queue_element.title = video_title
-                        else:
-                            queue_element.status = DL_STATUS_ERROR
-                        self.download_table.update_row(queue_element)
-                    except Exception as e:
-                        queue_element.status = DL_STATUS_ERROR
-                        self.download_table.update_row(queue_element, repr(e))
-                    finally:
-                        self.active_download = None
-                        self.status_label.configure(text=DOWNLOAD_STATUS_PREFIX)
-
-                    count_waiting = len([dl for dl in self.download_queue if dl.status == DL_STATUS_WAITING])
-                    if count_waiting > 0:
-                        self.status_label.configure(text=DOWNLOAD_STATUS_PREFIX + 'wait a bit before next download ...')
-                        sleep_time = random.uniform(1.5, 5.5)
-                        time.sleep(sleep_time)
-                        self.status_label.configure(text=DOWNLOAD_STATUS_PREFIX)
-                    break
-            if count_waiting == 0:
-                self.downloader_event.clear()
-                delimiter('Nothing to download, waiting ...')
-        print('Downloader thread ended.')
-
-    def progress_hook(self, response):
-        # print('Progress hook called:', response['_default_template'])
-        status_text = response['_default_template']
-        status_text = re.sub(r'\x1b\[[0-9;]*m', '', status_text)  # remove coloring escape sequences
+    def _update_status_label(self):
+        """
+        Shows the progress of all in-flight downloads, or the idle text if nothing is running.
+        Must only be called from the Tk main loop.
+        """
+        # reset before taking the snapshot, so a change in between is shown with the next update
+        self.status_dirty = False
+        (section_texts, progress_texts, idle_text) = self.engine.status_snapshot()
+        status_texts: [str] = ['[' + video_id + '] ' + re.sub(r'\x1b\[[0-9;]*m', '', text)  # remove coloring escape sequences
+                               for video_id, text in progress_texts]
+        if not status_texts and idle_text:
+            status_texts = [idle_text]
+        status_text: str = ' | '.join(section_texts + status_texts)
         self.status_label.configure(text=DOWNLOAD_STATUS_PREFIX + status_text)
 
-    def do_download(self, url: str, target_dir: str, video_format: str) -> (int, str | None):
-        video_id: str = url.replace('https://www.youtube.com/watch?v=', '')
-        video_id: str = video_id.replace('https://www.youtube.com/shorts/', '')
-        delimiter(video_id)
-        cwd: str = os.getcwd() + os.sep
-
-        print('Download ' + url + ' [' + video_format + '] => ' + target_dir + ' ...')
-        if not os.path.exists(target_dir):
-            os.makedirs(target_dir)
-
-        yt_dl_params: {} = self.settings['yt_dl_params'].copy()
-        # keep the yt_dl_params from settings unchanged because they will be reused
-
-        archive_file = target_dir + os.sep + self.download_archive_filename
-        yt_dl_params['download_archive'] = archive_file
-        yt_dl_params['paths'] = {
-            "temp": cwd + self.temp_dir,
-            "home": cwd + target_dir
-        }
-        selected_video_formats: [[str, str]] = [entry for entry in self.video_formats if entry[0] == video_format]
-        video_format: str = selected_video_formats[0][1]
-        # print('video_format:', video_format, 'video_format', video_format)
-        yt_dl_params['format'] = video_format
-
-        # with open('yt_dl_fe_debug_settings.json', 'w') as out_file:
-        #     out_file.write(json.dumps(obj=self.settings, indent=4, sort_keys=False) + '\n')
-        # with open('yt_dl_fe_debug_params.json', 'w') as out_file:
-        #     out_file.write(json.dumps(obj=yt_dl_params, indent=4, sort_keys=False) + '\n')
-
-        yt_dl = yt.YoutubeDL(params=yt_dl_params, auto_init=True)
-        yt_dl.add_progress_hook(self.progress_hook)
-        dl_rc: int = yt_dl.download(url)
-        video_title: str | None = None
-        if dl_rc == 0:
-            video_title = self.do_post_processing(video_id, target_dir)
-            print("Postprocessing done.")
-        return dl_rc, video_title
-
-    def do_post_processing(self, video_id, target_dir) -> str | None:
-        print()
-        print("Download done.")
-        print('video_id = ' + video_id)
-        video_title_old: str | None = None
-        video_title_new: str | None = None
-        file_names: list = glob.glob(target_dir + os.sep + '*' + video_id + '*')
-        postprocessing_settings = self.settings['postprocessing']
-        if len(file_names) > 0:
-            re_list: list[Any] = RE_VIDEO_TITLE.findall(file_names[0])
-            if len(re_list) > 0:
-                for re_item in re_list:
-                    video_title_old = re_item
-                    video_title_new = video_title_old
-                    if postprocessing_settings['underscores_to_spaces']:
-                        video_title_new = video_title_new.replace('_', ' ')
-                    if postprocessing_settings['remove_at_sign']:
-                        video_title_new = re.sub(r'^@', '', video_title_new)
-                    # print('video_title old = ' + video_title_old)
-                    # print('video_title new = ' + video_title_new)
-        for file_name in file_names:
-            if video_id + '.description' in file_name:
-                size = os.path.getsize(file_name)
-                if size > 0:
-                    if postprocessing_settings['add_newlines_to_description']:
-                        # add 2 newlines
-                        with open(file_name, 'a') as description_file:
-                            description_file.write('\n\n')
-                            description_file.close()
-                elif postprocessing_settings['delete_empty_description']:
-                    print('description is empty.')
-                    os.remove(file_name)
-                    continue
-            if video_title_old is not None:
-                file_name_new = file_name.replace(video_title_old, video_title_new)
-                if postprocessing_settings['rename_description']:
-                    file_name_new = file_name_new.replace('.description', postprocessing_settings['rename_description_suffix'])
-                if postprocessing_settings['add_tumb']:
-                    file_name_new = file_name_new.replace('.jpg', '_thumb.jpg')
-                    file_name_new = file_name_new.replace('.png', '_thumb.png')
-                    file_name_new = file_name_new.replace('.webp', '_thumb.webp')
-                if postprocessing_settings['subtitles_dots_to_underscores']:
-                    file_name_new = re.sub(r'\.(..)\.vtt', r'_\1.vtt', file_name_new)
-                os.rename(file_name, file_name_new)
-                # old debugging stuff
-                # print()
-                # print('video_title_old :', video_title_old)
-                # print('video_title_new :', video_title_new)
-                # print('file_name       :', file_name)
-                # print('file_name_new   :', file_name_new)
-
-        return video_title_new
-
-
-parser: ArgumentParser = ArgumentParser(description='Simple GUI for yt-dlp')
-
-parser.add_argument('-n', '--no-download', action='store_true', help='No actual download, e.g. for testing the button mechanics')
-parser.add_argument('-u', '--ui-test', action='store_true', help='No actual download, plus dummy table entries for layout test')
-parser.parse_args()
-
-commandline_args: Namespace = parser.parse_args()
-
-root = TkinterDnD.Tk()
-dl_gui = YtDlGUI(root)
-
-# root.protocol("WM_DELETE_WINDOW", dl_gui.on_closing())
-root.mainloop()
+
+def main():
+    parser: ArgumentParser = ArgumentParser(description='Simple GUI for yt-dlp')
+
+    parser.add_argument('-n', '--no-download', action='store_true', help='No actual download, e.g. for testing the button mechanics')
+    parser.add_argument('-u', '--ui-test', action='store_true', help='No actual download, plus dummy table entries for layout test')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='Number of parallel downloads, overrides "max_concurrent_downloads" from the configuration')
+    parser.add_argument('--execution-mode', choices=ALL_EXECUTION_MODES, default=None,
+                        help='Run yt-dlp in the downloader threads or in child processes, '
+                             'overrides "execution_mode" from the configuration')
+    parser.add_argument('--headless', action='store_true',
+                        help='No window, the queue is fed through a local HTTP API instead')
+    parser.add_argument('--host', default=None,
+                        help='Address of the HTTP API in headless mode, default: 127.0.0.1')
+    parser.add_argument('--port', type=int, default=None,
+                        help='Port of the HTTP API in headless mode, overrides "headless_api_port" from the configuration')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Print the time until the window is shown and until the program is ready')
+
+    commandline_args: Namespace = parser.parse_args()
+
+    if commandline_args.headless:
+        # not needed by the window
+        from headless_api import run_headless
+        run_headless(commandline_args)
+        return
+
+    root = TkinterDnD.Tk()
+    dl_gui = YtDlGUI(root, commandline_args)
+
+    # root.protocol("WM_DELETE_WINDOW", dl_gui.on_closing())
+    root.mainloop()
+
+
+if __name__ == '__main__':
+    main()